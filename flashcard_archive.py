@@ -0,0 +1,364 @@
+"""
+Portable deck archives: courses together with the images their cards
+show, in one zip file that can be imported on another machine.
+
+    manifest.json       format, version, and each course's name, member and card count
+    courses/<n>.jsonl   one card per line; image paths are archive member names
+    images/<n><ext>     each distinct image file once
+
+Exporting streams cards a batch at a time and copies images through a
+bounded read-ahead window, so memory stays flat however large the
+courses and their images are. Importing adds the images to the deck's
+AssetStore and the cards with BulkImporter.
+"""
+import io
+import json
+import os
+import shutil
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from flashcard_assets import asset_extension
+from flashcard_import import MAX_REPORTED_ERRORS, BulkImporter, format_errors
+
+ARCHIVE_FORMAT = "flashcards-archive"
+ARCHIVE_VERSION = 1
+ARCHIVE_EXTENSION = ".fcz"
+# Cards written to the archive per step.
+EXPORT_STEP_CARDS = 1000
+# Threads reading image files ahead of the archive writer.
+EXPORT_READ_WORKERS = 4
+# Image bytes read ahead of the writer at most.
+EXPORT_READ_AHEAD_BYTES = 64 * 1024 * 1024
+# Larger images are copied in chunks by the writer rather than read ahead whole.
+EXPORT_BUFFERED_FILE_BYTES = 8 * 1024 * 1024
+COPY_CHUNK_BYTES = 1024 * 1024
+# Already compressed; deflating them again only costs time.
+COMPRESSED_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class ArchiveExporter:
+    """
+    Writes courses of a DeckEngine to an archive at path.
+
+    Like BulkImporter, steps() does a bounded amount of work per step so
+    the Tk loop can drive it with after(), and run() drives it to the end.
+    The archive is written to a temporary file and only moved into place
+    once complete, so a cancelled or failed export leaves nothing behind.
+    Images that can't be read are left out, and reported in errors.
+    """
+
+    def __init__(self, engine, courses, path, workers=EXPORT_READ_WORKERS):
+        self.engine = engine
+        self.courses = list(courses)
+        self.path = path
+        self.workers = workers
+        self.cards = 0
+        self.images = 0
+        self.image_bytes = 0
+        self.image_bytes_written = 0
+        # (image path, message) for the first MAX_REPORTED_ERRORS unreadable images.
+        self.errors = []
+        self.missing_images = 0
+        self.cancelled = False
+        self.finished = False
+        # Image reference -> archive member name, or None if it can't be read.
+        self._members = {}
+        # (reference, path, member, size) for each image to copy, in member order.
+        self._images = []
+
+    @property
+    def fraction(self):
+        return self.image_bytes_written / self.image_bytes if self.image_bytes else 0.0
+
+    def cancel(self):
+        self.cancelled = True
+
+    def status(self):
+        if self.image_bytes_written or self.images:
+            return f"{self.images} of {len(self._images)} images written"
+        return f"{self.cards} cards written"
+
+    def summary(self):
+        summary = f"Exported {self.cards} cards and {self.images} images to {self.path}."
+        if self.missing_images:
+            summary += f"\n{self.missing_images} images could not be read and were left out."
+        return summary + format_errors(self.errors, self.missing_images)
+
+    def run(self):
+        for _ in self.steps():
+            pass
+        return self
+
+    def steps(self):
+        tmp_path = self.path + ".tmp"
+        zf = zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED)
+        complete = False
+        try:
+            manifest_courses = []
+            for n, course in enumerate(self.courses):
+                member = f"courses/{n:04d}.jsonl"
+                count = 0
+                with zf.open(member, "w", force_zip64=True) as out:
+                    lines = []
+                    for card in self.engine.courses[course]:
+                        lines.append(self._card_line(card))
+                        if len(lines) >= EXPORT_STEP_CARDS:
+                            out.write("".join(lines).encode("utf-8"))
+                            count += len(lines)
+                            self.cards += len(lines)
+                            lines = []
+                            yield
+                            if self.cancelled:
+                                return
+                    out.write("".join(lines).encode("utf-8"))
+                    count += len(lines)
+                    self.cards += len(lines)
+                manifest_courses.append({"name": course, "member": member, "cards": count})
+                if course != self.engine.current_course:
+                    self.engine.store.release_course(course)
+
+            yield from self._write_images(zf)
+            if self.cancelled:
+                return
+
+            manifest = {
+                "format": ARCHIVE_FORMAT,
+                "version": ARCHIVE_VERSION,
+                "courses": manifest_courses,
+                "images": self.images,
+            }
+            zf.writestr("manifest.json", json.dumps(manifest, indent=4))
+            zf.close()
+            os.replace(tmp_path, self.path)
+            complete = True
+        finally:
+            if not complete:
+                zf.close()
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            self.finished = True
+
+    def _card_line(self, card):
+        data = card.to_dict()
+        data.pop("id", None)
+        data["question_imgs"] = self._image_members(data["question_imgs"])
+        data["answer_imgs"] = self._image_members(data["answer_imgs"])
+        return json.dumps(data, ensure_ascii=False) + "\n"
+
+    def _image_members(self, refs):
+        members = []
+        for ref in refs:
+            if ref not in self._members:
+                path = self.engine.assets.path(ref)
+                try:
+                    size = os.path.getsize(path)
+                except OSError as e:
+                    self._missing(ref, path, e)
+                    continue
+                member = f"images/{len(self._images):06d}{asset_extension(path)}"
+                self._members[ref] = member
+                self._images.append((ref, path, member, size))
+                self.image_bytes += size
+            member = self._members[ref]
+            if member is not None:
+                members.append(member)
+        return members
+
+    def _missing(self, ref, path, error):
+        self._members[ref] = None
+        self.missing_images += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((path, error.strerror or str(error)))
+
+    def _write_images(self, zf):
+        """Copy each image into the archive, yielding after each one, until cancelled."""
+        pending = iter(self._images)
+        ahead = deque()
+        buffered = 0
+        with ThreadPoolExecutor(self.workers) as pool:
+            try:
+                while True:
+                    # Keep the workers reading while the writer catches up.
+                    while buffered < EXPORT_READ_AHEAD_BYTES or not ahead:
+                        image = next(pending, None)
+                        if image is None:
+                            break
+                        size = image[3]
+                        if size <= EXPORT_BUFFERED_FILE_BYTES:
+                            ahead.append((image, pool.submit(read_file, image[1])))
+                            buffered += size
+                        else:
+                            ahead.append((image, None))
+                    if not ahead:
+                        return
+                    (ref, path, member, size), future = ahead.popleft()
+                    if future is not None:
+                        buffered -= size
+                    self._write_image(zf, ref, path, member, size, future)
+                    yield
+                    if self.cancelled:
+                        return
+            finally:
+                for _, future in ahead:
+                    if future is not None:
+                        future.cancel()
+
+    def _write_image(self, zf, ref, path, member, size, future):
+        info = zipfile.ZipInfo(member)
+        info.compress_type = zipfile.ZIP_STORED
+        if not member.endswith(COMPRESSED_IMAGE_EXTENSIONS):
+            info.compress_type = zipfile.ZIP_DEFLATED
+        info.file_size = size
+        try:
+            if future is not None:
+                data = future.result()
+                with zf.open(info, "w") as out:
+                    out.write(data)
+            else:
+                with open(path, "rb") as f, zf.open(info, "w") as out:
+                    shutil.copyfileobj(f, out, COPY_CHUNK_BYTES)
+        except OSError as e:
+            # Cards already name the member; importing treats it as missing.
+            self._missing(ref, path, e)
+        else:
+            self.images += 1
+        self.image_bytes_written += size
+
+
+def read_manifest(zf):
+    """The archive's manifest. Raises ValueError if zf isn't a deck archive."""
+    try:
+        manifest = json.loads(zf.read("manifest.json"))
+    except KeyError:
+        raise ValueError("Not a flashcard archive (no manifest.json)")
+    if manifest.get("format") != ARCHIVE_FORMAT:
+        raise ValueError("Not a flashcard archive")
+    if manifest.get("version", 0) > ARCHIVE_VERSION:
+        raise ValueError(f"Archive version {manifest['version']} is newer than this app supports")
+    return manifest
+
+
+class ArchiveCourseSource:
+    """
+    One course's cards in an open archive, as a source for BulkImporter.
+    Image member names are replaced by the asset references they were
+    stored under; images missing from the archive are dropped from their
+    cards.
+    """
+
+    def __init__(self, zf, member, image_refs):
+        self.zf = zf
+        self.member = member
+        self.image_refs = image_refs
+        self.base_dir = ""
+        self.fraction = 0.0
+
+    def __iter__(self):
+        with self.zf.open(self.member) as f:
+            for n, line in enumerate(io.TextIOWrapper(f, encoding="utf-8"), 1):
+                location = f"{self.member}: line {n}"
+                try:
+                    fields = json.loads(line)
+                except ValueError as e:
+                    yield location, f"invalid JSON: {e}"
+                    continue
+                for key in ("question_imgs", "answer_imgs"):
+                    fields[key] = [self.image_refs[m] for m in fields.get(key) or () if m in self.image_refs]
+                yield location, fields
+
+
+class ArchiveImporter:
+    """
+    Restores an archive written by ArchiveExporter into a DeckEngine:
+    images are added to the engine's AssetStore (so an image imported
+    twice is stored once), then each course's cards are added with a
+    BulkImporter, skipping cards the course already has.
+    Drive it with steps() or run(), like the other bulk operations.
+    """
+
+    def __init__(self, engine, path, thumbnail_store=None):
+        self.engine = engine
+        self.path = path
+        self.thumbnail_store = thumbnail_store
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+        self.courses = 0
+        self.images = 0
+        self.image_bytes = 0
+        self.image_bytes_read = 0
+        self.cancelled = False
+        self.finished = False
+        self._importer = None
+        self._course_count = 0
+
+    @property
+    def fraction(self):
+        if self._importer is None:
+            return self.image_bytes_read / self.image_bytes if self.image_bytes else 0.0
+        return (self.courses + self._importer.fraction) / self._course_count
+
+    def cancel(self):
+        self.cancelled = True
+        if self._importer is not None:
+            self._importer.cancel()
+
+    def status(self):
+        if self._importer is None:
+            return f"{self.images} images extracted"
+        return f"Course {self.courses + 1} of {self._course_count}: {self._importer.status()}"
+
+    def summary(self):
+        summary = (f"Imported {self.imported} cards into {self.courses} courses.\n"
+                   f"Skipped {self.duplicates} duplicates and {self.invalid} invalid cards.")
+        return summary + format_errors(self.errors, self.invalid)
+
+    def run(self):
+        for _ in self.steps():
+            pass
+        return self
+
+    def steps(self):
+        try:
+            try:
+                zf = zipfile.ZipFile(self.path)
+            except zipfile.BadZipFile as e:
+                raise ValueError(f"Not a flashcard archive ({e})") from e
+            with zf:
+                manifest = read_manifest(zf)
+                image_refs = {}
+                images = [info for info in zf.infolist() if info.filename.startswith("images/")]
+                self.image_bytes = sum(info.file_size for info in images)
+                for info in images:
+                    with zf.open(info) as f:
+                        image_refs[info.filename] = self.engine.assets.ingest_file(f, asset_extension(info.filename))
+                    self.images += 1
+                    self.image_bytes_read += info.file_size
+                    yield
+                    if self.cancelled:
+                        return
+
+                self._course_count = len(manifest["courses"])
+                for course in manifest["courses"]:
+                    source = ArchiveCourseSource(zf, course["member"], image_refs)
+                    self._importer = BulkImporter(self.engine, course["name"], source, self.thumbnail_store)
+                    yield from self._importer.steps()
+                    self.imported += self._importer.imported
+                    self.duplicates += self._importer.duplicates
+                    self.invalid += self._importer.invalid
+                    self.errors.extend(self._importer.errors[:MAX_REPORTED_ERRORS - len(self.errors)])
+                    if self.cancelled:
+                        return
+                    self.courses += 1
+        finally:
+            self.finished = True
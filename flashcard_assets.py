@@ -0,0 +1,121 @@
+import hashlib
+import os
+import threading
+
+# Images are kept in <deck name>.assets/ next to the deck.
+ASSET_DIR_SUFFIX = ".assets"
+# Cards name stored images "asset:<content hash><ext>"; anything else in
+# question_imgs/answer_imgs is a plain file path from before the store.
+ASSET_PREFIX = "asset:"
+DIGEST_SIZE = 16
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+def is_asset_ref(ref):
+    return ref.startswith(ASSET_PREFIX)
+
+
+def asset_extension(path):
+    """path's extension, lowercased, or "" if it isn't a plain one."""
+    ext = os.path.splitext(path)[1].lower()
+    return ext if ext[1:].isalnum() else ""
+
+
+class AssetStore:
+    """
+    Content-addressed image files: each distinct file is stored once,
+    named by a hash of its contents, however many cards show it. Cards
+    refer to them as "asset:<hash><ext>".
+
+    Assets never change once stored, so whether one exists is answered
+    from an in-memory index (read from the directory on first use)
+    instead of the filesystem, and caches can key them by name alone.
+    Plain paths on cards saved before the store existed still work
+    everywhere a reference is taken.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        # Asset name ("<hash><ext>") of every stored file; None until first use.
+        self._names = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_deck(cls, deck_path):
+        return cls(os.path.splitext(deck_path)[0] + ASSET_DIR_SUFFIX)
+
+    def path(self, ref):
+        """The file behind a reference."""
+        if not is_asset_ref(ref):
+            return ref
+        name = ref[len(ASSET_PREFIX):]
+        return os.path.join(self.directory, name[:2], name)
+
+    def digest(self, ref):
+        """The content hash in an asset reference, or None for a plain path."""
+        if not is_asset_ref(ref):
+            return None
+        return ref[len(ASSET_PREFIX):len(ASSET_PREFIX) + 2 * DIGEST_SIZE]
+
+    def exists(self, ref):
+        if not is_asset_ref(ref):
+            return os.path.exists(ref)
+        return ref[len(ASSET_PREFIX):] in self._index()
+
+    def __len__(self):
+        return len(self._index())
+
+    def ingest(self, path):
+        """
+        Store a copy of the file at path (if an identical one isn't stored
+        already) and return its reference. References are returned as is.
+        Raises OSError if path can't be read.
+        """
+        if is_asset_ref(path):
+            return path
+        with open(path, "rb") as f:
+            return self.ingest_file(f, asset_extension(path))
+
+    def ingest_file(self, f, ext=""):
+        """Like ingest(), for the contents of a file object opened for binary reading."""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, f".ingest-{os.getpid()}-{threading.get_ident()}.tmp")
+        digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        try:
+            with open(tmp_path, "wb") as out:
+                while True:
+                    chunk = f.read(COPY_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+            name = digest.hexdigest() + ext
+            ref = ASSET_PREFIX + name
+            names = self._index()
+            if name in names:
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.join(self.directory, name[:2]), exist_ok=True)
+                os.replace(tmp_path, self.path(ref))
+                with self._lock:
+                    names.add(name)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return ref
+
+    def _index(self):
+        with self._lock:
+            if self._names is None:
+                names = set()
+                try:
+                    with os.scandir(self.directory) as subdirs:
+                        for subdir in subdirs:
+                            if subdir.is_dir():
+                                with os.scandir(subdir.path) as files:
+                                    names.update(entry.name for entry in files if not entry.name.startswith("."))
+                except FileNotFoundError:
+                    pass
+                self._names = names
+            return self._names
@@ -0,0 +1,421 @@
+"""
+Benchmarks for deck loading, saving, card selection and image rendering,
+run against a generated synthetic deck. Needs no display: everything
+goes through DeckEngine and the image pipeline, and the PhotoImage step
+is only timed when Tk can open a window (e.g. under xvfb-run).
+
+    python flashcard_bench.py --courses 20 --cards 2000 --images 1 -o results.json
+    python flashcard_bench.py -o new.json --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from PIL import Image
+from PIL.Image import Resampling
+
+from flashcard_engine import DeckEngine, SHUFFLE_MODE
+from flashcard_history import ReviewHistory
+from flashcard_images import ImageCache, ThumbnailStore, PREVIEW_IMAGE_SIZE, STUDY_IMAGE_SIZE, load_thumbnail
+from flashcard_storage import STORES
+
+# A change larger than this (as a fraction) is flagged by --compare.
+REGRESSION_THRESHOLD = 0.10
+
+
+# ================================================================
+# Synthetic decks
+# ================================================================
+def random_text(rng, length):
+    words = []
+    while sum(len(w) + 1 for w in words) < length:
+        words.append("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 10))))
+    return " ".join(words)[:length]
+
+
+def generate_image(rng, path, size):
+    """Write a noisy gradient JPEG, so it doesn't compress to almost nothing."""
+    gradient = Image.linear_gradient("L").resize(size)
+    noise = Image.effect_noise(size, rng.randint(20, 80))
+    img = Image.merge("RGB", (gradient, noise, gradient.rotate(90, expand=False)))
+    img.save(path, quality=90)
+
+
+def generate_deck(directory, courses=5, cards_per_course=1000, text_length=80,
+                  images_per_card=0, image_size=(1600, 1200), distinct_images=20, seed=0):
+    """
+    Write flashcards.json (and images/) under directory and return its path.
+    Cards reuse a pool of distinct_images generated images, like real decks
+    that attach the same diagrams to many cards.
+    """
+    rng = random.Random(seed)
+    image_paths = []
+    if images_per_card:
+        image_dir = os.path.join(directory, "images")
+        os.makedirs(image_dir, exist_ok=True)
+        for i in range(distinct_images):
+            path = os.path.join(image_dir, f"image_{i:04d}.jpg")
+            generate_image(rng, path, image_size)
+            image_paths.append(path)
+
+    deck = {}
+    for c in range(courses):
+        deck[f"Course {c + 1}"] = [
+            {
+                "question": random_text(rng, text_length),
+                "answer": random_text(rng, text_length * 2),
+                "question_imgs": [rng.choice(image_paths) for _ in range(images_per_card)],
+                "answer_imgs": [rng.choice(image_paths) for _ in range(images_per_card)],
+            }
+            for _ in range(cards_per_course)
+        ]
+    path = os.path.join(directory, "flashcards.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(deck, f, indent=4)
+    return path
+
+
+# ================================================================
+# Timing
+# ================================================================
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "n": len(samples),
+        "min": samples[0],
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "max": samples[-1],
+    }
+
+
+def measure(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def cold_load_seconds(deck_path, backend):
+    """Time DeckEngine construction in a fresh interpreter (no warm module state)."""
+    code = (
+        "import sys, time; sys.path.insert(0, sys.argv[3]);"
+        "from flashcard_engine import DeckEngine;"
+        "start = time.perf_counter(); e = DeckEngine(sys.argv[1], sys.argv[2]);"
+        "[len(e.courses[c]) for c in e.courses];"
+        "print(time.perf_counter() - start); e.close()"
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.check_output([sys.executable, "-c", code, deck_path, backend, here])
+    return float(output)
+
+
+def full_decode_thumbnail(path, size):
+    """How images were shrunk before load_thumbnail() decoded at reduced scale, for comparison."""
+    img = Image.open(path)
+    img.thumbnail(size, Resampling.LANCZOS)
+    return img
+
+
+def resident_memory():
+    """(current, peak) resident memory of this process in bytes, from /proc (Linux only)."""
+    with open("/proc/self/status", encoding="ascii") as f:
+        fields = dict(line.split(":", 1) for line in f)
+    return int(fields["VmRSS"].split()[0]) * 1024, int(fields["VmHWM"].split()[0]) * 1024
+
+
+def reset_peak_memory():
+    """Reset the peak resident memory to the current one, which is returned."""
+    # A forked process starts with its parent's peak; this starts it over.
+    with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+        f.write("5")
+    return resident_memory()[0]
+
+
+def decode_peak_rss(paths, size, loader):
+    """
+    How far (in bytes) shrinking every image in paths to size with loader
+    ("load_thumbnail" or "full_decode_thumbnail") raises the peak resident
+    memory of a fresh interpreter, or None where that can't be measured.
+    """
+    if not os.path.exists("/proc/self/clear_refs"):
+        return None
+    code = (
+        "import sys, json; sys.path.insert(0, sys.argv[1]);"
+        "import flashcard_bench, flashcard_images;"
+        "loader = getattr(flashcard_images, sys.argv[2], None) or getattr(flashcard_bench, sys.argv[2]);"
+        "size = tuple(json.loads(sys.argv[3])); paths = json.loads(sys.argv[4]);"
+        "before = flashcard_bench.reset_peak_memory();"
+        "[loader(p, size) for p in paths];"
+        "print(flashcard_bench.resident_memory()[1] - before)"
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.check_output([sys.executable, "-c", code, here, loader, json.dumps(size), json.dumps(paths)])
+    return int(output)
+
+
+# ================================================================
+# Benchmarks
+# ================================================================
+def bench_storage(deck_path, backend, repeat):
+    results = {}
+    results["load_cold"] = summarize([cold_load_seconds(deck_path, backend) for _ in range(repeat)])
+
+    def warm_load():
+        engine = DeckEngine(deck_path, backend)
+        for course in engine.courses:
+            len(engine.courses[course])
+        engine.close()
+    warm_load()
+    results["load_warm"] = measure(warm_load, repeat)
+
+    engine = DeckEngine(deck_path, backend, save_delay=0)
+    course = engine.course_names()[0]
+    card = {"question": "benchmark", "answer": "card", "question_imgs": [], "answer_imgs": []}
+
+    def save_one_card():
+        engine.add_card(course, card)
+        engine.flush()
+    results["save_single_card"] = measure(save_one_card, repeat)
+    engine.close()
+    return results
+
+
+def bench_selection(deck_path, backend, repeat):
+    results = {}
+    engine = DeckEngine(deck_path, backend, save_delay=60)
+    course = max(engine.course_names(), key=lambda name: len(engine.courses[name]))
+    engine.set_current_course(course)
+    deck_size = len(engine.current_cards())
+
+    def shuffle_pass():
+        engine.restart_study()
+        for _ in range(deck_size):
+            engine.next_card(SHUFFLE_MODE)
+    results["shuffle_full_pass"] = measure(shuffle_pass, repeat)
+    results["shuffle_full_pass"]["cards"] = deck_size
+
+    def review_queue_build():
+        engine.review_queues.clear()
+        engine.get_review_queue(course)
+    results["review_queue_build"] = measure(review_queue_build, repeat)
+
+    # Peek + reschedule only; grading also persists, which bench_storage covers.
+    queue = engine.get_review_queue(course)
+    now = time.time()
+
+    def review_selection():
+        for i in range(1000):
+            index, _ = queue.peek()
+            queue.reschedule(index, now + i)
+    results["review_select_1000"] = measure(review_selection, repeat)
+
+    def show_answer():
+        for _ in range(1000):
+            engine.next_card(SHUFFLE_MODE)
+            card = engine.current_card()
+            card.get("answer"), card.get("answer_imgs", [])
+    results["next_card_and_answer_1000"] = measure(show_answer, repeat)
+    engine.close()
+    return results
+
+
+def bench_images(deck_path, repeat):
+    with open(deck_path, "r", encoding="utf-8") as f:
+        deck = json.load(f)
+    paths = sorted({p for cards in deck.values() for card in cards for p in card["question_imgs"]})
+    if not paths:
+        return {}
+    results = {}
+    for label, size in (("", STUDY_IMAGE_SIZE), ("_preview", PREVIEW_IMAGE_SIZE)):
+        for name, loader in (("decode_resize", load_thumbnail), ("full_decode_resize", full_decode_thumbnail)):
+            result = measure(lambda: [loader(p, size) for p in paths], repeat)
+            result["images"] = len(paths)
+            result["peak_rss_bytes"] = decode_peak_rss(paths, size, loader.__name__)
+            results[name + label] = result
+
+    with tempfile.TemporaryDirectory() as thumb_dir:
+        thumbs = ThumbnailStore(thumb_dir)
+        for p in paths:
+            thumbs.get(p, STUDY_IMAGE_SIZE)
+        results["thumbnail_store_hit"] = measure(lambda: [thumbs.get(p, STUDY_IMAGE_SIZE) for p in paths], repeat)
+
+    cache = ImageCache()
+    for p in paths:
+        cache.get(p, STUDY_IMAGE_SIZE)
+    results["memory_cache_hit"] = measure(lambda: [cache.get(p, STUDY_IMAGE_SIZE) for p in paths], repeat)
+
+    # PhotoImage conversion needs a Tk interpreter, i.e. a (virtual) display.
+    try:
+        import tkinter as tk
+        from PIL import ImageTk
+        root = tk.Tk()
+        root.withdraw()
+    except Exception:
+        return results
+    images = [cache.get(p, STUDY_IMAGE_SIZE) for p in paths]
+    results["photoimage_convert"] = measure(lambda: [ImageTk.PhotoImage(img) for img in images], repeat)
+    root.destroy()
+    return results
+
+
+def bench_history(directory, reviews, repeat, courses=20, cards_per_course=5000):
+    """Review history: logging reviews, reopening after a long history, and reading the totals."""
+    rng = random.Random(0)
+    history_dir = os.path.join(directory, "bench.history")
+    card_ids = [2 ** 32 + i for i in range(cards_per_course)]
+    names = [f"Course {c + 1}" for c in range(courses)]
+    results = {}
+
+    history = ReviewHistory(history_dir)
+    now = time.time() - reviews * 5
+    start = time.perf_counter()
+    for i in range(reviews):
+        history.record(names[i % courses], rng.choice(card_ids), rng.choice((-1, 1, 3, 4, 5)), rng.random() * 10,
+                       now + i * 5)
+    history.close()
+    results["record_reviews"] = summarize([time.perf_counter() - start])
+    results["record_reviews"]["reviews"] = reviews
+
+    results["open"] = measure(lambda: ReviewHistory(history_dir).close(), repeat)
+
+    history = ReviewHistory(history_dir)
+
+    def course_totals():
+        for name in names:
+            history.course_stats(name)
+    results["course_totals"] = measure(course_totals, repeat)
+    results["hardest_cards"] = measure(lambda: history.hardest_cards(names[0], 20), repeat)
+    history.close()
+    return results
+
+
+def bench_memory(deck_path, backend):
+    """Bytes held by the loaded deck, next to the same deck as plain JSON dicts."""
+    def traced_size(load):
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            held = load()
+            size = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+        del held
+        return size
+
+    def load_engine():
+        engine = DeckEngine(deck_path, backend, save_delay=60)
+        for course in engine.courses:
+            engine.courses[course]
+        return engine
+
+    def load_dicts():
+        with open(deck_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    with open(deck_path, "r", encoding="utf-8") as f:
+        card_count = sum(len(cards) for cards in json.load(f).values())
+    engine_bytes = traced_size(load_engine)
+    dict_bytes = traced_size(load_dicts)
+    return {
+        "cards": card_count,
+        "deck_bytes": engine_bytes,
+        "json_dicts_bytes": dict_bytes,
+        "bytes_per_card": engine_bytes / card_count if card_count else 0,
+    }
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as directory:
+        deck_path = generate_deck(
+            directory, args.courses, args.cards, args.text_length, args.images,
+            (args.image_width, args.image_height), seed=args.seed,
+        )
+        results = {}
+        for name, result in bench_storage(deck_path, args.backend, args.repeat).items():
+            results[f"storage.{name}"] = result
+        for name, result in bench_selection(deck_path, args.backend, args.repeat).items():
+            results[f"selection.{name}"] = result
+        for name, result in bench_images(deck_path, args.repeat).items():
+            results[f"images.{name}"] = result
+        if args.reviews:
+            for name, result in bench_history(directory, args.reviews, args.repeat).items():
+                results[f"history.{name}"] = result
+        memory = bench_memory(deck_path, args.backend)
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": vars(args),
+        },
+        "results": results,
+        "memory": memory,
+    }
+
+
+def compare(current, baseline):
+    """Print the change in median time for every benchmark both runs have."""
+    print(f"{'benchmark':40} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        change = result["median"] / old["median"] - 1 if old["median"] else 0.0
+        flag = "  REGRESSION" if change > REGRESSION_THRESHOLD else ""
+        print(f"{name:40} {old['median'] * 1000:9.2f}ms {result['median'] * 1000:9.2f}ms {change:+8.1%}{flag}")
+    old_bytes = baseline.get("memory", {}).get("deck_bytes")
+    if old_bytes:
+        new_bytes = current["memory"]["deck_bytes"]
+        print(f"{'memory.deck_bytes':40} {old_bytes / 2**20:8.1f}MB {new_bytes / 2**20:8.1f}MB {new_bytes / old_bytes - 1:+8.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the flashcard app on a synthetic deck.")
+    parser.add_argument("--courses", type=int, default=5)
+    parser.add_argument("--cards", type=int, default=2000, help="cards per course")
+    parser.add_argument("--text-length", type=int, default=80, help="characters per question")
+    parser.add_argument("--images", type=int, default=1, help="images per card side")
+    parser.add_argument("--image-width", type=int, default=1600)
+    parser.add_argument("--image-height", type=int, default=1200)
+    parser.add_argument("--backend", default="json", choices=sorted(STORES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--reviews", type=int, default=200000, help="reviews logged by the history benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+    else:
+        for name, result in report["results"].items():
+            line = f"{name:40} median {result['median'] * 1000:9.2f}ms  p95 {result['p95'] * 1000:9.2f}ms"
+            if result.get("peak_rss_bytes") is not None:
+                line += f"  peak RSS +{result['peak_rss_bytes'] / 2**20:.1f}MB"
+            print(line)
+        memory = report["memory"]
+        print(f"{'memory.deck_bytes':40} {memory['deck_bytes'] / 2**20:.1f}MB"
+              f" ({memory['bytes_per_card']:.0f} per card; {memory['json_dicts_bytes'] / 2**20:.1f}MB as JSON dicts)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+import random
+import sys
+from collections.abc import Mapping
+
+# Shared by every card side without images.
+NO_IMAGES = ()
+# A course's slots are compacted once deleted cards outnumber live ones
+# and there are at least this many of them.
+COMPACT_MIN_TOMBSTONES = 64
+# New card ids are drawn from [2**32, 2**63): far above the ids given to
+# cards saved before ids existed, and small enough for a SQLite row id.
+CARD_ID_MIN = 2 ** 32
+CARD_ID_MAX = 2 ** 63 - 1
+
+_id_random = random.Random()
+
+def pack_image_paths(paths):
+    """
+    Store image paths as a flat (directory, file name, ...) tuple. The
+    directory strings are interned, so every card whose images live in
+    the same folder shares one copy of it instead of holding its own
+    copy of the full path.
+    """
+    if not paths:
+        return NO_IMAGES
+    if len(paths) == 1:
+        return _split_path(paths[0])
+    packed = ()
+    for path in paths:
+        packed += _split_path(path)
+    return packed
+
+
+def _split_path(path):
+    cut = max(path.rfind("/"), path.rfind("\\")) + 1
+    return sys.intern(path[:cut]), path[cut:]
+
+
+def unpack_image_paths(packed):
+    if not packed:
+        return NO_IMAGES
+    return tuple(_unpack_list(packed))
+
+
+def _unpack_list(packed):
+    return [directory + name for directory, name in zip(packed[::2], packed[1::2])]
+
+
+class Card(Mapping):
+    """
+    One flashcard in memory, with slots instead of a per-card dict.
+    `id` identifies the card within its course for good; it is None only
+    until a store adds the card.
+
+    Reads like the card dicts in flashcards.json (card["question"],
+    card.get("review"), dict(card)), so code that only reads cards
+    doesn't care which it gets. Cards are never changed in place: stores
+    replace them (see with_review()), which also means a snapshot of a
+    course only has to copy the list. Keys other than the known fields
+    are kept in `extra` and written back unchanged.
+    """
+
+    __slots__ = ("id", "question", "answer", "_question_imgs", "_answer_imgs", "review", "extra")
+
+    def __init__(self, question="", answer="", question_imgs=NO_IMAGES, answer_imgs=NO_IMAGES,
+                 review=None, extra=None, id=None):
+        self.id = id
+        self.question = question
+        self.answer = answer
+        self._question_imgs = pack_image_paths(question_imgs)
+        self._answer_imgs = pack_image_paths(answer_imgs)
+        self.review = review
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.__class__ is Card:
+            return data
+        get = data.get
+        review = get("review")
+        extra = None
+        if data.keys() - _GETTERS.keys():
+            extra = {key: value for key, value in data.items() if key not in _GETTERS}
+        return cls(
+            get("question", ""),
+            get("answer", ""),
+            get("question_imgs"),
+            get("answer_imgs"),
+            dict(review) if review is not None else None,
+            extra,
+            get("id"),
+        )
+
+    @property
+    def question_imgs(self):
+        return unpack_image_paths(self._question_imgs)
+
+    @property
+    def answer_imgs(self):
+        return unpack_image_paths(self._answer_imgs)
+
+    def with_review(self, review):
+        """A copy of this card with a new spaced-repetition state."""
+        card = self._copy()
+        card.review = review
+        return card
+
+    def with_id(self, card_id):
+        card = self._copy()
+        card.id = card_id
+        return card
+
+    def _copy(self):
+        card = Card.__new__(Card)
+        card.id = self.id
+        card.question = self.question
+        card.answer = self.answer
+        card._question_imgs = self._question_imgs
+        card._answer_imgs = self._answer_imgs
+        card.review = self.review
+        card.extra = self.extra
+        return card
+
+    def to_dict(self):
+        """The card as it is stored in flashcards.json."""
+        data = {} if self.id is None else {"id": self.id}
+        data.update({
+            "question": self.question,
+            "answer": self.answer,
+            "question_imgs": _unpack_list(self._question_imgs),
+            "answer_imgs": _unpack_list(self._answer_imgs),
+        })
+        if self.review is not None:
+            data["review"] = self.review
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __getitem__(self, key):
+        getter = _GETTERS.get(key)
+        if getter is not None:
+            value = getter(self)
+            if value is not None:
+                return value
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        getter = _GETTERS.get(key)
+        if getter is not None:
+            value = getter(self)
+            return default if value is None else value
+        if self.extra:
+            return self.extra.get(key, default)
+        return default
+
+    def __iter__(self):
+        if self.id is not None:
+            yield "id"
+        yield "question"
+        yield "answer"
+        yield "question_imgs"
+        yield "answer_imgs"
+        if self.review is not None:
+            yield "review"
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return 4 + (self.id is not None) + (self.review is not None) + len(self.extra or ())
+
+    def __repr__(self):
+        return f"Card({self.to_dict()!r})"
+
+
+_GETTERS = {
+    "id": lambda card: card.id,
+    "question": lambda card: card.question,
+    "answer": lambda card: card.answer,
+    "question_imgs": lambda card: unpack_image_paths(card._question_imgs),
+    "answer_imgs": lambda card: unpack_image_paths(card._answer_imgs),
+    "review": lambda card: card.review,
+}
+
+
+class CourseCards:
+    """
+    The cards of one course, in order, addressed by card id.
+
+    Cards sit in a list of slots with an id -> slot map. Deleting a card
+    leaves a tombstone (None) in its slot, so no other card moves and
+    the delete is O(1); the slots are compacted once tombstones make up
+    most of the list. Iterating yields the live cards in order, and len()
+    counts only live cards.
+    """
+
+    __slots__ = ("_slots", "_slot_of", "_tombstones")
+
+    def __init__(self, cards=()):
+        self._slots = list(cards)
+        self._slot_of = {card.id: slot for slot, card in enumerate(self._slots)}
+        self._tombstones = 0
+
+    @classmethod
+    def from_json(cls, cards):
+        """
+        Cards from a parsed JSON list. Cards saved before ids existed get
+        their 1-based position, so the ids come out the same every time
+        the same file is loaded (journals replayed onto it rely on that).
+        """
+        loaded = [Card.from_dict(card) for card in cards]
+        if any(card.id is None for card in loaded):
+            taken = {card.id for card in loaded}
+            for position, card in enumerate(loaded):
+                if card.id is None:
+                    card_id = position + 1
+                    while card_id in taken:
+                        card_id += len(loaded)
+                    taken.add(card_id)
+                    loaded[position] = card.with_id(card_id)
+        return cls(loaded)
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def __iter__(self):
+        for card in self._slots:
+            if card is not None:
+                yield card
+
+    def __contains__(self, card_id):
+        return card_id in self._slot_of
+
+    def __getitem__(self, card_id):
+        return self._slots[self._slot_of[card_id]]
+
+    def get(self, card_id, default=None):
+        slot = self._slot_of.get(card_id)
+        return default if slot is None else self._slots[slot]
+
+    def ids(self):
+        """Card ids in course order."""
+        return [card.id for card in self._slots if card is not None]
+
+    def id_at(self, position):
+        """The id of the card at a position among the live cards (O(n))."""
+        if position < 0:
+            position += len(self)
+        for card in self:
+            if position == 0:
+                return card.id
+            position -= 1
+        raise IndexError(position)
+
+    def new_id(self):
+        """A random id no card in this course has."""
+        while True:
+            card_id = _id_random.randint(CARD_ID_MIN, CARD_ID_MAX)
+            if card_id not in self._slot_of:
+                return card_id
+
+    def append(self, card):
+        if card.id in self._slot_of:
+            raise KeyError(f"Duplicate card id: {card.id!r}")
+        self._slot_of[card.id] = len(self._slots)
+        self._slots.append(card)
+
+    def replace(self, card):
+        """Put card in place of the card with the same id."""
+        self._slots[self._slot_of[card.id]] = card
+
+    def remove(self, card_id):
+        """Delete a card and return it."""
+        slot = self._slot_of.pop(card_id)
+        card = self._slots[slot]
+        self._slots[slot] = None
+        self._tombstones += 1
+        if self._tombstones >= COMPACT_MIN_TOMBSTONES and self._tombstones > len(self._slot_of):
+            self.compact()
+        return card
+
+    def compact(self):
+        """Drop the tombstones left by deleted cards."""
+        self._slots = [card for card in self._slots if card is not None]
+        self._slot_of = {card.id: slot for slot, card in enumerate(self._slots)}
+        self._tombstones = 0
+
+
+def cards_from_json(courses):
+    """Convert parsed JSON ({course: [card dict, ...]}) to CourseCards, in place."""
+    for name, cards in courses.items():
+        courses[name] = CourseCards.from_json(cards)
+    return courses
+
+
+def json_default(obj):
+    """json.dump(default=...) hook that writes Cards and CourseCards as plain JSON."""
+    if isinstance(obj, Card):
+        return obj.to_dict()
+    if isinstance(obj, CourseCards):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,643 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from flashcard_assets import AssetStore, is_asset_ref
+from flashcard_cards import CourseCards
+from flashcard_history import OUTCOME_SEEN, ReviewHistory
+from flashcard_metrics import metrics
+from flashcard_storage import STORES, BackgroundSaver, atomic_write_bytes, open_store
+from flashcard_scheduler import GRADES, ReviewQueue, ShuffleBag, card_due, schedule_review
+from flashcard_search import SearchIndex
+
+FLASHCARDS_FILE = "flashcards.json"
+# "json" rewrites the whole file in the background after each burst of
+# changes; "journal" appends each change to flashcards.json.journal and
+# folds it into the JSON file later; "sqlite" keeps cards in flashcards.db
+# (migrated from the JSON file on first run) and only loads the course
+# that is selected; "sharded" keeps one file per course under
+# flashcards.shards/ and only parses a course when selected.
+STORAGE_BACKEND = "journal"
+# Edits closer together than this (seconds) are written to disk together.
+SAVE_DELAY_SECONDS = 0.5
+# Progress through each course's shuffled pass is kept in
+# flashcards.study.json, written at most this often while studying.
+STUDY_STATE_SUFFIX = ".study.json"
+STUDY_STATE_SAVE_DELAY_SECONDS = 2.0
+
+SHUFFLE_MODE = "Shuffle"
+SPACED_REPETITION_MODE = "Spaced repetition"
+
+
+class DeckEngine:
+    """
+    Courses, cards, card selection and persistence, with no GUI.
+
+    FlashcardApp is a Tk view over one of these. It can also be driven
+    directly, e.g. by the command line below, for scripting and
+    benchmarks. Cards read like dicts with "question", "answer",
+    "question_imgs" and "answer_imgs" (plus "review" once studied with
+    spaced repetition), addressed by an "id" that stays the same for the
+    card's lifetime. Changes take plain dicts; the store keeps compact
+    Card objects in a CourseCards per course.
+    """
+
+    def __init__(self, path=FLASHCARDS_FILE, backend=STORAGE_BACKEND, save_delay=SAVE_DELAY_SECONDS):
+        self.store = open_store(path, backend, save_delay)
+        # { courseName: CourseCards of { "id":..., "question":..., "answer":..., "question_imgs":[], ...} }
+        with metrics.phase("storage.load"):
+            self.courses = self.store.load()
+        self.current_course = None
+        # The current card's id in self.courses[self.current_course].
+        self.current_card_id = None
+
+        # For random deck usage without repeats: { courseName: ShuffleBag },
+        # restored from the study state file when a course is first studied.
+        self.shuffle_bags = {}
+        self.study_state_path = os.path.splitext(path)[0] + STUDY_STATE_SUFFIX
+        self._saved_bags = self._read_study_state()
+        self._bags_lock = threading.RLock()
+        self._study_saver = BackgroundSaver(self._write_study_state, STUDY_STATE_SAVE_DELAY_SECONDS)
+
+        # For spaced repetition: { courseName: ReviewQueue }, built on first use
+        self.review_queues = {}
+        self.session_review_count = 0
+        # When next_card() finds nothing due, the time the next card is due.
+        self.next_due = None
+
+        # Full-text search, built by start_search_index()
+        self.search_index = None
+
+        # Images attached to cards, stored once each by content hash
+        self.assets = AssetStore.for_deck(path)
+
+        # Every card studied is logged to the review history when the
+        # learner moves on from it, with how long the answer took to be
+        # revealed and its grade (OUTCOME_SEEN if it wasn't graded).
+        self.history = ReviewHistory.for_deck(path)
+        # When the current card was shown (None once logged) and seconds until its answer was.
+        self._shown_at = None
+        self._reveal_seconds = None
+
+    # ================================================================
+    # Courses
+    # ================================================================
+    def course_names(self):
+        return list(self.courses.keys())
+
+    def add_course(self, name):
+        """Create a course. Returns False if it already exists."""
+        if name in self.courses:
+            return False
+        self.store.add_course(name)
+        return True
+
+    def set_current_course(self, course):
+        """Switch courses, letting the store drop the previous course's cards."""
+        if course not in self.courses:
+            course = None
+        self._log_current_card(OUTCOME_SEEN)
+        if self.current_course and self.current_course != course:
+            self.store.release_course(self.current_course)
+        self.current_course = course
+        self.current_card_id = None
+
+    def restart_study(self):
+        """Start the current course's shuffled pass over from the beginning."""
+        self._log_current_card(OUTCOME_SEEN)
+        if self.current_course:
+            with self._bags_lock:
+                self.shuffle_bags.pop(self.current_course, None)
+                self._saved_bags.pop(self.current_course, None)
+            self._study_saver.request()
+        self.current_card_id = None
+
+    @property
+    def deck_count(self):
+        """Cards in the current course's shuffled pass."""
+        bag = self._shuffle_bag(self.current_course)
+        return bag.total if bag is not None else 0
+
+    @property
+    def deck_seen(self):
+        """Cards shown so far in the current course's shuffled pass."""
+        bag = self._shuffle_bag(self.current_course)
+        return bag.seen if bag is not None else 0
+
+    def current_cards(self):
+        if self.current_course is None:
+            return CourseCards()
+        return self.courses[self.current_course]
+
+    def current_card(self):
+        """The card being studied, or None if there isn't a valid one."""
+        return self.current_cards().get(self.current_card_id)
+
+    # ================================================================
+    # Card selection
+    # ================================================================
+    def next_card(self, mode=SHUFFLE_MODE, now=None):
+        """
+        Move to the next card of the current course and return it.
+        Returns None if the course is empty or, in spaced repetition
+        mode, if no card is due yet (see self.next_due).
+        """
+        now = time.time() if now is None else now
+        self._log_current_card(OUTCOME_SEEN, now)
+        cards = self.current_cards()
+        self.current_card_id = None
+        if not cards:
+            return None
+        if mode == SPACED_REPETITION_MODE:
+            card = self._next_review_card(now)
+        else:
+            # Continue the course's shuffled pass, or start a new one
+            with self._bags_lock:
+                bag = self._shuffle_bag(self.current_course)
+                if not bag:
+                    bag = self.shuffle_bags[self.current_course] = ShuffleBag(cards.ids())
+                self.current_card_id = bag.draw()
+            self._study_saver.request()
+            card = cards[self.current_card_id]
+        if card is not None:
+            self._shown_at = now
+        return card
+
+    def upcoming_card_ids(self, count):
+        """Ids of the next few cards the shuffle bag will hand out, in order."""
+        bag = self._shuffle_bag(self.current_course)
+        return bag.peek(count) if bag else []
+
+    def _shuffle_bag(self, course):
+        """The course's current pass, if it has one (restoring a saved one on first use)."""
+        bag = self.shuffle_bags.get(course)
+        if bag is None and course in self._saved_bags:
+            with self._bags_lock:
+                bag = ShuffleBag.from_json(self._saved_bags.pop(course), self.courses[course])
+                self.shuffle_bags[course] = bag
+        return bag
+
+    def get_review_queue(self, course):
+        if course not in self.review_queues:
+            self.review_queues[course] = ReviewQueue(self.courses[course])
+        return self.review_queues[course]
+
+    def _next_review_card(self, now):
+        card_id, due = self.get_review_queue(self.current_course).peek()
+        if due > now:
+            self.next_due = due
+            return None
+        self.next_due = None
+        self.current_card_id = card_id
+        return self.courses[self.current_course][card_id]
+
+    def grade_current_card(self, quality, now=None):
+        """Reschedule the current card (SM-2 quality 0-5). Returns its new review state."""
+        card = self.current_card()
+        if card is None:
+            raise ValueError("No current card to grade")
+        now = time.time() if now is None else now
+        review = schedule_review(card.get("review"), quality, now)
+        self.store.set_review(self.current_course, self.current_card_id, review)
+        self.get_review_queue(self.current_course).reschedule(self.current_card_id, review["due"])
+        self.session_review_count += 1
+        self._log_current_card(quality, now)
+        return review
+
+    def reveal_answer(self, now=None):
+        """Note that the current card's answer was shown; the first time counts."""
+        if self._shown_at is not None and self._reveal_seconds is None:
+            self._reveal_seconds = max(0.0, (time.time() if now is None else now) - self._shown_at)
+
+    def _log_current_card(self, outcome, now=None):
+        """Log the card being studied to the review history, once."""
+        if self._shown_at is None:
+            return
+        if self.current_card_id is not None:
+            self.history.record(self.current_course, self.current_card_id, outcome, self._reveal_seconds, now)
+        self._shown_at = None
+        self._reveal_seconds = None
+
+    # ================================================================
+    # Changing cards
+    # ================================================================
+    def add_card(self, course, card):
+        """Add a card (a dict) to a course and return its id."""
+        card_id = self.store.add_card(course, card)
+        if course in self.review_queues:
+            # New cards are due immediately
+            self.review_queues[course].reschedule(card_id, 0)
+        with self._bags_lock:
+            bag = self._shuffle_bag(course)
+            if bag is not None:
+                bag.add(card_id)
+        self._study_saver.request()
+        return card_id
+
+    def add_cards(self, course, cards):
+        """Add a batch of cards (dicts) to a course in one store change. Returns their ids."""
+        card_ids = self.store.add_cards(course, cards)
+        if course in self.review_queues:
+            # Imported cards may bring their review state along
+            queue = self.review_queues[course]
+            for card_id, card in zip(card_ids, cards):
+                queue.reschedule(card_id, card_due(card))
+        with self._bags_lock:
+            bag = self._shuffle_bag(course)
+            if bag is not None:
+                for card_id in card_ids:
+                    bag.add(card_id)
+        self._study_saver.request()
+        return card_ids
+
+    def update_card(self, course, card_id, card):
+        # The card keeps its id, so its place in the shuffle bag and review queue stays valid.
+        self.store.update_card(course, card_id, card)
+
+    def update_cards(self, course, cards):
+        """Replace a batch of cards (dicts carrying their ids) in one store change."""
+        self.store.update_cards(course, cards)
+
+    def delete_card(self, course, card_id):
+        self.store.delete_card(course, card_id)
+        self.history.forget(course, card_id)
+        if course in self.review_queues:
+            self.review_queues[course].remove(card_id)
+        with self._bags_lock:
+            bag = self._shuffle_bag(course)
+            if bag is not None:
+                bag.remove(card_id)
+        self._study_saver.request()
+        if course == self.current_course and card_id == self.current_card_id:
+            self.current_card_id = None
+            self._shown_at = None
+
+    # ================================================================
+    # Search
+    # ================================================================
+    def start_search_index(self):
+        """
+        Create the search index and return a generator that builds it one
+        chunk per step, so a caller can interleave the work with a UI loop.
+        """
+        self.search_index = SearchIndex()
+        self.store.add_listener(self.search_index.apply_record)
+        return self.search_index.build_steps(self.courses)
+
+    def release_other_courses(self):
+        """Let the store drop every lazily loaded course except the current one."""
+        for course in list(self.courses):
+            if course != self.current_course:
+                self.store.release_course(course)
+
+    def open_search_hit(self, hit):
+        """Make a search hit the current card and return it."""
+        self.set_current_course(hit.course)
+        self.current_card_id = hit.card_id
+        self._shown_at = time.time()
+        return self.courses[hit.course][hit.card_id]
+
+    # ================================================================
+    # Persistence
+    # ================================================================
+    @property
+    def save_pending(self):
+        return self.store.save_pending
+
+    @property
+    def save_error(self):
+        return self.store.save_error or self.history.save_error
+
+    def save(self):
+        """Write the full library to disk."""
+        self.store.save()
+
+    def flush(self):
+        """Wait for pending background writes to finish."""
+        self.store.flush()
+        self._study_saver.flush()
+        self.history.flush()
+
+    def close(self):
+        self._log_current_card(OUTCOME_SEEN)
+        self._study_saver.close()
+        self.history.close()
+        self.store.close()
+
+    def _read_study_state(self):
+        try:
+            with open(self.study_state_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("shuffle_bags", {})
+        except (OSError, ValueError, AttributeError):
+            # Missing or damaged: every course just starts a fresh pass.
+            return {}
+
+    def _write_study_state(self):
+        """BackgroundSaver callback: save where each course's shuffled pass is up to."""
+        with self._bags_lock:
+            bags = dict(self._saved_bags)
+            bags.update((course, bag.to_json()) for course, bag in self.shuffle_bags.items())
+        state = {"shuffle_bags": bags}
+        atomic_write_bytes(self.study_state_path, json.dumps(state, separators=(",", ":")).encode("utf-8"))
+
+
+# ================================================================
+# Command line: drive study sessions without the GUI
+# ================================================================
+GRADE_NAMES = {text.lower(): quality for text, quality in GRADES}
+
+
+def import_cards(engine, args):
+    # Imported here so the other commands don't need Pillow.
+    from flashcard_images import ThumbnailStore
+    from flashcard_import import BulkImporter, open_source
+
+    thumbnail_store = ThumbnailStore(args.thumbnails, assets=engine.assets) if args.thumbnails else None
+    importer = BulkImporter(engine, args.course, open_source(args.source), thumbnail_store)
+    start = time.perf_counter()
+    importer.run()
+    engine.flush()
+    if thumbnail_store is not None:
+        thumbnail_store.flush()
+    elapsed = time.perf_counter() - start
+
+    for location, error in importer.errors:
+        print(f"{args.source}: {location}: {error}", file=sys.stderr)
+    print(f"Imported {importer.imported} cards in {elapsed:.3f}s"
+          f" ({importer.duplicates} duplicates skipped, {importer.invalid} invalid)")
+    if thumbnail_store is not None:
+        print(f"Rendered {importer.thumbnails_done} thumbnails ({importer.thumbnails_failed} failed)")
+    return 0 if not importer.invalid else 2
+
+
+def export_archive(engine, args):
+    from flashcard_archive import ArchiveExporter
+
+    courses = args.courses or engine.course_names()
+    for course in courses:
+        if course not in engine.courses:
+            print(f"No such course: {course}", file=sys.stderr)
+            return 1
+    start = time.perf_counter()
+    exporter = ArchiveExporter(engine, courses, args.archive).run()
+    elapsed = time.perf_counter() - start
+    print(exporter.summary())
+    print(f"{exporter.image_bytes / 2**20:.1f}MB of images in {elapsed:.3f}s")
+    return 0 if not exporter.missing_images else 2
+
+
+def import_archive(engine, args):
+    from flashcard_archive import ArchiveImporter
+
+    start = time.perf_counter()
+    try:
+        importer = ArchiveImporter(engine, args.archive).run()
+    except (OSError, ValueError) as e:
+        print(f"{args.archive}: {e}", file=sys.stderr)
+        return 1
+    engine.flush()
+    print(importer.summary())
+    print(f"Took {time.perf_counter() - start:.3f}s")
+    return 0
+
+
+def ingest_images(engine):
+    """Point every card that still names an image file by path at an asset instead."""
+    refs = {}
+    changed = missing = 0
+    for course in engine.course_names():
+        for card in list(engine.courses[course]):
+            updated = {}
+            for key in ("question_imgs", "answer_imgs"):
+                paths = card.get(key)
+                if all(is_asset_ref(path) for path in paths):
+                    continue
+                new_refs = []
+                for path in paths:
+                    if path not in refs:
+                        try:
+                            refs[path] = engine.assets.ingest(path)
+                        except OSError as e:
+                            print(f"{course}: {path}: {e.strerror}", file=sys.stderr)
+                            refs[path] = path
+                            missing += 1
+                    new_refs.append(refs[path])
+                updated[key] = new_refs
+            if updated and any(updated[key] != list(card.get(key)) for key in updated):
+                engine.update_card(course, card.id, dict(card, **updated))
+                changed += 1
+        if course != engine.current_course:
+            engine.store.release_course(course)
+    engine.flush()
+    print(f"Updated {changed} cards; {len(engine.assets)} assets stored, {missing} images unreadable")
+    return 0 if not missing else 2
+
+
+def scan_images(engine, args):
+    from flashcard_scan import SCAN_WORKERS, AssetScanner
+
+    start = time.perf_counter()
+    scanner = AssetScanner(engine, verify=args.verify, workers=args.workers or SCAN_WORKERS).run()
+    elapsed = time.perf_counter() - start
+    print(scanner.summary())
+    print(f"Took {elapsed:.3f}s")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(scanner.report(), f, indent=4)
+    return 0 if not scanner.problem_card_count() else 2
+
+
+def relink_images(engine, args):
+    from flashcard_scan import SCAN_WORKERS, PrefixRelinker
+
+    start = time.perf_counter()
+    relinker = PrefixRelinker(engine, args.old_prefix, args.new_prefix, dry_run=args.dry_run,
+                              workers=args.workers or SCAN_WORKERS).run()
+    engine.flush()
+    print(relinker.summary())
+    print(f"Took {time.perf_counter() - start:.3f}s")
+    return 0
+
+
+def format_stats(stats):
+    accuracy = f"{stats.accuracy:.0%}" if stats.accuracy is not None else "-"
+    reveal = f"{stats.mean_reveal_seconds:.1f}s" if stats.mean_reveal_seconds is not None else "-"
+    return f"{stats.reviews} reviews, {accuracy} remembered, answer shown after {reveal}"
+
+
+def show_history(engine, args):
+    """Print review totals per course, or one course's most forgotten cards."""
+    history = engine.history
+    if args.course is None:
+        for name in engine.course_names():
+            stats = history.course_stats(name)
+            if stats is None:
+                print(f"{name}: never studied")
+                continue
+            last = time.strftime("%Y-%m-%d %H:%M", time.localtime(stats.last_review))
+            print(f"{name}: {format_stats(stats)}; studied {stats.study_days} days,"
+                  f" {stats.day_streak} in a row (best {stats.best_day_streak}); last {last}")
+        return 0
+
+    if args.course not in engine.courses:
+        print(f"No such course: {args.course}", file=sys.stderr)
+        return 1
+    cards = engine.courses[args.course]
+    for card_id, stats in history.hardest_cards(args.course, args.count):
+        card = cards.get(card_id)
+        question = " ".join(card.question.split())[:60] if card is not None else "[deleted]"
+        print(f"{stats.lapses} forgotten, streak {stats.streak} (best {stats.best_streak}),"
+              f" {format_stats(stats)}: {question}")
+    return 0
+
+
+def serve(engine, args):
+    # Imported here so the other commands don't need Pillow.
+    import asyncio
+    import signal
+    from flashcard_images import ThumbnailStore
+    from flashcard_server import StudyServer
+
+    thumbnails = args.thumbnails or os.path.splitext(args.file)[0] + ".thumbs"
+    server = StudyServer(engine, ThumbnailStore(thumbnails, assets=engine.assets), args.host, args.port)
+
+    async def run():
+        await server.start()
+        stopped = asyncio.Event()
+        try:
+            # Stop cleanly, flushing the review log, when terminated as well as on Ctrl+C.
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stopped.set)
+        except NotImplementedError:
+            pass
+        print(f"Serving {args.file} on http://{server.host}:{server.port}", flush=True)
+        try:
+            await stopped.wait()
+        finally:
+            await server.close()
+            server.thumbnail_store.flush()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load a flashcard deck and study it without the GUI.")
+    parser.add_argument("-f", "--file", default=FLASHCARDS_FILE, help="deck file (default: %(default)s)")
+    parser.add_argument("-b", "--backend", default=STORAGE_BACKEND, choices=sorted(STORES))
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("courses", help="list courses and their card counts")
+
+    study = commands.add_parser("study", help="run a study session as fast as possible")
+    study.add_argument("course")
+    study.add_argument("-n", "--count", type=int, help="cards to study (default: one pass over the course)")
+    study.add_argument("-m", "--mode", choices=["shuffle", "srs"], default="shuffle")
+    study.add_argument("-g", "--grade", choices=sorted(GRADE_NAMES) + ["random"], default="good",
+                       help="grade given to every card in srs mode")
+    study.add_argument("-v", "--verbose", action="store_true", help="print each question")
+    study.add_argument("--restart", action="store_true",
+                       help="start a new shuffled pass instead of continuing the saved one")
+
+    bulk = commands.add_parser("import", help="import cards from a CSV/TSV file or a directory")
+    bulk.add_argument("course", help="course to import into (created if missing)")
+    bulk.add_argument("source", help="CSV/TSV file, or directory of <card>.question|answer.<ext> files")
+    bulk.add_argument("--thumbnails", metavar="DIR",
+                      help="also render study thumbnails into this thumbnail store")
+
+    export = commands.add_parser("export", help="write courses and their images to a portable archive")
+    export.add_argument("archive", help="archive file to write (.fcz)")
+    export.add_argument("courses", nargs="*", help="courses to export (default: all)")
+
+    restore = commands.add_parser("import-archive", help="add the courses in an exported archive")
+    restore.add_argument("archive")
+
+    commands.add_parser("ingest-images", help="copy images cards refer to by path into the asset store")
+
+    scan = commands.add_parser("scan-images", help="check every image cards show for missing or damaged files")
+    scan.add_argument("--verify", action="store_true", help="also decode each image (and re-hash assets)")
+    scan.add_argument("-o", "--output", help="write the full report as JSON to this file")
+    scan.add_argument("--workers", type=int, help="threads checking files (default: four per CPU, up to 32)")
+
+    relink = commands.add_parser("relink-images", help="point image paths under one folder at another folder")
+    relink.add_argument("old_prefix", help="folder the images used to be in")
+    relink.add_argument("new_prefix", help="folder they are in now")
+    relink.add_argument("--dry-run", action="store_true", help="report what would change without changing it")
+    relink.add_argument("--workers", type=int, help="threads checking files (default: four per CPU, up to 32)")
+
+    history = commands.add_parser("history", help="show review totals per course, or a course's hardest cards")
+    history.add_argument("course", nargs="?", help="list this course's most often forgotten cards")
+    history.add_argument("-n", "--count", type=int, default=20, help="cards to list (default: %(default)s)")
+
+    server = commands.add_parser("serve", help="serve the deck to many learners over HTTP/JSON")
+    server.add_argument("--host", default="127.0.0.1")
+    server.add_argument("--port", type=int, default=8750)
+    server.add_argument("--thumbnails", metavar="DIR",
+                        help="thumbnail store for served images (default: next to the deck)")
+
+    args = parser.parse_args(argv)
+    engine = DeckEngine(args.file, args.backend)
+    try:
+        if args.command == "courses":
+            for name in engine.course_names():
+                print(f"{name}\t{len(engine.courses[name])}")
+            return 0
+
+        if args.command == "import":
+            return import_cards(engine, args)
+        if args.command == "export":
+            return export_archive(engine, args)
+        if args.command == "import-archive":
+            return import_archive(engine, args)
+        if args.command == "ingest-images":
+            return ingest_images(engine)
+        if args.command == "scan-images":
+            return scan_images(engine, args)
+        if args.command == "relink-images":
+            return relink_images(engine, args)
+        if args.command == "history":
+            return show_history(engine, args)
+        if args.command == "serve":
+            return serve(engine, args)
+
+        if args.course not in engine.courses:
+            print(f"No such course: {args.course}", file=sys.stderr)
+            return 1
+        engine.set_current_course(args.course)
+        if args.restart:
+            engine.restart_study()
+        mode = SPACED_REPETITION_MODE if args.mode == "srs" else SHUFFLE_MODE
+        count = args.count if args.count is not None else len(engine.current_cards())
+
+        studied = 0
+        start = time.perf_counter()
+        while studied < count:
+            card = engine.next_card(mode)
+            if card is None:
+                break
+            if args.verbose:
+                print(card.get("question") or "[No question text]")
+            if mode == SPACED_REPETITION_MODE:
+                engine.reveal_answer()
+                grade = random.choice(list(GRADE_NAMES)) if args.grade == "random" else args.grade
+                engine.grade_current_card(GRADE_NAMES[grade])
+            studied += 1
+        elapsed = time.perf_counter() - start
+
+        rate = studied / elapsed if elapsed > 0 else float("inf")
+        print(f"Studied {studied} cards in {elapsed:.3f}s ({rate:.0f} cards/s)")
+        if engine.next_due is not None:
+            print("No more cards due until " + time.strftime("%Y-%m-%d %H:%M", time.localtime(engine.next_due)))
+        return 0
+    finally:
+        engine.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,472 @@
+import datetime
+import heapq
+import json
+import os
+import re
+import struct
+import threading
+import time
+
+from flashcard_scheduler import PASS_QUALITY
+from flashcard_storage import BackgroundSaver, atomic_write_bytes, fsync_directory
+
+# Review history is kept in <deck name>.history/ next to the deck.
+HISTORY_DIR_SUFFIX = ".history"
+CHECKPOINT_FILE = "checkpoint.json"
+SEGMENT_PATTERN = re.compile(r"^(\d{6})\.log$")
+SEGMENT_MAGIC = b"FCHIST01"
+# A segment is closed and a new one started once it reaches this size
+# (about 1.4 million reviews).
+SEGMENT_BYTES = 32 * 1024 * 1024
+# Closed segments beyond the newest few are deleted once a checkpoint
+# covers them; their reviews live on in the aggregates.
+KEEP_SEGMENTS = 4
+# Aggregates are checkpointed after this many events, or as many as
+# there are cards with totals if that's more (a checkpoint writes every
+# card), which bounds how much of the log is replayed on open.
+CHECKPOINT_EVENTS = 5000
+HISTORY_SAVE_DELAY_SECONDS = 1.0
+# Write without waiting for a pause once this many events are pending
+# (e.g. when studying from a script).
+MAX_PENDING_EVENTS = 1000
+
+# Outcome of a card shown and moved on from without a grade (shuffle
+# mode); graded cards log their SM-2 quality 0-5.
+OUTCOME_SEEN = -1
+# Reveal time of a card whose answer was never shown.
+NOT_REVEALED = 0xFFFFFFFF
+
+KIND_COURSE = 1
+KIND_REVIEW = 2
+KIND_FORGET = 3
+# kind, name length; followed by the UTF-8 name. Numbers the courses of a segment in order.
+_COURSE = struct.Struct("<BH")
+# kind, course number, card id, time (epoch seconds), milliseconds until the answer was shown, outcome
+_REVIEW = struct.Struct("<BHQdIb")
+# kind, course number, card id: a deleted card's aggregates are dropped.
+_FORGET = struct.Struct("<BHQ")
+
+
+def segment_name(number):
+    return f"{number:06d}.log"
+
+
+def day_number(when):
+    """The local calendar day of an epoch time, as an ordinal."""
+    return datetime.date.fromtimestamp(when).toordinal()
+
+
+class ReviewStats:
+    """Running totals over one card's reviews, updated one review at a time."""
+
+    __slots__ = ("reviews", "revealed", "reveal_ms", "correct", "lapses", "streak", "best_streak", "last_review")
+
+    def __init__(self, *fields):
+        self.reviews = self.revealed = self.reveal_ms = 0
+        self.correct = self.lapses = self.streak = self.best_streak = 0
+        self.last_review = 0.0
+        for name, value in zip(self.fields(), fields):
+            setattr(self, name, value)
+
+    @classmethod
+    def fields(cls):
+        return ReviewStats.__slots__
+
+    def add(self, when, reveal_ms, outcome):
+        self.reviews += 1
+        if reveal_ms != NOT_REVEALED:
+            self.revealed += 1
+            self.reveal_ms += reveal_ms
+        if outcome >= PASS_QUALITY:
+            self.correct += 1
+            self.streak += 1
+            if self.streak > self.best_streak:
+                self.best_streak = self.streak
+        elif outcome >= 0:
+            self.lapses += 1
+            self.streak = 0
+        if when > self.last_review:
+            self.last_review = when
+
+    @property
+    def graded(self):
+        return self.correct + self.lapses
+
+    @property
+    def accuracy(self):
+        """Fraction of graded reviews remembered, or None if none were graded."""
+        return self.correct / self.graded if self.graded else None
+
+    @property
+    def mean_reveal_seconds(self):
+        """Average time until the answer was shown, or None if it never was."""
+        return self.reveal_ms / self.revealed / 1000 if self.revealed else None
+
+    def to_json(self):
+        return [getattr(self, name) for name in self.fields()]
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(*data)
+
+
+class CourseStats(ReviewStats):
+    """A course's totals, plus its streak of consecutive days studied."""
+
+    __slots__ = ("study_days", "day_streak", "best_day_streak", "last_day")
+
+    def __init__(self, *fields):
+        self.study_days = self.day_streak = self.best_day_streak = self.last_day = 0
+        super().__init__(*fields)
+
+    @classmethod
+    def fields(cls):
+        return ReviewStats.__slots__ + CourseStats.__slots__
+
+    def add(self, when, reveal_ms, outcome):
+        super().add(when, reveal_ms, outcome)
+        day = day_number(when)
+        if day <= self.last_day:
+            return
+        self.study_days += 1
+        self.day_streak = self.day_streak + 1 if day == self.last_day + 1 else 1
+        self.best_day_streak = max(self.best_day_streak, self.day_streak)
+        self.last_day = day
+
+
+class ReviewHistory:
+    """
+    Every card shown, when, how long until its answer was revealed and
+    how it was graded, in an append-only binary log, with per-card and
+    per-course totals (CourseStats/ReviewStats) kept up to date as each
+    review is recorded, so reading them never scans the log.
+
+    The log is a series of numbered segment files of fixed-size records.
+    Each segment names the courses it uses in course records, so a
+    review costs 24 bytes. Records are appended in batches by a
+    BackgroundSaver. Every so often (see CHECKPOINT_EVENTS) the totals
+    are written to checkpoint.json together with the log position they
+    cover; opening reads the checkpoint and replays only the log after
+    it. A torn record at the end of the log (from a crash mid-write) is
+    cut off before appending again.
+
+    Rotation and compaction: once a segment reaches SEGMENT_BYTES a new
+    one is started and a checkpoint of the full one written. Segments older than the
+    newest KEEP_SEGMENTS are then deleted, as the checkpoint already
+    holds their totals; the kept ones let the totals be rebuilt if the
+    checkpoint is lost. A deleted card's totals are dropped (forget()),
+    so checkpoints only grow with the live deck.
+    """
+
+    def __init__(self, directory, save_delay=HISTORY_SAVE_DELAY_SECONDS, segment_bytes=SEGMENT_BYTES,
+                 keep_segments=KEEP_SEGMENTS, checkpoint_events=CHECKPOINT_EVENTS):
+        self.directory = directory
+        self.checkpoint_path = os.path.join(directory, CHECKPOINT_FILE)
+        self.segment_bytes = segment_bytes
+        self.keep_segments = keep_segments
+        self.checkpoint_events = checkpoint_events
+        # { course: CourseStats } and { course: { card id: ReviewStats } }
+        self.courses = {}
+        self.cards = {}
+        self._lock = threading.Lock()
+        # Events recorded but not written yet: (KIND_REVIEW, course, card id, time, reveal ms, outcome)
+        # or (KIND_FORGET, course, card id).
+        self._pending = []
+        # Whether a write has been requested for the pending events since the saver last took them.
+        self._write_requested = False
+        # Where the next record goes. Only the saver thread touches these after load().
+        self._segment = 1
+        self._offset = 0
+        self._declared = {}
+        self._file = None
+        self._since_checkpoint = 0
+        self._checkpoint_due = False
+        self.load()
+        self._saver = BackgroundSaver(self._write, save_delay)
+
+    @classmethod
+    def for_deck(cls, deck_path, **kwargs):
+        return cls(os.path.splitext(deck_path)[0] + HISTORY_DIR_SUFFIX, **kwargs)
+
+    # ================================================================
+    # Recording
+    # ================================================================
+    def record(self, course, card_id, outcome, reveal_seconds=None, when=None):
+        """Log one review: outcome is a quality 0-5 or OUTCOME_SEEN."""
+        when = time.time() if when is None else when
+        reveal_ms = NOT_REVEALED if reveal_seconds is None else min(round(reveal_seconds * 1000), NOT_REVEALED - 1)
+        with self._lock:
+            self._apply_review(course, card_id, when, reveal_ms, outcome)
+            self._pending.append((KIND_REVIEW, course, card_id, when, reveal_ms, outcome))
+            urgent = len(self._pending) >= MAX_PENDING_EVENTS
+            request = urgent or not self._write_requested
+            self._write_requested = True
+        # The batch is written a save delay after its first event (or the first since a
+        # failed write), or at once when it's grown large.
+        if request:
+            self._saver.request(urgent=urgent)
+
+    def forget(self, course, card_id):
+        """Drop a deleted card's totals (the course's totals keep its reviews)."""
+        with self._lock:
+            cards = self.cards.get(course)
+            if cards is None or cards.pop(card_id, None) is None:
+                return
+            self._pending.append((KIND_FORGET, course, card_id))
+        self._saver.request()
+
+    # ================================================================
+    # Reading
+    # ================================================================
+    def course_stats(self, course):
+        return self.courses.get(course)
+
+    def card_stats(self, course, card_id):
+        return self.cards.get(course, {}).get(card_id)
+
+    def hardest_cards(self, course, count):
+        """[(card id, ReviewStats)] of the course's most often forgotten cards."""
+        with self._lock:
+            cards = list(self.cards.get(course, {}).items())
+        return heapq.nlargest(count, cards, key=lambda item: (item[1].lapses, -item[1].correct))
+
+    # ================================================================
+    # Persistence
+    # ================================================================
+    @property
+    def save_error(self):
+        return self._saver.error
+
+    def flush(self):
+        """Wait for recorded events to reach the disk. Returns the last error, if any."""
+        return self._saver.flush()
+
+    def close(self):
+        """Write what's pending plus a final checkpoint, so the next open replays nothing."""
+        with self._lock:
+            if self._pending or self._since_checkpoint:
+                self._checkpoint_due = True
+                self._saver.request()
+        error = self._saver.close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        return error
+
+    def load(self):
+        segments = self._segment_numbers()
+        checkpoint = self._read_checkpoint()
+        if checkpoint is not None:
+            start, offset, names = checkpoint["segment"], checkpoint["offset"], checkpoint["names"]
+            self.courses = {name: CourseStats.from_json(data) for name, data in checkpoint["courses"].items()}
+            self.cards = {
+                name: {int(card_id): ReviewStats.from_json(data) for card_id, data in cards.items()}
+                for name, cards in checkpoint["cards"].items()
+            }
+        else:
+            # No usable checkpoint: rebuild the totals from the segments still kept.
+            start, offset, names = (segments[0] if segments else 1), 0, []
+        replayed = 0
+        self._segment, self._offset, self._declared = start, offset, {}
+        for number in segments:
+            if number < start:
+                continue
+            if number != start:
+                offset, names = 0, []
+            self._segment = number
+            self._offset, names, events = self._replay(number, offset, list(names))
+            self._declared = {name: i for i, name in enumerate(names)}
+            replayed += events
+        self._since_checkpoint = replayed
+        return replayed
+
+    def _segment_numbers(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted(int(m.group(1)) for m in map(SEGMENT_PATTERN.match, names) if m)
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, segment_name(number))
+
+    def _read_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            if all(key in checkpoint for key in ("segment", "offset", "names", "courses", "cards")):
+                return checkpoint
+        except (OSError, ValueError, TypeError):
+            pass
+        # Missing or damaged: the totals are rebuilt from the log.
+        return None
+
+    def _replay(self, number, offset, names):
+        """
+        Apply a segment's events from offset on. Returns (offset of the
+        end of the last whole record, course names, events applied).
+        """
+        try:
+            with open(self._segment_path(number), "rb") as f:
+                data = f.read()
+        except OSError:
+            return 0, [], 0
+        if not data.startswith(SEGMENT_MAGIC):
+            # Unreadable; it's started over if it's the one being appended to.
+            return 0, [], 0
+        pos = max(offset, len(SEGMENT_MAGIC))
+        end = len(data)
+        events = 0
+        apply_review = self._apply_review
+        unpack_review = _REVIEW.unpack_from
+        review_size = _REVIEW.size
+        try:
+            while pos < end:
+                kind = data[pos]
+                if kind == KIND_REVIEW:
+                    if pos + review_size > end:
+                        break
+                    _, course, card_id, when, reveal_ms, outcome = unpack_review(data, pos)
+                    apply_review(names[course], card_id, when, reveal_ms, outcome)
+                    pos += review_size
+                elif kind == KIND_COURSE:
+                    _, length = _COURSE.unpack_from(data, pos)
+                    name_end = pos + _COURSE.size + length
+                    if name_end > end:
+                        break
+                    names.append(data[pos + _COURSE.size:name_end].decode("utf-8"))
+                    pos = name_end
+                    continue
+                elif kind == KIND_FORGET:
+                    if pos + _FORGET.size > end:
+                        break
+                    _, course, card_id = _FORGET.unpack_from(data, pos)
+                    self.cards.get(names[course], {}).pop(card_id, None)
+                    pos += _FORGET.size
+                else:
+                    break
+                events += 1
+        except (struct.error, IndexError, UnicodeDecodeError):
+            # Only the tail can be torn; anything after it is unreliable.
+            pass
+        return pos, names, events
+
+    def _apply_review(self, course, card_id, when, reveal_ms, outcome):
+        course_stats = self.courses.get(course)
+        if course_stats is None:
+            course_stats = self.courses[course] = CourseStats()
+        course_stats.add(when, reveal_ms, outcome)
+        cards = self.cards.get(course)
+        if cards is None:
+            cards = self.cards[course] = {}
+        stats = cards.get(card_id)
+        if stats is None:
+            stats = cards[card_id] = ReviewStats()
+        stats.add(when, reveal_ms, outcome)
+
+    def _write(self):
+        """BackgroundSaver callback: append pending events, rotating and checkpointing as due."""
+        with self._lock:
+            events, self._pending = self._pending, []
+            self._write_requested = False
+            # Rotate after this batch if it fills the segment, checkpointing the full one.
+            rotate = self._offset + len(events) * _REVIEW.size >= self.segment_bytes
+            checkpoint = None
+            interval = max(self.checkpoint_events, sum(len(cards) for cards in self.cards.values()))
+            if rotate or self._checkpoint_due or self._since_checkpoint + len(events) >= interval:
+                # Taken with the events, so it covers exactly the log up to them.
+                checkpoint = {
+                    "courses": {name: stats.to_json() for name, stats in self.courses.items()},
+                    "cards": {
+                        name: {str(card_id): stats.to_json() for card_id, stats in cards.items()}
+                        for name, cards in self.cards.items()
+                    },
+                }
+        try:
+            if events:
+                self._append(events)
+        except OSError:
+            with self._lock:
+                # Left for the next record() to request a write for.
+                self._pending[:0] = events
+            raise
+        if rotate:
+            self._rotate()
+        if checkpoint is not None:
+            self._write_checkpoint(checkpoint)
+            self._compact()
+
+    def _append(self, events):
+        f = self._open_segment()
+        declared = dict(self._declared)
+        records = []
+        for event in events:
+            course = event[1]
+            number = declared.get(course)
+            if number is None:
+                number = declared[course] = len(declared)
+                name = course.encode("utf-8")
+                records.append(_COURSE.pack(KIND_COURSE, len(name)) + name)
+            if event[0] == KIND_REVIEW:
+                records.append(_REVIEW.pack(KIND_REVIEW, number, *event[2:]))
+            else:
+                records.append(_FORGET.pack(KIND_FORGET, number, event[2]))
+        data = b"".join(records)
+        try:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        except OSError:
+            # Don't leave half a batch behind to be written again.
+            try:
+                f.truncate(self._offset)
+            except OSError:
+                pass
+            raise
+        self._declared = declared
+        self._offset += len(data)
+        self._since_checkpoint += len(events)
+
+    def _open_segment(self):
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            f = open(self._segment_path(self._segment), "ab")
+            # Cut off a torn tail, or start a new (or unreadable) segment over.
+            f.truncate(self._offset)
+            if self._offset == 0:
+                f.write(SEGMENT_MAGIC)
+                self._offset = len(SEGMENT_MAGIC)
+            self._file = f
+        return self._file
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._segment += 1
+        self._offset = 0
+        self._declared = {}
+        self._checkpoint_due = True
+
+    def _write_checkpoint(self, checkpoint):
+        checkpoint.update(
+            segment=self._segment,
+            offset=self._offset,
+            names=sorted(self._declared, key=self._declared.get),
+        )
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_write_bytes(self.checkpoint_path, json.dumps(checkpoint, separators=(",", ":")).encode("utf-8"))
+        self._since_checkpoint = 0
+        self._checkpoint_due = False
+
+    def _compact(self):
+        """Delete closed segments beyond the newest keep_segments; the checkpoint covers them."""
+        old = [number for number in self._segment_numbers() if number < self._segment]
+        expired = old[:max(0, len(old) - (self.keep_segments - 1))]
+        for number in expired:
+            try:
+                os.remove(self._segment_path(number))
+            except OSError:
+                pass
+        if expired:
+            fsync_directory(self.checkpoint_path)
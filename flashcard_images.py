@@ -0,0 +1,524 @@
+import hashlib
+import io
+import json
+import os
+import queue
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from flashcard_metrics import metrics
+
+PREVIEW_IMAGE_SIZE = (100, 100)
+STUDY_IMAGE_SIZE = (400, 400)
+BROWSER_IMAGE_SIZE = (32, 32)
+
+# Default budget for decoded, resized images kept in memory.
+IMAGE_CACHE_BYTES = 64 * 1024 * 1024
+# Worker threads used to decode images ahead of display.
+PREFETCH_WORKERS = 2
+# Default size cap for the on-disk thumbnail store.
+THUMBNAIL_STORE_BYTES = 256 * 1024 * 1024
+THUMBNAIL_MAGIC = b"FCTHUMB1"
+# Part of every thumbnail's file name; bumped when images are rendered
+# differently, so thumbnails from before are left to age out.
+THUMBNAIL_RENDER_VERSION = 2
+
+# Before the final resample, images are shrunk by whole factors (a
+# reduced-scale JPEG decode, or reduce()) to no less than this many
+# times the target size, as Image.thumbnail() does.
+REDUCING_GAP = 2.0
+# Shrinking by at least this much resamples with Lanczos; below it
+# (typically what's left after a reduced JPEG decode) bicubic looks the
+# same and costs less.
+LANCZOS_MIN_FACTOR = 1.5
+
+EXIF_ORIENTATION = 0x0112
+# The Image.Transpose that turns an image upright, for each EXIF orientation value.
+ORIENTATION_TRANSPOSE = {
+    2: "FLIP_LEFT_RIGHT",
+    3: "ROTATE_180",
+    4: "FLIP_TOP_BOTTOM",
+    5: "TRANSPOSE",
+    6: "ROTATE_270",
+    7: "TRANSVERSE",
+    8: "ROTATE_90",
+}
+# Orientations stored sideways, whose width and height swap once upright.
+SIDEWAYS_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def pil_image():
+    """The PIL.Image module."""
+    # Imported on first use, so the app's window can show before Pillow has loaded.
+    from PIL import Image
+    return Image
+
+
+def fit_size(width, height, size):
+    """The largest size with the aspect of width x height that fits inside size, never enlarged."""
+    scale = min(size[0] / width, size[1] / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def open_display_image(fp, size):
+    """
+    Decode an image file (a path or binary file object) shrunk to fit
+    inside size and turned upright from its EXIF orientation, in a mode
+    ThumbnailStore can save (L, RGB or RGBA).
+
+    A JPEG is decoded at the smallest scale (1/2, 1/4 or 1/8) still at
+    least as large as the target, so a 24-megapixel photo shown at
+    400x400 decodes 1/64 of its pixels; other formats are reduce()d by
+    a whole factor first. Orientation is applied to the small result.
+    """
+    Image = pil_image()
+    img = Image.open(fp)
+    orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+    if orientation in SIDEWAYS_ORIENTATIONS:
+        size = (size[1], size[0])
+    target = fit_size(img.width, img.height, size)
+    # Only JPEGs support this; it's a no-op for other formats.
+    img.draft(None, target)
+    img.load()
+    if img.mode not in ("L", "RGB", "RGBA"):
+        img = img.convert("RGBA")
+    factor = min(img.width / target[0], img.height / target[1])
+    reduce_by = int(factor / REDUCING_GAP)
+    if reduce_by > 1:
+        img = img.reduce(reduce_by)
+        factor /= reduce_by
+    if img.size != target:
+        resample = Image.Resampling.LANCZOS if factor >= LANCZOS_MIN_FACTOR else Image.Resampling.BICUBIC
+        img = img.resize(target, resample)
+    transpose = ORIENTATION_TRANSPOSE.get(orientation)
+    if transpose is not None:
+        img = img.transpose(getattr(Image.Transpose, transpose))
+    return img
+
+
+def load_thumbnail(path, size):
+    """Decode an image file and shrink it to fit inside size."""
+    return open_display_image(path, size)
+
+
+def image_nbytes(img):
+    """Approximate memory held by a decoded image."""
+    return img.width * img.height * len(img.getbands())
+
+
+def thumbnail_name(digest, size):
+    return f"{digest}-{size[0]}x{size[1]}-r{THUMBNAIL_RENDER_VERSION}.raw"
+
+
+def thumbnail_digest(name):
+    return name.split("-", 1)[0]
+
+
+def decode_thumbnail(data, size):
+    """Decode image file contents into a thumbnail in a mode ThumbnailStore can save."""
+    return open_display_image(io.BytesIO(data), size)
+
+
+def write_thumbnail_file(thumb_path, img):
+    """Write img as a raw thumbnail file and return its size in bytes."""
+    header = b"%s %s %d %d\n" % (THUMBNAIL_MAGIC, img.mode.encode("ascii"), img.width, img.height)
+    data = header + img.tobytes()
+    tmp_path = f"{thumb_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, thumb_path)
+    return len(data)
+
+
+def prerender_thumbnail(directory, path, size):
+    """
+    Make the thumbnail ThumbnailStore(directory).get(path, size) would,
+    without touching the store's index, so it can run in a worker process.
+    Returns (path, source entry, thumbnail name, bytes) for
+    ThumbnailStore.add(). Raises OSError if path is unreadable.
+    """
+    st = os.stat(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    name = thumbnail_name(digest, size)
+    thumb_path = os.path.join(directory, name)
+    if os.path.exists(thumb_path):
+        nbytes = os.path.getsize(thumb_path)
+    else:
+        nbytes = write_thumbnail_file(thumb_path, decode_thumbnail(data, size))
+    return path, {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "digest": digest}, name, nbytes
+
+
+class ImageCache:
+    """
+    LRU cache of decoded, resized images, keyed by (path, mtime, size).
+    Editing an image file changes its mtime, so stale entries are never
+    returned; they just age out. Entries are evicted oldest-first once
+    the cached pixels exceed max_bytes. Safe to use from several threads.
+
+    With an AssetStore, asset references can be passed as paths. They are
+    keyed by reference alone: assets never change, so there is nothing
+    to stat, and cards sharing an image share one entry.
+    """
+
+    def __init__(self, max_bytes=IMAGE_CACHE_BYTES, loader=load_thumbnail, assets=None):
+        self.max_bytes = max_bytes
+        # loader(path, size) produces an image on a miss, e.g. ThumbnailStore.get.
+        self.loader = loader
+        self.assets = assets
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, size):
+        """
+        Return the image at path resized to fit size, decoding it only on
+        a cache miss. Raises OSError if the file is missing or unreadable.
+        """
+        key = self._key(path, size)
+        img = self._lookup_key(key)
+        if img is None:
+            with metrics.phase("image.decode"):
+                img = self.loader(path, size)
+            self._put(key, img)
+        return img
+
+    def lookup(self, path, size):
+        """
+        Return the cached image for path and size, or None if it would have
+        to be decoded. Raises OSError if the file is missing.
+        """
+        return self._lookup_key(self._key(path, size))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _key(self, path, size):
+        if self.assets is not None and self.assets.digest(path) is not None:
+            return (path, 0, tuple(size))
+        return (path, os.stat(path).st_mtime_ns, tuple(size))
+
+    def _lookup_key(self, key):
+        with self._lock:
+            img = self._entries.get(key)
+            if img is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return img
+
+    def _put(self, key, img):
+        nbytes = image_nbytes(img)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = img
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self.current_bytes -= image_nbytes(old)
+                self.evictions += 1
+
+
+class ThumbnailStore:
+    """
+    Persistent cache of resized images in a directory next to the deck,
+    shared across sessions.
+
+    Thumbnails are named by a hash of the source file's contents plus the
+    target size, so identical files share one thumbnail. An index maps
+    each source path to its size, mtime and content hash; as long as
+    those still match a stat() of the source, the thumbnail is used
+    without opening the original. Thumbnails are stored as raw pixels,
+    which decode with a single read, and the least recently used ones
+    are deleted once the directory exceeds max_bytes. A source path is
+    forgotten along with the last thumbnail of its contents.
+
+    Images in an AssetStore, if one is given, are already named by their
+    content hash, so they skip the index and the stat() entirely.
+
+    Call flush() before exiting to persist the index.
+    """
+
+    def __init__(self, directory, max_bytes=THUMBNAIL_STORE_BYTES, assets=None):
+        self.directory = directory
+        self.assets = assets
+        self.index_path = os.path.join(directory, "index.json")
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        # Source path -> {"mtime_ns": ..., "size": ..., "digest": ...}
+        self._sources = {}
+        # Thumbnail file name -> bytes on disk, least recently used first.
+        self._thumbs = OrderedDict()
+        # Content digest -> thumbnails of it, and -> source paths recorded with it.
+        self._digest_thumbs = Counter()
+        self._digest_paths = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def get(self, path, size):
+        """Return path resized to fit size. Raises OSError if path is unreadable."""
+        digest = self.assets.digest(path) if self.assets is not None else None
+        if digest is not None:
+            return self._get_asset(path, digest, size)
+        st = os.stat(path)
+        with self._lock:
+            source = self._sources.get(path)
+            if source and source["mtime_ns"] == st.st_mtime_ns and source["size"] == st.st_size:
+                name = thumbnail_name(source["digest"], size)
+                if name in self._thumbs:
+                    self._thumbs.move_to_end(name)
+                    self._dirty = True
+                else:
+                    name = None
+            else:
+                name = None
+        if name is not None:
+            img = self._read_thumb(name)
+            if img is not None:
+                return img
+
+        # Miss: read the original once, both to hash and to decode it.
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        name = thumbnail_name(digest, size)
+        with self._lock:
+            self._set_source(path, {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "digest": digest})
+            self._dirty = True
+            known = name in self._thumbs
+        if known:
+            # Same content already cached under another path.
+            img = self._read_thumb(name)
+            if img is not None:
+                return img
+        img = decode_thumbnail(data, size)
+        try:
+            nbytes = write_thumbnail_file(os.path.join(self.directory, name), img)
+        except OSError:
+            return img
+        self._add_thumb(name, nbytes)
+        return img
+
+    def has(self, path, size):
+        """Whether get(path, size) would be served from the store without decoding."""
+        digest = self.assets.digest(path) if self.assets is not None else None
+        if digest is not None:
+            with self._lock:
+                return thumbnail_name(digest, size) in self._thumbs
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        with self._lock:
+            source = self._sources.get(path)
+            return (source is not None and source["mtime_ns"] == st.st_mtime_ns
+                    and source["size"] == st.st_size
+                    and thumbnail_name(source["digest"], size) in self._thumbs)
+
+    def _get_asset(self, ref, digest, size):
+        name = thumbnail_name(digest, size)
+        with self._lock:
+            known = name in self._thumbs
+            if known:
+                self._thumbs.move_to_end(name)
+                self._dirty = True
+        if known:
+            img = self._read_thumb(name)
+            if img is not None:
+                return img
+        # The name already says what the contents are, so the file is decoded
+        # straight from disk without reading it all into memory first.
+        img = open_display_image(self.assets.path(ref), size)
+        try:
+            nbytes = write_thumbnail_file(os.path.join(self.directory, name), img)
+        except OSError:
+            return img
+        self._add_thumb(name, nbytes)
+        return img
+
+    def add(self, path, source, name, nbytes):
+        """Record a thumbnail made by prerender_thumbnail() in another process."""
+        with self._lock:
+            self._set_source(path, source)
+            self._dirty = True
+        self._add_thumb(name, nbytes)
+
+    def flush(self):
+        """Write the index so the next session can reuse the thumbnails."""
+        with self._lock:
+            if not self._dirty:
+                return
+            index = {"sources": self._sources, "thumbs": list(self._thumbs.items())}
+            self._dirty = False
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._thumbs = OrderedDict(index.get("thumbs", []))
+        self.current_bytes = sum(self._thumbs.values())
+        self._digest_thumbs = Counter(thumbnail_digest(name) for name in self._thumbs)
+        for path, source in index.get("sources", {}).items():
+            # Indexes written before sources were forgotten may list some with no thumbnail left.
+            if source.get("digest") in self._digest_thumbs:
+                self._set_source(path, source)
+
+    def _read_thumb(self, name):
+        try:
+            with open(os.path.join(self.directory, name), "rb") as f:
+                header = f.readline().split()
+                pixels = f.read()
+            magic, mode, width, height = header
+            if magic != THUMBNAIL_MAGIC:
+                raise ValueError(name)
+            return pil_image().frombytes(mode.decode("ascii"), (int(width), int(height)), pixels)
+        except (OSError, ValueError):
+            # Missing or damaged; forget it so it gets rebuilt.
+            with self._lock:
+                if self._forget_thumb(name):
+                    self._dirty = True
+            return None
+
+    def _add_thumb(self, name, nbytes):
+        stale = []
+        with self._lock:
+            old_nbytes = self._thumbs.pop(name, None)
+            if old_nbytes is None:
+                self._digest_thumbs[thumbnail_digest(name)] += 1
+            else:
+                self.current_bytes -= old_nbytes
+            self._thumbs[name] = nbytes
+            self.current_bytes += nbytes
+            self._dirty = True
+            while self.current_bytes > self.max_bytes and len(self._thumbs) > 1:
+                old_name = next(iter(self._thumbs))
+                self._forget_thumb(old_name)
+                stale.append(old_name)
+        for old_name in stale:
+            try:
+                os.remove(os.path.join(self.directory, old_name))
+            except OSError:
+                pass
+
+
+    def _set_source(self, path, source):
+        self._sources[path] = source
+        self._digest_paths.setdefault(source["digest"], set()).add(path)
+
+    def _forget_thumb(self, name):
+        """Drop a thumbnail from the index (lock held), and its sources if it was their last."""
+        nbytes = self._thumbs.pop(name, None)
+        if nbytes is None:
+            return False
+        self.current_bytes -= nbytes
+        digest = thumbnail_digest(name)
+        self._digest_thumbs[digest] -= 1
+        if self._digest_thumbs[digest] <= 0:
+            del self._digest_thumbs[digest]
+            for path in self._digest_paths.pop(digest, ()):
+                # Unless the file has changed since and been recorded with other contents.
+                if self._sources.get(path, {}).get("digest") == digest:
+                    del self._sources[path]
+        return True
+
+
+class ImagePrefetcher:
+    """
+    Decodes images into an ImageCache on a pool of worker threads, so the
+    Tk thread only has to wrap the finished image in a PhotoImage.
+
+    Callbacks never run on a worker: finished work is queued and handed
+    to its callback by run_ready(), which the Tk main loop polls. cancel()
+    drops queued work and any callbacks that haven't been delivered yet.
+    """
+
+    def __init__(self, cache, workers=PREFETCH_WORKERS):
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-prefetch")
+        self._ready = queue.Queue()
+        # (path, size) -> Future, for decodes that are queued or running.
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def request(self, path, size, callback=None):
+        """
+        Decode path at size in the background. If given, callback(img) is
+        called from run_ready() with the image, or with None if it failed.
+        """
+        key = (path, tuple(size))
+        generation = self._generation
+        with self._lock:
+            future = self._pending.get(key)
+            is_new = future is None
+            if is_new:
+                future = self._executor.submit(self.cache.get, path, size)
+                self._pending[key] = future
+        if is_new:
+            future.add_done_callback(lambda f: self._finished(key, f))
+        if callback is not None:
+            future.add_done_callback(lambda f: self._ready.put((generation, callback, f)))
+
+    def cancel(self):
+        """Forget all outstanding work, e.g. when the user switches course."""
+        with self._lock:
+            self._generation += 1
+            pending = list(self._pending.values())
+        for future in pending:
+            future.cancel()
+
+    def run_ready(self):
+        """Deliver finished images to their callbacks. Call from the Tk thread."""
+        while True:
+            try:
+                generation, callback, future = self._ready.get_nowait()
+            except queue.Empty:
+                return
+            if generation != self._generation or future.cancelled():
+                continue
+            try:
+                img = future.result()
+            except Exception:
+                img = None
+            callback(img)
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _finished(self, key, future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
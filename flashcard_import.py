@@ -0,0 +1,371 @@
+"""
+Bulk import of cards from CSV/TSV files and from directories of
+question/answer/image files.
+
+Sources are read as a stream, so memory stays flat however large the
+input is. Rows are validated and deduplicated, their images copied
+into the deck's AssetStore, and the cards committed a batch at a time
+with DeckEngine.add_cards() (one store change per batch instead of one
+per card); thumbnails for the images are rendered on a process pool
+meanwhile.
+"""
+import csv
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from flashcard_assets import is_asset_ref
+from flashcard_images import STUDY_IMAGE_SIZE, prerender_thumbnail
+
+# Cards committed to the deck per store change.
+IMPORT_BATCH_SIZE = 1000
+# A step ends after this many rows or this long, even if it committed nothing (say, a
+# run of duplicates, or rows whose images take a while to copy).
+IMPORT_STEP_ROWS = 1000
+IMPORT_STEP_SECONDS = 0.05
+# Worker processes rendering thumbnails for imported images.
+THUMBNAIL_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+# Separates several image paths in one CSV/TSV cell.
+IMAGE_SEPARATOR = ";"
+# Invalid rows reported one by one; any beyond this are only counted.
+MAX_REPORTED_ERRORS = 100
+# How long one step waits for thumbnails once every card is committed.
+THUMBNAIL_WAIT_SECONDS = 0.02
+
+# Columns of a CSV/TSV file without a header row, in order.
+CSV_COLUMNS = ("question", "answer", "question_imgs", "answer_imgs")
+TEXT_EXTENSIONS = (".txt", ".md")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp")
+# Directory imports pair files named <card>.<side>[.<n>].<ext>, e.g.
+# 001.question.txt, 001.answer.txt, 001.question.png, 001.answer.2.jpg
+DIRECTORY_FILE_PATTERN = re.compile(
+    r"^(?P<card>.+?)\.(?P<side>question|answer|q|a)(?:\.(?P<n>\d+))?(?P<ext>\.[^.]+)$",
+    re.IGNORECASE,
+)
+
+
+class DelimitedSource:
+    """
+    Rows of a CSV (or, for .tsv/.tab files, tab-separated) file as field
+    dicts. A first row naming the columns (question, answer, question_imgs,
+    answer_imgs, in any order) is optional; without it the columns are
+    taken in that order. Image cells hold paths separated by
+    IMAGE_SEPARATOR, relative to the file's directory. A malformed file
+    raises ValueError partway through.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.base_dir = os.path.dirname(os.path.abspath(path))
+        self.delimiter = "\t" if os.path.splitext(path)[1].lower() in (".tsv", ".tab") else ","
+        self.total_bytes = os.path.getsize(path)
+        self.read_bytes = 0
+
+    @property
+    def fraction(self):
+        return self.read_bytes / self.total_bytes if self.total_bytes else 1.0
+
+    def __iter__(self):
+        """Yields (location, fields) for every non-empty row."""
+        with open(self.path, "rb") as f:
+            reader = csv.reader(self._lines(f), delimiter=self.delimiter)
+            columns = CSV_COLUMNS
+            try:
+                for row in reader:
+                    if not any(cell.strip() for cell in row):
+                        continue
+                    if reader.line_num == 1:
+                        names = [cell.strip().lower() for cell in row]
+                        if "question" in names or "answer" in names:
+                            columns = names
+                            continue
+                    yield f"line {reader.line_num}", dict(zip(columns, row))
+            except csv.Error as e:
+                raise ValueError(f"{self.path}: line {reader.line_num}: {e}") from e
+
+    def _lines(self, f):
+        first = True
+        for raw in f:
+            self.read_bytes += len(raw)
+            line = raw.decode("utf-8", errors="replace")
+            if first:
+                line = line.lstrip("\ufeff")
+                first = False
+            yield line
+
+
+class DirectorySource:
+    """
+    Cards from a directory of files named <card>.<side>[.<n>].<ext>:
+    text files (.txt, .md) give a side's text and image files its images,
+    ordered by <n>. Files that don't fit the pattern are reported as
+    invalid rows.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.base_dir = os.path.abspath(path)
+        self.total_files = 0
+        self.read_files = 0
+
+    @property
+    def fraction(self):
+        return self.read_files / self.total_files if self.total_files else 1.0
+
+    def __iter__(self):
+        """Yields (location, fields) per card, or (location, error message) for stray files."""
+        entries = []
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.startswith("."):
+                    match = DIRECTORY_FILE_PATTERN.match(entry.name)
+                    if match is None:
+                        entries.append(((entry.name, "", 0), entry.name, None))
+                    else:
+                        side = "question" if match["side"].lower() in ("question", "q") else "answer"
+                        key = (match["card"], side, int(match["n"] or 0))
+                        entries.append((key, entry.name, match["ext"].lower()))
+        entries.sort(key=lambda entry: entry[0])
+        self.total_files = len(entries)
+
+        card_name = None
+        fields = None
+        for (name, side, _), file_name, ext in entries:
+            self.read_files += 1
+            if ext is None:
+                yield file_name, "file name is not <card>.question|answer[.<n>].<ext>"
+                continue
+            if name != card_name:
+                if fields is not None:
+                    yield card_name, fields
+                card_name = name
+                fields = {"question": "", "answer": "", "question_imgs": [], "answer_imgs": []}
+            if ext in TEXT_EXTENSIONS:
+                with open(os.path.join(self.path, file_name), "r", encoding="utf-8") as f:
+                    fields[side] = (fields[side] + "\n" + f.read()).strip()
+            elif ext in IMAGE_EXTENSIONS:
+                fields[side + "_imgs"].append(file_name)
+        if fields is not None:
+            yield card_name, fields
+
+
+def open_source(path):
+    """DirectorySource for a directory, DelimitedSource for anything else."""
+    if os.path.isdir(path):
+        return DirectorySource(path)
+    return DelimitedSource(path)
+
+
+def card_from_fields(fields, resolve_image):
+    """
+    Validate one imported row. Returns (card dict, None), or
+    (None, error message) if the row can't become a card.
+    resolve_image(name) turns an image cell entry into the reference the
+    card stores, or None if there's no such image.
+    """
+    if isinstance(fields, str):
+        return None, fields
+    card = {
+        "question": (fields.get("question") or "").strip(),
+        "answer": (fields.get("answer") or "").strip(),
+    }
+    for key in ("question_imgs", "answer_imgs"):
+        names = fields.get(key) or []
+        if isinstance(names, str):
+            names = names.split(IMAGE_SEPARATOR)
+        refs = []
+        for name in names:
+            if not name.strip():
+                continue
+            ref = resolve_image(name)
+            if ref is None:
+                return None, f"image not found: {name.strip()}"
+            refs.append(ref)
+        card[key] = refs
+    if not (card["question"] or card["answer"] or card["question_imgs"] or card["answer_imgs"]):
+        return None, "no text or images"
+    if isinstance(fields.get("review"), dict):
+        # Only archives carry review state; text sources never yield dicts.
+        card["review"] = fields["review"]
+    return card, None
+
+
+def format_errors(errors, count, shown=10):
+    """The first few (location, message) pairs, one per line, for a summary."""
+    if not errors:
+        return ""
+    text = "\n\n" + "\n".join(f"{location}: {message}" for location, message in errors[:shown])
+    if count > shown:
+        text += f"\n... and {count - shown} more"
+    return text
+
+
+def card_key(card):
+    """What makes two cards duplicates of each other."""
+    return (card.get("question", ""), card.get("answer", ""),
+            tuple(card.get("question_imgs") or ()), tuple(card.get("answer_imgs") or ()))
+
+
+class BulkImporter:
+    """
+    Imports a source (see open_source()) into one course of a DeckEngine.
+
+    steps() is a generator that commits at most one batch per step, and
+    ends a step after IMPORT_STEP_ROWS rows or IMPORT_STEP_SECONDS
+    whether or not it committed one, so the Tk loop can run it with
+    after() like the search index build and stay responsive; run() drives it to the end for the command line. Cards
+    already in the course, or seen earlier in the import, are skipped.
+
+    cancel() stops at the next step. Batches already committed stay in
+    the deck, as they would had the same cards been added one by one.
+    """
+
+    def __init__(self, engine, course, source, thumbnail_store=None,
+                 batch_size=IMPORT_BATCH_SIZE, workers=THUMBNAIL_WORKERS):
+        self.engine = engine
+        self.course = course
+        self.source = source
+        self.thumbnail_store = thumbnail_store
+        self.batch_size = batch_size
+        self.workers = workers
+        self.rows = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        # (location, message) for the first MAX_REPORTED_ERRORS invalid rows.
+        self.errors = []
+        self.thumbnails_done = 0
+        self.thumbnails_failed = 0
+        self.cancelled = False
+        self.finished = False
+        self._pool = None
+        self._pending = set()
+        self._submitted = set()
+        # Image cell entry -> asset reference, or None if it can't be read.
+        self._image_refs = {}
+
+    @property
+    def thumbnails_pending(self):
+        return len(self._pending)
+
+    @property
+    def fraction(self):
+        return self.source.fraction
+
+    def cancel(self):
+        self.cancelled = True
+
+    def status(self):
+        """One line on how far the import has got, for a progress display."""
+        status = f"{self.imported} cards imported"
+        if self.thumbnails_pending:
+            status += f", {self.thumbnails_pending} thumbnails left"
+        return status
+
+    def summary(self):
+        summary = (f"Imported {self.imported} cards into '{self.course}'.\n"
+                   f"Skipped {self.duplicates} duplicates and {self.invalid} invalid rows.")
+        return summary + format_errors(self.errors, self.invalid)
+
+    def run(self):
+        for _ in self.steps():
+            pass
+        return self
+
+    def steps(self):
+        if self.course not in self.engine.courses:
+            self.engine.add_course(self.course)
+        seen = {card_key(card) for card in self.engine.courses[self.course]}
+        batch = []
+        step_rows, step_deadline = 0, time.perf_counter() + IMPORT_STEP_SECONDS
+        try:
+            for location, fields in self.source:
+                if step_rows >= IMPORT_STEP_ROWS or time.perf_counter() >= step_deadline:
+                    yield
+                    step_rows, step_deadline = 0, time.perf_counter() + IMPORT_STEP_SECONDS
+                if self.cancelled:
+                    break
+                self.rows += 1
+                step_rows += 1
+                card, error = card_from_fields(fields, self._resolve_image)
+                if error is not None:
+                    self.invalid += 1
+                    if len(self.errors) < MAX_REPORTED_ERRORS:
+                        self.errors.append((location, error))
+                    continue
+                key = card_key(card)
+                if key in seen:
+                    self.duplicates += 1
+                    continue
+                seen.add(key)
+                batch.append(card)
+                if len(batch) >= self.batch_size:
+                    self._commit(batch)
+                    batch = []
+                    yield
+                    step_rows, step_deadline = 0, time.perf_counter() + IMPORT_STEP_SECONDS
+            if batch and not self.cancelled:
+                self._commit(batch)
+            while self._pending and not self.cancelled:
+                self._collect_thumbnails(THUMBNAIL_WAIT_SECONDS)
+                yield
+        finally:
+            self._shutdown()
+            self.finished = True
+
+    def _resolve_image(self, name):
+        # Large decks attach the same few images to many cards; ingest each once.
+        ref = self._image_refs.get(name, False)
+        if ref is False:
+            ref = self._image_refs[name] = self._ingest_image(name.strip())
+        return ref
+
+    def _ingest_image(self, name):
+        assets = self.engine.assets
+        if is_asset_ref(name):
+            return name if assets.exists(name) else None
+        path = os.path.normpath(os.path.join(self.source.base_dir, os.path.expanduser(name)))
+        try:
+            return assets.ingest(path)
+        except OSError:
+            return None
+
+    def _commit(self, batch):
+        self.engine.add_cards(self.course, batch)
+        self.imported += len(batch)
+        if self.thumbnail_store is not None:
+            for card in batch:
+                for path in card["question_imgs"] + card["answer_imgs"]:
+                    self._render_thumbnail(path)
+            self._collect_thumbnails(0)
+
+    def _render_thumbnail(self, ref):
+        if ref in self._submitted:
+            return
+        self._submitted.add(ref)
+        if self.thumbnail_store.has(ref, STUDY_IMAGE_SIZE):
+            return
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers)
+        self._pending.add(self._pool.submit(
+            prerender_thumbnail, self.thumbnail_store.directory, self.engine.assets.path(ref), STUDY_IMAGE_SIZE))
+
+    def _collect_thumbnails(self, timeout):
+        if not self._pending:
+            return
+        done, self._pending = wait(self._pending, timeout, FIRST_COMPLETED)
+        for future in done:
+            try:
+                self.thumbnail_store.add(*future.result())
+            except Exception:
+                # The image is decoded (and the error shown) when the card is studied.
+                self.thumbnails_failed += 1
+            else:
+                self.thumbnails_done += 1
+
+    def _shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=not self.cancelled, cancel_futures=self.cancelled)
+            self._pool = None
+        self._pending = set()
@@ -0,0 +1,265 @@
+"""
+Load test for the study server (flashcard_engine.py serve): thousands of
+simulated learners, each with their own session, studying over a pool of
+keep-alive connections to localhost. Every learner step asks for the
+next card, its answer, and grades it; cards with images also fetch them
+the way a browser would, revalidating with If-None-Match after the
+first time.
+
+    python flashcard_engine.py -f flashcards.json serve --port 8750 &
+    python flashcard_loadtest.py --port 8750 --course Biology --sessions 2000
+
+or have it generate a synthetic deck and start a server for it:
+
+    python flashcard_loadtest.py --serve --sessions 2000 --connections 200 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from flashcard_bench import generate_deck, summarize
+
+SERVER_START_TIMEOUT_SECONDS = 60
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection; requests on it go one at a time."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, payload=None, headers=None):
+        """Send a request and return (status, headers, body bytes)."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        head = [f"{method} {path} HTTP/1.1", f"Host: {self.host}", f"Content-Length: {len(body)}"]
+        head.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        self.writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await self.writer.drain()
+
+        lines = (await self.reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        status = int(lines[0].split(" ", 2)[1])
+        response_headers = {}
+        for line in lines[1:]:
+            if line:
+                name, value = line.split(":", 1)
+                response_headers[name.strip().lower()] = value.strip()
+        data = await self.reader.readexactly(int(response_headers.get("content-length", 0)))
+        if response_headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, response_headers, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class LoadTest:
+    def __init__(self, host, port, courses, sessions, connections, duration, mode, images):
+        self.host = host
+        self.port = port
+        self.courses = courses
+        self.session_count = sessions
+        self.connection_count = connections
+        self.duration = duration
+        self.mode = mode
+        self.fetch_images = images
+        # Operation name -> latencies in seconds
+        self.latencies = {}
+        self.errors = 0
+        self.steps = 0
+
+    async def timed(self, name, conn, method, path, payload=None, headers=None):
+        start = time.perf_counter()
+        try:
+            status, response_headers, data = await conn.request(method, path, payload, headers)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            conn.close()
+            self.errors += 1
+            return None, {}, None
+        self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+        if status >= 400:
+            self.errors += 1
+        return status, response_headers, data
+
+    async def run(self):
+        conns = [Connection(self.host, self.port) for _ in range(self.connection_count)]
+        # Sessions are shared out over the connections, as learners over a proxy would be.
+        session_ids = await asyncio.gather(*(
+            self._start_sessions(conn, range(n, self.session_count, self.connection_count))
+            for n, conn in enumerate(conns)
+        ))
+        start = time.perf_counter()
+        deadline = start + self.duration
+        await asyncio.gather(*(self._study(conn, ids, deadline) for conn, ids in zip(conns, session_ids)))
+        elapsed = time.perf_counter() - start
+        for conn in conns:
+            conn.close()
+        return elapsed
+
+    async def _start_sessions(self, conn, numbers):
+        ids = []
+        for _ in numbers:
+            status, _, data = await self.timed("start_session", conn, "POST", "/sessions")
+            if status == 201:
+                ids.append(json.loads(data)["session"])
+        return ids
+
+    async def _study(self, conn, session_ids, deadline):
+        rng = random.Random()
+        # ETags seen on this connection, like a browser's cache
+        etags = {}
+        while session_ids and time.perf_counter() < deadline:
+            for session_id in session_ids:
+                if time.perf_counter() >= deadline:
+                    return
+                mode = self.mode if self.mode != "mixed" else rng.choice(("shuffle", "srs"))
+                request = {"course": rng.choice(self.courses), "mode": mode}
+                status, _, data = await self.timed("next", conn, "POST", f"/sessions/{session_id}/next", request)
+                if status != 200:
+                    continue
+                card = json.loads(data)["card"]
+                if card is None:
+                    continue
+                for url in card["question_images"] if self.fetch_images else ():
+                    await self._fetch_image(conn, url, etags)
+                status, _, data = await self.timed("answer", conn, "GET", f"/sessions/{session_id}/answer")
+                if status == 200:
+                    for url in json.loads(data)["card"]["answer_images"] if self.fetch_images else ():
+                        await self._fetch_image(conn, url, etags)
+                await self.timed("grade", conn, "POST", f"/sessions/{session_id}/grade",
+                                 {"quality": rng.choice((1, 3, 4, 5))})
+                self.steps += 1
+
+    async def _fetch_image(self, conn, url, etags):
+        if url in etags:
+            await self.timed("image_revalidate", conn, "GET", url, headers={"If-None-Match": etags[url]})
+            return
+        status, headers, _ = await self.timed("image", conn, "GET", url)
+        if status == 200 and "etag" in headers:
+            etags[url] = headers["etag"]
+
+
+def start_server(args, directory):
+    """Generate a synthetic deck in directory and start a server for it; returns (process, port)."""
+    deck_path = generate_deck(directory, args.deck_courses, args.deck_cards, images_per_card=args.deck_images,
+                              image_size=(1200, 900), seed=args.seed)
+    engine_cli = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "flashcard_engine.py"),
+                  "-f", deck_path, "-b", "json"]
+    if args.deck_images:
+        # The server only serves images from the asset store.
+        subprocess.run(engine_cli + ["ingest-images"], check=True, stdout=subprocess.DEVNULL)
+    process = subprocess.Popen(engine_cli + ["serve", "--host", args.host, "--port", "0"],
+                               stdout=subprocess.PIPE, text=True)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        line = process.stdout.readline()
+        match = re.search(r":(\d+)\s*$", line)
+        if match:
+            return process, int(match.group(1))
+        if not line and process.poll() is not None:
+            break
+    process.kill()
+    raise RuntimeError("Server didn't start")
+
+
+def peak_rss(pid):
+    """Peak resident memory of a process in bytes, or None if it can't be read (Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+async def list_courses(host, port):
+    conn = Connection(host, port)
+    try:
+        _, _, data = await conn.request("GET", "/courses")
+    finally:
+        conn.close()
+    return [course["name"] for course in json.loads(data)["courses"] if course["cards"]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the flashcard study server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8750)
+    parser.add_argument("--course", action="append", help="course to study (default: all); may be repeated")
+    parser.add_argument("--sessions", type=int, default=2000, help="simulated learners")
+    parser.add_argument("--connections", type=int, default=200, help="keep-alive connections they share")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to study for")
+    parser.add_argument("--mode", choices=["shuffle", "srs", "mixed"], default="mixed")
+    parser.add_argument("--no-images", action="store_true", help="don't fetch card images")
+    parser.add_argument("--serve", action="store_true",
+                        help="generate a synthetic deck and start a server for it on a free port")
+    parser.add_argument("--deck-courses", type=int, default=5)
+    parser.add_argument("--deck-cards", type=int, default=2000, help="cards per course of the synthetic deck")
+    parser.add_argument("--deck-images", type=int, default=1, help="images per card side of the synthetic deck")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        process = None
+        port = args.port
+        if args.serve:
+            process, port = start_server(args, directory)
+        try:
+            courses = args.course or asyncio.run(list_courses(args.host, port))
+            if not courses:
+                print("No courses with cards to study", file=sys.stderr)
+                return 1
+            test = LoadTest(args.host, port, courses, args.sessions, args.connections,
+                            args.duration, args.mode, not args.no_images)
+            elapsed = asyncio.run(test.run())
+            server_rss = peak_rss(process.pid) if process is not None else None
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    requests = sum(len(samples) for samples in test.latencies.values())
+    report = {
+        "sessions": args.sessions,
+        "connections": args.connections,
+        "seconds": elapsed,
+        "requests": requests,
+        "requests_per_second": requests / elapsed,
+        "steps_per_second": test.steps / elapsed,
+        "errors": test.errors,
+        "server_peak_rss_bytes": server_rss,
+        "results": {name: summarize(samples) for name, samples in test.latencies.items()},
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+    print(f"{args.sessions} sessions over {args.connections} connections for {elapsed:.1f}s:"
+          f" {report['requests_per_second']:.0f} requests/s, {report['steps_per_second']:.0f} cards/s,"
+          f" {test.errors} errors")
+    for name, result in report["results"].items():
+        print(f"{name:20} n {result['n']:8}  median {result['median'] * 1000:8.2f}ms"
+              f"  p95 {result['p95'] * 1000:8.2f}ms  max {result['max'] * 1000:8.2f}ms")
+    if server_rss is not None:
+        print(f"server peak RSS {server_rss / 2**20:.1f}MB")
+    return 0 if not test.errors else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
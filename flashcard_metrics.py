@@ -0,0 +1,175 @@
+import functools
+import json
+import math
+import os
+import threading
+import time
+
+# Histogram buckets grow by this factor (about 9% wide), from MIN_SECONDS up.
+BUCKET_GROWTH = 2 ** 0.125
+MIN_SECONDS = 1e-6
+# A Tk main-loop gap longer than this counts as a stall.
+STALL_THRESHOLD_SECONDS = 0.1
+# Set to "1" to start with instrumentation enabled.
+METRICS_ENV_VAR = "FLASHCARD_METRICS"
+
+_LOG_GROWTH = math.log(BUCKET_GROWTH)
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed histogram of durations in seconds. Recording is O(1)
+    and memory stays fixed however many samples arrive; percentiles are
+    accurate to one bucket width.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._buckets = {}
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if seconds <= MIN_SECONDS:
+            bucket = 0
+        else:
+            bucket = int(math.log(seconds / MIN_SECONDS) / _LOG_GROWTH) + 1
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile (0-100)."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= rank:
+                return min(self.max, MIN_SECONDS * BUCKET_GROWTH ** bucket)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """
+    Per-phase latency histograms plus a count of main-loop stalls.
+
+    Code is instrumented with the timed() decorator or the phase()
+    context manager. While disabled, each costs one attribute check, so
+    instrumentation can stay in place and be switched on at runtime.
+    Safe to record from worker threads.
+    """
+
+    def __init__(self, enabled=False, stall_threshold=STALL_THRESHOLD_SECONDS):
+        self.enabled = enabled
+        self.stall_threshold = stall_threshold
+        self.stalls = 0
+        self.longest_stall = 0.0
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._started = time.time()
+
+    def record(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def record_loop_gap(self, seconds):
+        """Report how late a periodic Tk callback ran; long gaps count as stalls."""
+        if not self.enabled or seconds < self.stall_threshold:
+            return
+        with self._lock:
+            self.stalls += 1
+            self.longest_stall = max(self.longest_stall, seconds)
+
+    def timed(self, name):
+        """Decorator recording each call of a function under name."""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def phase(self, name):
+        """Context manager recording the time spent in its block under name."""
+        return _Phase(self, name) if self.enabled else _NO_PHASE
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self.stalls = 0
+            self.longest_stall = 0.0
+            self._started = time.time()
+
+    def snapshot(self):
+        """{"phases": {name: summary}, "stalls": ..., ...}, safe to serialize as JSON."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "since": self._started,
+                "stall_threshold": self.stall_threshold,
+                "stalls": self.stalls,
+                "longest_stall": self.longest_stall,
+                "phases": {name: h.summary() for name, h in sorted(self._histograms.items())},
+            }
+
+    def export(self, path):
+        """Write snapshot() to path as JSON."""
+        data = self.snapshot()
+        data["exported"] = time.time()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, path)
+
+
+class _Phase:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+# Shared by every module, so one switch controls all instrumentation.
+metrics = Metrics(enabled=os.environ.get(METRICS_ENV_VAR) == "1")
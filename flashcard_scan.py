@@ -0,0 +1,432 @@
+"""
+Integrity scan of the images cards show: every question_imgs and
+answer_imgs reference across all courses is checked on a thread pool,
+and the report lists the missing, corrupt and oversized ones with the
+cards that show them. Missing files are grouped by folder, and
+PrefixRelinker points cards back at their images after a deck's image
+folder has moved (e.g. to another drive) by swapping one folder prefix
+for another.
+
+Each distinct file is checked once, however many cards show it. A check
+stats the file and, with verify, decodes it at reduced scale (stored
+assets are also hashed again and compared with their name). Verified
+results are cached in <deck>.scan.json by path, mtime and size, so
+verifying again costs one stat per unchanged file. A scan without verify
+is no more than that stat, so it doesn't use the cache.
+"""
+import hashlib
+import json
+import os
+import re
+import stat
+from collections import Counter, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from flashcard_assets import COPY_CHUNK_BYTES, DIGEST_SIZE, is_asset_ref
+from flashcard_images import pil_image
+from flashcard_import import format_errors
+from flashcard_storage import atomic_write_bytes
+
+SCAN_CACHE_SUFFIX = ".scan.json"
+SCAN_CACHE_VERSION = 1
+# Threads checking files. Stats and decodes wait on the disk or run
+# outside the GIL, so there can be more of them than cores.
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# Files checked per task handed to a worker.
+SCAN_CHUNK = 256
+# How long one step waits for checks to finish.
+SCAN_WAIT_SECONDS = 0.05
+# Files larger than this, or (when decoded) with more pixels, are reported as oversized.
+OVERSIZED_BYTES = 10 * 1024 * 1024
+OVERSIZED_PIXELS = 40_000_000
+# Verifying decodes at about this size; JPEGs decode at reduced scale.
+VERIFY_DECODE_SIZE = (256, 256)
+# Cards changed per step (and per store change) while relinking.
+RELINK_STEP_CARDS = 1000
+# Folders listed in a scan summary.
+SUMMARY_FOLDERS = 5
+
+OK = "ok"
+MISSING = "missing"
+CORRUPT = "corrupt"
+OVERSIZED = "oversized"
+PROBLEMS = (MISSING, CORRUPT, OVERSIZED)
+
+# What a scan found out about one file; cached as a list in <deck>.scan.json.
+ImageCheck = namedtuple("ImageCheck", ["status", "mtime_ns", "size", "verified", "width", "height", "error"])
+
+
+def scan_cache_path(deck_path):
+    return os.path.splitext(deck_path)[0] + SCAN_CACHE_SUFFIX
+
+
+def check_image(path, verify=False, digest=None, cached=None):
+    """
+    Check the file behind an image reference and return an ImageCheck.
+    cached, an earlier check of the same path, is returned as is if the
+    file hasn't changed since (and was decoded then, if verify is set).
+    digest is the content hash an asset's contents must match.
+    """
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        return ImageCheck(MISSING, 0, 0, False, 0, 0, e.strerror or str(e))
+    if (cached is not None and cached.mtime_ns == st.st_mtime_ns and cached.size == st.st_size
+            and (cached.verified or not verify)):
+        return cached
+    if not stat.S_ISREG(st.st_mode):
+        return ImageCheck(CORRUPT, st.st_mtime_ns, st.st_size, verify, 0, 0, "not a file")
+
+    width = height = 0
+    error = None
+    if verify:
+        try:
+            width, height = verify_image(path, digest)
+        except Exception as e:
+            # Whatever the decoder trips over, the image can't be shown.
+            error = str(e) or type(e).__name__
+    if error is not None:
+        status = CORRUPT
+    elif st.st_size > OVERSIZED_BYTES or width * height > OVERSIZED_PIXELS:
+        status = OVERSIZED
+    else:
+        status = OK
+    return ImageCheck(status, st.st_mtime_ns, st.st_size, verify, width, height, error)
+
+
+def verify_image(path, digest=None):
+    """Decode an image file at reduced scale and return its full size; raises if it's damaged."""
+    if digest is not None:
+        hasher = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(COPY_CHUNK_BYTES)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+        if hasher.hexdigest() != digest:
+            raise ValueError("contents don't match the stored asset's hash")
+    with pil_image().open(path) as img:
+        size = img.size
+        if size[0] * size[1] <= OVERSIZED_PIXELS:
+            # Oversized images are reported without spending the memory to decode them.
+            img.draft(None, VERIFY_DECODE_SIZE)
+            img.load()
+    return size
+
+
+class AssetScanner:
+    """
+    Checks every image the deck's cards refer to (see the module docstring).
+
+    steps() reads a course's references per step, then hands the files
+    to the thread pool in chunks and collects the results a step at a
+    time, so the Tk loop can run it like an import; run() drives it to
+    the end for the command line. Afterwards results maps each reference
+    to its ImageCheck, problems[MISSING|CORRUPT|OVERSIZED] lists the
+    references with that problem, and cards_by_ref gives the
+    (course, card id) of every card showing a reference.
+    """
+
+    def __init__(self, engine, verify=False, cache_path=None, workers=SCAN_WORKERS):
+        self.engine = engine
+        self.verify = verify
+        self.cache_path = cache_path or scan_cache_path(engine.store.path)
+        self.workers = workers
+        # Image reference -> [(course, card id), ...]
+        self.cards_by_ref = {}
+        self.results = {}
+        self.problems = {problem: [] for problem in PROBLEMS}
+        self.cards = 0
+        self.unchanged = 0
+        self.cancelled = False
+        self.finished = False
+        self._courses_read = 0
+
+    @property
+    def fraction(self):
+        courses = len(self.engine.courses)
+        if self._courses_read < courses:
+            # Reading the references is quick next to checking the files.
+            return 0.05 * self._courses_read / courses
+        return 0.05 + 0.95 * len(self.results) / len(self.cards_by_ref) if self.cards_by_ref else 1.0
+
+    def cancel(self):
+        self.cancelled = True
+
+    def status(self):
+        if not self.results:
+            return f"{self.cards} cards read"
+        return f"{len(self.results)} of {len(self.cards_by_ref)} images checked"
+
+    def summary(self):
+        checked = "checked and decoded" if self.verify else "checked"
+        unchanged = f" ({self.unchanged} unchanged since the last check)" if self.verify else ""
+        summary = (f"{len(self.results)} images on {self.cards} cards {checked}{unchanged}.\n"
+                   f"{len(self.problems[MISSING])} missing, {len(self.problems[CORRUPT])} corrupt"
+                   f" and {len(self.problems[OVERSIZED])} oversized images"
+                   f" on {self.problem_card_count()} cards.")
+        folders = self.missing_folders()
+        if folders:
+            summary += "\n\nMissing images by folder:\n" + "\n".join(
+                f"{folder}: {count}" for folder, count in folders[:SUMMARY_FOLDERS])
+        errors = [(ref, f"{problem}: {self.results[ref].error or format_size(self.results[ref])}")
+                  for problem in PROBLEMS for ref in self.problems[problem]]
+        return summary + format_errors(errors, len(errors))
+
+    def run(self):
+        for _ in self.steps():
+            pass
+        return self
+
+    def steps(self):
+        for course in self.engine.course_names():
+            if self.cancelled:
+                return
+            self._read_course(course)
+            yield
+
+        cache = self._read_cache() if self.verify else {}
+        assets = self.engine.assets
+        pool = ThreadPoolExecutor(self.workers, thread_name_prefix="asset-scan")
+        pending = set()
+        try:
+            refs = list(self.cards_by_ref)
+            for start in range(0, len(refs), SCAN_CHUNK):
+                chunk = []
+                for ref in refs[start:start + SCAN_CHUNK]:
+                    path = assets.path(ref)
+                    chunk.append((ref, path, assets.digest(ref) if self.verify else None, cache.get(path)))
+                pending.add(pool.submit(self._check_chunk, chunk))
+            while pending and not self.cancelled:
+                done, pending = wait(pending, SCAN_WAIT_SECONDS, FIRST_COMPLETED)
+                for future in done:
+                    for ref, check, unchanged in future.result():
+                        self.results[ref] = check
+                        self.unchanged += unchanged
+                yield
+        finally:
+            pool.shutdown(wait=not self.cancelled, cancel_futures=True)
+        if self.cancelled:
+            return
+        for ref, check in self.results.items():
+            if check.status != OK:
+                self.problems[check.status].append(ref)
+        for refs in self.problems.values():
+            refs.sort()
+        if self.verify:
+            self._write_cache()
+        self.finished = True
+
+    def problem_card_count(self):
+        """Cards showing at least one missing, corrupt or oversized image."""
+        return len({card for refs in self.problems.values() for ref in refs for card in self.cards_by_ref[ref]})
+
+    def missing_folders(self):
+        """[(folder, missing files in it)], most first: where relinking would help most."""
+        folders = Counter(os.path.dirname(ref) for ref in self.problems[MISSING] if not is_asset_ref(ref))
+        return folders.most_common()
+
+    def report(self):
+        """Everything found, as plain data for writing out as JSON."""
+        def entries(problem):
+            return [dict(self.results[ref]._asdict(), ref=ref, cards=self.cards_by_ref[ref])
+                    for ref in self.problems[problem]]
+        return {
+            "images": len(self.results),
+            "cards": self.cards,
+            "verified": self.verify,
+            "unchanged": self.unchanged,
+            "problem_cards": self.problem_card_count(),
+            "missing_folders": self.missing_folders(),
+            **{problem: entries(problem) for problem in PROBLEMS},
+        }
+
+    def _read_course(self, course):
+        cards_by_ref = self.cards_by_ref
+        for card in self.engine.courses[course]:
+            self.cards += 1
+            key = (course, card.id)
+            for ref in card.question_imgs + card.answer_imgs:
+                cards = cards_by_ref.get(ref)
+                if cards is None:
+                    cards_by_ref[ref] = [key]
+                elif cards[-1] != key:
+                    cards.append(key)
+        if course != self.engine.current_course:
+            self.engine.store.release_course(course)
+        self._courses_read += 1
+
+    def _check_chunk(self, chunk):
+        results = []
+        for ref, path, digest, cached in chunk:
+            check = check_image(path, self.verify, digest, cached)
+            results.append((ref, check, check is cached))
+        return results
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+            if cache.get("version") == SCAN_CACHE_VERSION:
+                return {path: ImageCheck(*entry) for path, entry in cache["files"].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass
+        # Missing or damaged: every file is checked from scratch.
+        return {}
+
+    def _write_cache(self):
+        assets = self.engine.assets
+        files = {assets.path(ref): check for ref, check in self.results.items() if check.status != MISSING}
+        data = json.dumps({"version": SCAN_CACHE_VERSION, "files": files}, separators=(",", ":"))
+        try:
+            atomic_write_bytes(self.cache_path, data.encode("utf-8"))
+        except OSError:
+            # The cache only saves time on the next scan.
+            pass
+
+
+def format_size(check):
+    size = f"{check.size / 2**20:.1f}MB"
+    if check.width:
+        size += f", {check.width}x{check.height}"
+    return size
+
+
+def split_prefix(path, prefix):
+    """The rest of path below the folder prefix (without a leading separator), or None."""
+    prefix = prefix.rstrip("/\\")
+    if not path.startswith(prefix) or len(path) == len(prefix) or path[len(prefix)] not in "/\\":
+        return None
+    return path[len(prefix) + 1:]
+
+
+class PrefixRelinker:
+    """
+    Points cards' image paths under one folder (old_prefix) at the same
+    files under another (new_prefix), e.g. after the images moved to
+    another drive. Only paths whose new file exists are changed; whether
+    they do is checked on a thread pool. Asset references never move
+    and are left alone. Runs as steps() like AssetScanner.
+    """
+
+    def __init__(self, engine, old_prefix, new_prefix, dry_run=False, workers=SCAN_WORKERS):
+        self.engine = engine
+        self.old_prefix = old_prefix
+        self.new_prefix = new_prefix
+        self.dry_run = dry_run
+        self.workers = workers
+        self.matched = 0
+        self.relinked = 0
+        self.not_found = 0
+        self.cards_updated = 0
+        self.cancelled = False
+        self.finished = False
+        # Old path -> new path for the files found under new_prefix
+        self._moves = {}
+        self._courses_read = 0
+        self._courses_done = 0
+
+    @property
+    def fraction(self):
+        courses = len(self.engine.courses) or 1
+        return 0.5 * (self._courses_read + self._courses_done) / courses
+
+    def cancel(self):
+        self.cancelled = True
+
+    def status(self):
+        if self._courses_read < len(self.engine.courses):
+            return f"{self.matched} images under {self.old_prefix} so far"
+        if not self._courses_done and not self.cards_updated:
+            return f"Looking for {self.matched} images under {self.new_prefix}"
+        return f"{self.cards_updated} cards updated"
+
+    def summary(self):
+        verb = "Would relink" if self.dry_run else "Relinked"
+        summary = (f"{verb} {self.relinked} of {self.matched} images under {self.old_prefix}"
+                   f" on {self.cards_updated} cards to {self.new_prefix}.")
+        if self.not_found:
+            summary += f"\n{self.not_found} images weren't found there and were left as they were."
+        return summary
+
+    def run(self):
+        for _ in self.steps():
+            pass
+        return self
+
+    def new_path(self, path):
+        rest = split_prefix(path, self.old_prefix)
+        if rest is None:
+            return None
+        # The deck may have moved between systems with different separators.
+        return os.path.join(self.new_prefix, *[part for part in re.split(r"[\\/]+", rest) if part])
+
+    def steps(self):
+        candidates = {}
+        for course in self.engine.course_names():
+            if self.cancelled:
+                return
+            for card in self.engine.courses[course]:
+                for path in card.question_imgs + card.answer_imgs:
+                    if path not in candidates and not is_asset_ref(path):
+                        new_path = self.new_path(path)
+                        if new_path is not None:
+                            candidates[path] = new_path
+            if course != self.engine.current_course:
+                self.engine.store.release_course(course)
+            self.matched = len(candidates)
+            self._courses_read += 1
+            yield
+
+        moves = list(candidates.items())
+        pool = ThreadPoolExecutor(self.workers, thread_name_prefix="relink")
+        pending = {pool.submit(self._found_moves, moves[start:start + SCAN_CHUNK])
+                   for start in range(0, len(moves), SCAN_CHUNK)}
+        try:
+            while pending and not self.cancelled:
+                done, pending = wait(pending, SCAN_WAIT_SECONDS, FIRST_COMPLETED)
+                for future in done:
+                    self._moves.update(future.result())
+                yield
+        finally:
+            pool.shutdown(wait=not self.cancelled, cancel_futures=True)
+        self.relinked = len(self._moves)
+        self.not_found = self.matched - self.relinked
+
+        for course in self.engine.course_names():
+            if self.cancelled:
+                return
+            if self._moves:
+                yield from self._relink_course(course)
+            self._courses_done += 1
+        self.finished = True
+
+    def _update_cards(self, course, batch):
+        # One store change per batch, not one (and one fsync) per card.
+        if batch and not self.dry_run:
+            self.engine.update_cards(course, batch)
+
+    @staticmethod
+    def _found_moves(moves):
+        return [(path, new_path) for path, new_path in moves if os.path.isfile(new_path)]
+
+    def _relink_course(self, course):
+        moves = self._moves
+        batch = []
+        for card in list(self.engine.courses[course]):
+            question_imgs = [moves.get(path, path) for path in card.question_imgs]
+            answer_imgs = [moves.get(path, path) for path in card.answer_imgs]
+            if question_imgs == list(card.question_imgs) and answer_imgs == list(card.answer_imgs):
+                continue
+            batch.append(dict(card, question_imgs=question_imgs, answer_imgs=answer_imgs))
+            self.cards_updated += 1
+            if len(batch) >= RELINK_STEP_CARDS:
+                self._update_cards(course, batch)
+                batch = []
+                yield
+                if self.cancelled:
+                    return
+        self._update_cards(course, batch)
+        if course != self.engine.current_course:
+            self.engine.store.release_course(course)
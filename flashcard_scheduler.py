@@ -0,0 +1,177 @@
+import heapq
+import random
+
+# SM-2 parameters
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+DAY_SECONDS = 24 * 60 * 60
+# A failed card comes back after this many seconds instead of a full day.
+RELEARN_DELAY_SECONDS = 10 * 60
+# Answers graded below this quality count as forgotten.
+PASS_QUALITY = 3
+
+# (button text, SM-2 quality 0-5)
+GRADES = (
+    ("Again", 1),
+    ("Hard", 3),
+    ("Good", 4),
+    ("Easy", 5),
+)
+
+
+def card_due(card):
+    """When a card is next due (epoch seconds). Cards never reviewed are due at 0."""
+    review = card.get("review")
+    return review["due"] if review else 0
+
+
+def schedule_review(review, quality, now):
+    """
+    Return the review state after answering a card with quality 0-5,
+    following SM-2. review is the card's previous state (or None).
+    """
+    review = review or {}
+    ease = review.get("ease", DEFAULT_EASE)
+    reps = review.get("reps", 0)
+    interval = review.get("interval", 0)
+
+    if quality < PASS_QUALITY:
+        reps = 0
+        interval = 0
+        due = now + RELEARN_DELAY_SECONDS
+    else:
+        if reps == 0:
+            interval = 1
+        elif reps == 1:
+            interval = 6
+        else:
+            interval = max(interval + 1, round(interval * ease))
+        reps += 1
+        due = now + interval * DAY_SECONDS
+
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return {"ease": round(ease, 3), "interval": interval, "reps": reps, "due": due}
+
+
+class ReviewQueue:
+    """
+    Card ids of one course ordered by due time, in a binary heap.
+
+    peek() and reschedule() are O(log n). Rescheduling pushes a new entry
+    and leaves the old one in place; stale entries are recognised (their
+    due time no longer matches) and dropped when they reach the top.
+    """
+
+    def __init__(self, cards):
+        self._due = {}
+        self._heap = []
+        for card in cards:
+            due = card_due(card)
+            self._due[card.id] = due
+            self._heap.append((due, card.id))
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._due)
+
+    def peek(self):
+        """Return (card_id, due) of the card due soonest, or None if empty."""
+        heap = self._heap
+        while heap:
+            due, card_id = heap[0]
+            if self._due.get(card_id) == due:
+                return card_id, due
+            heapq.heappop(heap)
+        return None
+
+    def reschedule(self, card_id, due):
+        """Add a card, or move an existing card to a new due time."""
+        self._due[card_id] = due
+        heapq.heappush(self._heap, (due, card_id))
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._rebuild()
+
+    def remove(self, card_id):
+        """Forget a deleted card; its heap entries are dropped as they surface."""
+        self._due.pop(card_id, None)
+
+    def _rebuild(self):
+        self._heap = [(due, card_id) for card_id, due in self._due.items()]
+        heapq.heapify(self._heap)
+
+
+class ShuffleBag:
+    """
+    One pass over a course's cards in random order, without repeats.
+
+    The cards not drawn yet are kept in random order, drawn from the end.
+    A card added mid-pass is swapped into a random place among them and
+    a deleted one is swapped out (a position map makes both O(1)), so
+    changing the deck never reshuffles the pass or resets its progress.
+    """
+
+    def __init__(self, card_ids=(), seen=0, shuffle=True):
+        self._remaining = list(card_ids)
+        if shuffle:
+            random.shuffle(self._remaining)
+        self._position = {card_id: i for i, card_id in enumerate(self._remaining)}
+        # Cards drawn so far this pass.
+        self.seen = seen
+
+    def __len__(self):
+        """Cards still to come in this pass."""
+        return len(self._remaining)
+
+    @property
+    def total(self):
+        """Cards in this pass, drawn or not."""
+        return self.seen + len(self._remaining)
+
+    def draw(self):
+        """Take the next card id, or None once the pass is over."""
+        if not self._remaining:
+            return None
+        card_id = self._remaining.pop()
+        del self._position[card_id]
+        self.seen += 1
+        return card_id
+
+    def peek(self, count):
+        """The next few card ids draw() will return, in order."""
+        return self._remaining[:-count - 1:-1]
+
+    def add(self, card_id):
+        """Put a new card at a random place among the cards still to come."""
+        remaining = self._remaining
+        i = random.randint(0, len(remaining))
+        remaining.append(card_id)
+        self._position[card_id] = len(remaining) - 1
+        if i < len(remaining) - 1:
+            self._swap(i, len(remaining) - 1)
+
+    def remove(self, card_id):
+        """Take a deleted card out of the pass, drawn or not."""
+        i = self._position.pop(card_id, None)
+        if i is None:
+            # Already drawn this pass.
+            self.seen = max(0, self.seen - 1)
+            return
+        last = self._remaining.pop()
+        if i < len(self._remaining):
+            self._remaining[i] = last
+            self._position[last] = i
+
+    def to_json(self):
+        return {"remaining": list(self._remaining), "seen": self.seen}
+
+    @classmethod
+    def from_json(cls, data, cards):
+        """Restore a saved pass, dropping cards that no longer exist."""
+        remaining = [card_id for card_id in data.get("remaining", []) if card_id in cards]
+        return cls(remaining, data.get("seen", 0), shuffle=False)
+
+    def _swap(self, i, j):
+        remaining = self._remaining
+        remaining[i], remaining[j] = remaining[j], remaining[i]
+        self._position[remaining[i]] = i
+        self._position[remaining[j]] = j
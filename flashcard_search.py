@@ -0,0 +1,196 @@
+import heapq
+import math
+import re
+import sys
+from bisect import bisect_left, insort
+from collections import Counter, namedtuple
+
+# Matches in the question count for more than matches in the answer.
+QUESTION_WEIGHT = 2
+ANSWER_WEIGHT = 1
+# A last word shorter than this matches exactly rather than as a prefix,
+# so typing the first letter doesn't pull in most of the vocabulary.
+MIN_PREFIX_LENGTH = 2
+# Cards indexed per build_steps() step.
+BUILD_CHUNK_SIZE = 2000
+
+TOKEN_RE = re.compile(r"\w+")
+
+# Term weight -> posting weight; repeats of a word are dampened logarithmically.
+DAMPED_WEIGHTS = [0.0] + [1.0 + math.log(n) for n in range(1, 256)]
+
+SearchHit = namedtuple("SearchHit", ["course", "card_id", "score", "question", "answer"])
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+class SearchIndex:
+    """
+    Inverted index over the question and answer text of every card.
+
+    Each card is a document with an internal id; term -> {doc_id: weight}
+    postings make a lookup cost proportional to the matching cards, not
+    the deck. The last word of a query is treated as a prefix, expanded
+    through a sorted term list with bisect. Results are ranked by
+    weighted term frequency times inverse document frequency.
+
+    The index follows the deck through apply_record(), which accepts the
+    same mutation records as the storage backends. It can be built a
+    chunk at a time with build_steps(); records that arrive meanwhile
+    are only applied to cards already indexed, and the build reads
+    the rest as they are when it gets to them.
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._terms = []
+        # doc_id -> (course, card_id, question, answer, terms)
+        self._docs = {}
+        # course -> {card_id: doc_id}
+        self._course_docs = {}
+        self._next_doc_id = 0
+        # True once every course is indexed and self._terms is sorted.
+        self.ready = False
+
+    def __len__(self):
+        return len(self._docs)
+
+    def build(self, courses):
+        for _ in self.build_steps(courses, chunk_size=sys.maxsize):
+            pass
+
+    def build_steps(self, courses, chunk_size=BUILD_CHUNK_SIZE):
+        """Index every course, yielding after each chunk of cards."""
+        for course in list(courses):
+            if course in self._course_docs:
+                # Added through apply_record() since the build started.
+                continue
+            docs = self._course_docs[course] = {}
+            cards = courses[course]
+            # Cards added from here on are indexed by apply_record().
+            card_ids = cards.ids()
+            for start in range(0, len(card_ids), chunk_size):
+                for card_id in card_ids[start:start + chunk_size]:
+                    card = cards.get(card_id)
+                    if card is not None and card_id not in docs:
+                        docs[card_id] = self._add_doc(course, card)
+                yield
+        # Sorting once is far cheaper than inserting each new term in order.
+        self._terms = sorted(self._postings)
+        self.ready = True
+
+    def apply_record(self, record):
+        op = record["op"]
+        course = record["course"]
+        if op == "add_course":
+            self._course_docs.setdefault(course, {})
+            return
+        docs = self._course_docs.get(course)
+        if docs is None:
+            # Not reached by build_steps() yet; it will read the current cards.
+            return
+        if op == "add_card":
+            card = record["card"]
+            docs[card["id"]] = self._add_doc(course, card)
+        elif op == "add_cards":
+            # Merge a batch's new terms in one sort instead of one insort each.
+            new_terms = [] if self.ready else None
+            for card in record["cards"]:
+                docs[card["id"]] = self._add_doc(course, card, new_terms)
+            if new_terms:
+                self._terms.extend(new_terms)
+                self._terms.sort()
+        elif op == "update_card" and record["id"] in docs:
+            self._remove_doc(docs[record["id"]])
+            docs[record["id"]] = self._add_doc(course, record["card"])
+        elif op == "update_cards":
+            for card in record["cards"]:
+                if card["id"] in docs:
+                    self._remove_doc(docs[card["id"]])
+                    docs[card["id"]] = self._add_doc(course, card)
+        elif op == "delete_card" and record["id"] in docs:
+            self._remove_doc(docs.pop(record["id"]))
+
+    def search(self, query, limit=50):
+        """Return up to limit SearchHits for cards matching every word of query."""
+        words = tokenize(query)
+        if not words or not self.ready:
+            return []
+        # The word being typed matches as a prefix; earlier ones must match exactly.
+        if query[-1:].isspace():
+            prefix = None
+        else:
+            prefix = words.pop()
+
+        scores = None
+        groups = [[word] for word in words]
+        if prefix is not None:
+            groups.append(self._expand_prefix(prefix))
+        # Intersect rarest first so the candidate set stays small.
+        groups.sort(key=lambda terms: sum(len(self._postings.get(t, ())) for t in terms))
+        total = len(self._docs) or 1
+        for terms in groups:
+            matched = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + total / len(postings))
+                for doc_id, weight in postings.items():
+                    if scores is not None and doc_id not in scores:
+                        continue
+                    score = weight * idf
+                    if score > matched.get(doc_id, 0.0):
+                        matched[doc_id] = score
+            if scores is None:
+                scores = matched
+            else:
+                scores = {doc_id: scores[doc_id] + score for doc_id, score in matched.items()}
+            if not scores:
+                return []
+
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        hits = []
+        for doc_id, score in best:
+            course, card_id, question, answer, _ = self._docs[doc_id]
+            hits.append(SearchHit(course, card_id, score, question, answer))
+        return hits
+
+    def _expand_prefix(self, prefix):
+        if len(prefix) < MIN_PREFIX_LENGTH:
+            return [prefix]
+        start = bisect_left(self._terms, prefix)
+        end = bisect_left(self._terms, prefix + "\uffff", start)
+        return self._terms[start:end]
+
+    def _add_doc(self, course, card, new_terms=None):
+        doc_id = self._next_doc_id
+        self._next_doc_id += 1
+        question = card.get("question", "")
+        answer = card.get("answer", "")
+        weights = Counter(tokenize(question) * QUESTION_WEIGHT)
+        weights.update(tokenize(answer) * ANSWER_WEIGHT)
+        all_postings = self._postings
+        for term, weight in weights.items():
+            postings = all_postings.get(term)
+            if postings is None:
+                postings = all_postings[term] = {}
+                if new_terms is not None:
+                    new_terms.append(term)
+                elif self.ready:
+                    insort(self._terms, term)
+            postings[doc_id] = DAMPED_WEIGHTS[weight] if weight < 256 else 1.0 + math.log(weight)
+        self._docs[doc_id] = (course, card["id"], question, answer, tuple(weights))
+        return doc_id
+
+    def _remove_doc(self, doc_id):
+        _, _, _, _, terms = self._docs.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+                if self.ready:
+                    del self._terms[bisect_left(self._terms, term)]
@@ -0,0 +1,636 @@
+"""
+Headless study server: serves a deck over a small HTTP/JSON API on
+asyncio, so a whole class can study the same courses from a browser or
+script while each learner keeps their own progress.
+
+    GET    /courses                        course names and card counts
+    POST   /sessions                       start a session -> {"session": id}
+    GET    /sessions/<id>                  the session's progress
+    DELETE /sessions/<id>                  end a session
+    POST   /sessions/<id>/next             {"course", "mode": "shuffle"|"srs"} -> the next card's question side
+    GET    /sessions/<id>/answer           the current card's answer side
+    POST   /sessions/<id>/grade            {"quality": 0-5} -> the card's new review state
+    GET    /images/<asset>?size=study      an image resized for display (or size=preview)
+
+All sessions read the one DeckEngine loaded at startup; the server never
+changes the deck. Each session has its own shuffled pass and its own
+spaced repetition state per course, so learners don't disturb each
+other. The passes are all read from one shuffled order per course, made
+at startup: a session keeps only where it starts and how far it steps
+through that order, not a list of cards. Grades are appended to a review log next to the deck in batches
+(one write per SERVER_SAVE_DELAY_SECONDS however many learners graded),
+and replayed at startup so a session's reviews survive a restart; its
+place in a shuffled pass doesn't. Sessions left idle are dropped the same
+way: their reviews are kept and come back on the session's next request.
+Sessions not resumed within RESTORABLE_SESSION_SECONDS (or beyond the
+MAX_RESTORABLE_SESSIONS used most recently) are forgotten, as are ended
+ones, and the log is rewritten with just the reviews kept once most of
+its lines are stale.
+
+Images are served only from the deck's asset store, resized through the
+ThumbnailStore and cached encoded in memory. Their URLs name the content,
+so responses are marked immutable and revalidated by ETag.
+"""
+import asyncio
+import heapq
+import io
+import json
+import logging
+import math
+import os
+import random
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from flashcard_assets import ASSET_PREFIX, is_asset_ref
+from flashcard_images import PREVIEW_IMAGE_SIZE, STUDY_IMAGE_SIZE
+from flashcard_scheduler import schedule_review
+from flashcard_storage import BackgroundSaver
+
+logger = logging.getLogger(__name__)
+
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8750
+# Reviews graded within this long of each other are written together.
+SERVER_SAVE_DELAY_SECONDS = 0.5
+REVIEW_LOG_SUFFIX = ".reviews.jsonl"
+# Sessions nobody has used for this long are dropped (their reviews are kept for restoring).
+SESSION_IDLE_SECONDS = 30 * 60
+SESSION_SWEEP_SECONDS = 60
+# Swept and logged sessions can be resumed for this long after their last use, and at
+# most this many are kept (the longest unused are forgotten first).
+RESTORABLE_SESSION_SECONDS = 30 * 24 * 60 * 60
+MAX_RESTORABLE_SESSIONS = 10000
+# The review log is rewritten with one line per review kept once it has at least this
+# many lines and more than REVIEW_LOG_COMPACT_RATIO times as many as reviews kept.
+REVIEW_LOG_COMPACT_MIN_LINES = 10000
+REVIEW_LOG_COMPACT_RATIO = 2
+# Pending connections the listening socket queues up.
+LISTEN_BACKLOG = 4096
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 64 * 1024
+# Threads resizing and encoding images, off the event loop.
+IMAGE_WORKERS = 4
+# Encoded images kept in memory for re-serving.
+IMAGE_RESPONSE_CACHE_BYTES = 64 * 1024 * 1024
+IMAGE_SIZES = {"study": STUDY_IMAGE_SIZE, "preview": PREVIEW_IMAGE_SIZE}
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+ASSET_NAME = re.compile(r"^[0-9a-f]{32}(\.[0-9a-z]+)?$")
+SHUFFLE = "shuffle"
+SRS = "srs"
+
+STATUS_TEXT = {
+    200: "OK", 201: "Created", 204: "No Content", 304: "Not Modified", 400: "Bad Request",
+    404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+    431: "Request Header Fields Too Large", 500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class SessionPass:
+    """
+    A session's walk through a course's shared shuffled order: from a
+    random start, in steps of a random stride coprime to the number of
+    cards, so it visits every card once in an order of its own while
+    storing only a few numbers.
+    """
+
+    __slots__ = ("start", "stride", "seen", "total")
+
+    def __init__(self, total):
+        self.start = random.randrange(total) if total else 0
+        self.stride = random_stride(total)
+        # Cards drawn so far this pass.
+        self.seen = 0
+        self.total = total
+
+    def peek(self, order):
+        """The card id draw() will return next, or None once the pass is over."""
+        if self.seen >= self.total:
+            return None
+        return order[(self.start + self.seen * self.stride) % self.total]
+
+    def draw(self, order):
+        card_id = self.peek(order)
+        if card_id is not None:
+            self.seen += 1
+        return card_id
+
+
+class StudySession:
+    """
+    One learner's progress. Per course: a shuffled pass (a SessionPass),
+    their review state by card id, a heap of (due, card id) for the
+    cards they have reviewed, and a second SessionPass over which
+    spaced repetition mode picks the cards they haven't reviewed once
+    nothing is due. Memory grows with what the learner has done, not
+    with the deck.
+    """
+
+    __slots__ = ("id", "passes", "reviews", "due", "new_cards", "course", "card_id", "reviewed", "last_used")
+
+    def __init__(self, session_id):
+        self.id = session_id
+        self.passes = {}
+        self.reviews = {}
+        self.due = {}
+        self.new_cards = {}
+        self.course = None
+        self.card_id = None
+        self.reviewed = 0
+        self.last_used = time.monotonic()
+
+    def set_review(self, course, card_id, review):
+        self.reviews.setdefault(course, {})[card_id] = review
+        heapq.heappush(self.due.setdefault(course, []), (review["due"], card_id))
+
+    def next_due(self, course, now):
+        """The reviewed card due first and when, dropping heap entries a later grade replaced."""
+        heap = self.due.get(course)
+        reviews = self.reviews.get(course, {})
+        while heap:
+            due, card_id = heap[0]
+            if reviews.get(card_id, {}).get("due") == due:
+                return card_id, due
+            heapq.heappop(heap)
+        return None, None
+
+    def next_new(self, course, order):
+        """The first card in this session's order of new cards it hasn't reviewed, or None."""
+        new_cards = self.new_cards.get(course)
+        if new_cards is None:
+            new_cards = self.new_cards[course] = SessionPass(len(order))
+        reviews = self.reviews.get(course, {})
+        while True:
+            # Peeked, not drawn: a new card stays new until it's graded.
+            card_id = new_cards.peek(order)
+            if card_id is None or card_id not in reviews:
+                return card_id
+            new_cards.seen += 1
+
+    def progress(self):
+        return {
+            "session": self.id,
+            "course": self.course,
+            "reviewed": self.reviewed,
+            "courses": {
+                course: {"seen": p.seen, "total": p.total} for course, p in self.passes.items()
+            },
+        }
+
+
+class StudyServer:
+    """
+    Serves engine's deck to many sessions at once. start() binds the
+    socket and returns the asyncio Server; close() writes outstanding
+    reviews. thumbnail_store resizes the images served (it is only
+    read from threads in self._image_pool).
+    """
+
+    def __init__(self, engine, thumbnail_store, host=SERVER_HOST, port=SERVER_PORT,
+                 save_delay=SERVER_SAVE_DELAY_SECONDS):
+        self.engine = engine
+        self.thumbnail_store = thumbnail_store
+        self.host = host
+        self.port = port
+        self.sessions = {}
+        self.requests = 0
+        self.review_log_path = os.path.splitext(engine.store.path)[0] + REVIEW_LOG_SUFFIX
+        # {session id: (time last used, {course: {card id: review}})} from the log or of
+        # idle sessions swept since, least recently used first; restored on the session's
+        # next request.
+        self._logged_reviews = OrderedDict()
+        # Lines in the review log, written or pending.
+        self._log_lines = 0
+        self._read_review_log()
+        self._forget_expired_sessions(time.time())
+        # Review log lines not written yet, and the whole log to write in place of the
+        # file after compaction; both taken by the saver thread.
+        self._pending_reviews = []
+        self._log_rewrite = None
+        self._pending_lock = threading.Lock()
+        self._saver = BackgroundSaver(self._write_reviews, save_delay)
+        self._image_pool = ThreadPoolExecutor(IMAGE_WORKERS, thread_name_prefix="image")
+        # (asset name, size name) -> (content type, ETag, bytes), least recently used first.
+        self._images = OrderedDict()
+        self._image_bytes = 0
+        self._server = None
+        self._sweeper = None
+        self._courses_body = None
+        # Course -> its card ids in one shuffled order, read by every session's passes.
+        self._orders = {}
+
+    async def start(self):
+        # Lazily loaded courses are loaded once here and then shared by every session.
+        for course in self.engine.courses:
+            self._orders[course] = order = self.engine.courses[course].ids()
+            random.shuffle(order)
+        self._courses_body = json.dumps({"courses": [
+            {"name": name, "cards": len(cards)} for name, cards in self.engine.courses.items()
+        ]}).encode("utf-8")
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, backlog=LISTEN_BACKLOG, limit=MAX_HEADER_BYTES
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._sweeper = asyncio.get_running_loop().create_task(self._sweep_sessions())
+        return self._server
+
+    async def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        if self._server is not None:
+            # Stops accepting; wait_closed() would wait for every keep-alive client to hang up.
+            self._server.close()
+        self._image_pool.shutdown()
+        # Writing the last batch may wait on fsync; keep the loop free meanwhile.
+        await asyncio.get_running_loop().run_in_executor(None, self._saver.close)
+
+    # ================================================================
+    # HTTP
+    # ================================================================
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    # Closed between requests
+                    break
+                except asyncio.LimitOverrunError:
+                    self._write_response(writer, 431, {"error": "Headers too large"}, keep_alive=False)
+                    break
+                try:
+                    method, target, version, headers = parse_request_head(head)
+                    length = int(headers.get("content-length", 0))
+                    if length < 0:
+                        raise ValueError("negative Content-Length")
+                except ValueError:
+                    self._write_response(writer, 400, {"error": "Malformed request"}, keep_alive=False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    self._write_response(writer, 413, {"error": "Body too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                self.requests += 1
+                try:
+                    status, payload, extra_headers = await self._dispatch(method, target, headers, body)
+                except HTTPError as e:
+                    status, payload, extra_headers = e.status, {"error": str(e)}, None
+                except Exception:
+                    # A bug shouldn't cost the client its connection without an answer.
+                    logger.exception("Error handling %s %s", method, target)
+                    status, payload, extra_headers = 500, {"error": "Internal server error"}, None
+                self._write_response(writer, status, payload, extra_headers, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _write_response(self, writer, status, payload, extra_headers=None, keep_alive=True):
+        headers = dict(extra_headers or {})
+        if isinstance(payload, (dict, list)):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        else:
+            body = payload or b""
+        head = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}", f"Content-Length: {len(body)}"]
+        if not keep_alive:
+            head.append("Connection: close")
+        head.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+
+    async def _dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+        query = parse_qs(url.query)
+
+        if parts == ["courses"]:
+            require_method(method, "GET")
+            return 200, self._courses_body, {"Content-Type": "application/json"}
+        if parts == ["sessions"]:
+            require_method(method, "POST")
+            session = self._new_session()
+            return 201, {"session": session.id}, None
+        if len(parts) >= 2 and parts[0] == "sessions":
+            session = self._session(parts[1])
+            action = parts[2] if len(parts) == 3 else None
+            if len(parts) == 2:
+                if method == "DELETE":
+                    del self.sessions[session.id]
+                    # Logged so its reviews aren't restored after a restart either.
+                    self._log({"session": session.id, "deleted": True, "time": time.time()})
+                    return 204, None, None
+                require_method(method, "GET")
+                return 200, session.progress(), None
+            if action == "next":
+                require_method(method, "POST")
+                return 200, self._next_card(session, parse_json(body)), None
+            if action == "answer":
+                require_method(method, "GET")
+                return 200, self._answer(session), None
+            if action == "grade":
+                require_method(method, "POST")
+                return 200, self._grade(session, parse_json(body)), None
+        if len(parts) == 2 and parts[0] == "images":
+            require_method(method, "GET")
+            size_name = query.get("size", ["study"])[0]
+            return await self._image(parts[1], size_name, headers.get("if-none-match"))
+        raise HTTPError(404, "Not found")
+
+    # ================================================================
+    # Sessions
+    # ================================================================
+    def _new_session(self):
+        session = StudySession(secrets.token_urlsafe(16))
+        self.sessions[session.id] = session
+        return session
+
+    def _session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            logged = self._logged_reviews.pop(session_id, None)
+            if logged is None:
+                raise HTTPError(404, "No such session")
+            # A session from before a restart, or swept while idle: bring back its reviews.
+            session = self.sessions[session_id] = StudySession(session_id)
+            for course, reviews in logged[1].items():
+                for card_id, review in reviews.items():
+                    session.set_review(course, card_id, review)
+        session.last_used = time.monotonic()
+        return session
+
+    async def _sweep_sessions(self):
+        while True:
+            await asyncio.sleep(SESSION_SWEEP_SECONDS)
+            now = time.time()
+            cutoff = time.monotonic() - SESSION_IDLE_SECONDS
+            for session_id in [s.id for s in self.sessions.values() if s.last_used < cutoff]:
+                self._logged_reviews[session_id] = (now, self.sessions.pop(session_id).reviews)
+            self._forget_expired_sessions(now)
+            self._compact_review_log(now)
+
+    def _forget_expired_sessions(self, now):
+        logged = self._logged_reviews
+        cutoff = now - RESTORABLE_SESSION_SECONDS
+        while logged and (len(logged) > MAX_RESTORABLE_SESSIONS or next(iter(logged.values()))[0] < cutoff):
+            logged.popitem(last=False)
+
+    def _cards(self, course):
+        if course not in self.engine.courses:
+            raise HTTPError(404, f"No such course: {course}")
+        return self.engine.courses[course]
+
+    def _next_card(self, session, request):
+        course = request.get("course")
+        mode = request.get("mode", SHUFFLE)
+        if not isinstance(course, str):
+            raise HTTPError(400, "course must be a string")
+        cards = self._cards(course)
+        order = self._orders[course]
+        now = time.time()
+        session.course = course
+        session.card_id = None
+
+        if mode == SHUFFLE:
+            session_pass = session.passes.get(course)
+            if session_pass is None or session_pass.seen >= session_pass.total:
+                session_pass = session.passes[course] = SessionPass(len(order))
+            session.card_id = session_pass.draw(order)
+            if session.card_id is None:
+                return {"card": None}
+            return {"card": self._card_side(course, cards[session.card_id], "question"),
+                    "seen": session_pass.seen, "total": session_pass.total}
+        if mode != SRS:
+            raise HTTPError(400, f"Unknown mode: {mode}")
+
+        card_id, due = session.next_due(course, now)
+        if card_id is None or due > now:
+            new_card_id = session.next_new(course, order)
+            if new_card_id is not None:
+                card_id, due = new_card_id, None
+            elif card_id is not None:
+                return {"card": None, "next_due": due}
+            else:
+                return {"card": None}
+        session.card_id = card_id
+        return {"card": self._card_side(course, cards[card_id], "question"), "new": due is None}
+
+    def _current_card(self, session):
+        if session.card_id is None:
+            raise HTTPError(409, "No current card; ask for the next one first")
+        return self._cards(session.course)[session.card_id]
+
+    def _answer(self, session):
+        return {"card": self._card_side(session.course, self._current_card(session), "answer")}
+
+    def _grade(self, session, request):
+        quality = request.get("quality")
+        if not isinstance(quality, int) or not 0 <= quality <= 5:
+            raise HTTPError(400, "quality must be an integer from 0 to 5")
+        self._current_card(session)
+        course, card_id = session.course, session.card_id
+        now = time.time()
+        review = schedule_review(session.reviews.get(course, {}).get(card_id), quality, now)
+        session.set_review(course, card_id, review)
+        session.reviewed += 1
+        self._log({"session": session.id, "course": course, "id": card_id,
+                   "quality": quality, "time": now, "review": review})
+        return {"review": review}
+
+    def _card_side(self, course, card, side):
+        images = card.get(f"{side}_imgs", ())
+        return {
+            "course": course,
+            "id": card.id,
+            side: card.get(side, ""),
+            f"{side}_images": [image_url(ref) for ref in images if is_asset_ref(ref)],
+        }
+
+    # ================================================================
+    # Review log
+    # ================================================================
+    def _log(self, entry):
+        with self._pending_lock:
+            self._pending_reviews.append(json.dumps(entry, separators=(",", ":")))
+        self._log_lines += 1
+        self._saver.request()
+
+    def _read_review_log(self):
+        logged = self._logged_reviews
+        try:
+            with open(self.review_log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._log_lines += 1
+                    try:
+                        entry = json.loads(line)
+                        session_id = entry["session"]
+                        if entry.get("deleted"):
+                            logged.pop(session_id, None)
+                            continue
+                        course, card_id, review, used = entry["course"], entry["id"], entry["review"], entry["time"]
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        # A line cut short by a crash
+                        continue
+                    # Re-added so the order stays least recently used first.
+                    courses = logged.pop(session_id, (None, {}))[1]
+                    courses.setdefault(course, {})[card_id] = review
+                    logged[session_id] = (used, courses)
+        except FileNotFoundError:
+            pass
+
+    def _compact_review_log(self, now):
+        """Have the saver rewrite the review log with only the reviews kept, once it's mostly stale."""
+        if self._log_lines < REVIEW_LOG_COMPACT_MIN_LINES:
+            return
+        sessions = [(session_id, used, courses) for session_id, (used, courses) in self._logged_reviews.items()]
+        sessions.extend((session.id, now, session.reviews) for session in self.sessions.values())
+        kept = sum(len(reviews) for _, _, courses in sessions for reviews in courses.values())
+        if self._log_lines <= REVIEW_LOG_COMPACT_RATIO * kept:
+            return
+        lines = [
+            json.dumps({"session": session_id, "course": course, "id": card_id, "time": used, "review": review},
+                       separators=(",", ":"))
+            for session_id, used, courses in sessions
+            for course, reviews in courses.items()
+            for card_id, review in reviews.items()
+        ]
+        with self._pending_lock:
+            # Every pending line's review is in the rewrite already.
+            self._log_rewrite, self._pending_reviews = lines, []
+        self._log_lines = len(lines)
+        self._saver.request()
+
+    def _write_reviews(self):
+        """BackgroundSaver callback: append every review graded since the last write, or rewrite the log."""
+        with self._pending_lock:
+            rewrite, self._log_rewrite = self._log_rewrite, None
+            lines, self._pending_reviews = self._pending_reviews, []
+        if rewrite is None and not lines:
+            return
+        try:
+            if rewrite is None:
+                with open(self.review_log_path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+            else:
+                tmp_path = self.review_log_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.writelines(line + "\n" for line in rewrite + lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.review_log_path)
+        except OSError:
+            # Put them back so the next write tries again, unless a later rewrite holds them.
+            with self._pending_lock:
+                if self._log_rewrite is None:
+                    self._log_rewrite = rewrite
+                    self._pending_reviews[:0] = lines
+            raise
+
+    # ================================================================
+    # Images
+    # ================================================================
+    async def _image(self, name, size_name, if_none_match):
+        size = IMAGE_SIZES.get(size_name)
+        if size is None or not ASSET_NAME.match(name):
+            raise HTTPError(404, "No such image")
+        key = (name, size_name)
+        cached = self._images.get(key)
+        if cached is None:
+            ref = ASSET_PREFIX + name
+            if not self.engine.assets.exists(ref):
+                raise HTTPError(404, "No such image")
+            try:
+                cached = await asyncio.get_running_loop().run_in_executor(
+                    self._image_pool, self._render_image, ref, size
+                )
+            except (OSError, ValueError):
+                raise HTTPError(404, "Image can't be read")
+            self._cache_image(key, cached)
+        else:
+            self._images.move_to_end(key)
+        content_type, etag, data = cached
+        headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+        if if_none_match == etag:
+            return 304, None, headers
+        headers["Content-Type"] = content_type
+        return 200, data, headers
+
+    def _render_image(self, ref, size):
+        img = self.thumbnail_store.get(ref, size)
+        out = io.BytesIO()
+        if img.mode == "RGBA":
+            img.save(out, "PNG")
+            content_type = "image/png"
+        else:
+            img.save(out, "JPEG", quality=85)
+            content_type = "image/jpeg"
+        etag = f'"{self.engine.assets.digest(ref)}-{size[0]}x{size[1]}"'
+        return content_type, etag, out.getvalue()
+
+    def _cache_image(self, key, entry):
+        nbytes = len(entry[2])
+        if key in self._images or nbytes > IMAGE_RESPONSE_CACHE_BYTES:
+            return
+        self._images[key] = entry
+        self._image_bytes += nbytes
+        while self._image_bytes > IMAGE_RESPONSE_CACHE_BYTES:
+            _, old = self._images.popitem(last=False)
+            self._image_bytes -= len(old[2])
+
+
+def parse_request_head(head):
+    """(method, target, version, headers with lowercased names). Raises ValueError if malformed."""
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, version = lines[0].split(" ")
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+
+def parse_json(body):
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError:
+        raise HTTPError(400, "Body must be JSON")
+    if not isinstance(request, dict):
+        raise HTTPError(400, "Body must be a JSON object")
+    return request
+
+
+def require_method(method, allowed):
+    if method != allowed:
+        raise HTTPError(405, f"Use {allowed}")
+
+
+def random_stride(count):
+    """A random step in [1, count) sharing no factor with count (1 for fewer than 3)."""
+    if count < 3:
+        return 1
+    while True:
+        stride = random.randrange(1, count)
+        if math.gcd(stride, count) == 1:
+            return stride
+
+
+def image_url(ref, size_name="study"):
+    return f"/images/{ref[len(ASSET_PREFIX):]}?size={size_name}"
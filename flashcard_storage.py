@@ -0,0 +1,884 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+
+from flashcard_cards import CARD_ID_MIN, Card, CourseCards, cards_from_json, json_default
+from flashcard_metrics import metrics
+
+# A journal is folded into the snapshot once it holds this many records.
+JOURNAL_COMPACT_THRESHOLD = 500
+JOURNAL_SUFFIX = ".journal"
+# Changes made within this many seconds of each other are written together.
+SAVE_DELAY = 0.5
+
+
+# ================================================================
+# Crash-safe file helpers
+# ================================================================
+def fsync_directory(path):
+    """Flush a rename in the directory holding path (no-op where unsupported)."""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_temp_file(path, data):
+    """Write data to a temp file next to path and fsync it. Returns the temp path."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp_path
+
+
+def atomic_write_bytes(path, data):
+    """Replace path with data so readers only ever see the old or the new file."""
+    os.replace(write_temp_file(path, data), path)
+    fsync_directory(path)
+
+
+def serialize_courses(courses):
+    return json.dumps(courses, indent=4, default=json_default).encode("utf-8")
+
+
+def snapshot_digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def copy_courses(courses):
+    """Copy courses deep enough that later mutations don't leak into the copy."""
+    # Cards are replaced rather than changed, so copying the lists is enough.
+    return {name: list(cards) for name, cards in courses.items()}
+
+
+# ================================================================
+# Background saving
+# ================================================================
+class BackgroundSaver:
+    """
+    Runs write() on a worker thread after changes settle. Every request()
+    within `delay` seconds of the previous one is folded into one write.
+    write() must take its own consistent snapshot of the data.
+
+    If a write fails, the error is kept in self.error and the changes stay
+    pending until the next request() or flush() tries again.
+    """
+
+    def __init__(self, write, delay=SAVE_DELAY):
+        self.write = write
+        self.delay = delay
+        self.error = None
+        self._cond = threading.Condition()
+        self._dirty = False
+        self._scheduled = False
+        self._urgent = False
+        self._writing = False
+        self._closing = False
+        self._last_request = 0.0
+        self._thread = threading.Thread(target=self._run, name="background-saver", daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        """True while there are changes that haven't reached the disk."""
+        with self._cond:
+            return self._dirty or self._writing
+
+    def request(self, urgent=False):
+        """Schedule a write; urgent=True starts it without waiting for changes to settle."""
+        with self._cond:
+            self._dirty = True
+            self._scheduled = True
+            if urgent:
+                self._urgent = True
+            self._last_request = time.monotonic()
+            self._cond.notify_all()
+
+    def flush(self):
+        """Write pending changes now and wait for them. Returns the last error, if any."""
+        with self._cond:
+            if self._dirty:
+                self._scheduled = True
+                self._urgent = True
+                self._cond.notify_all()
+            while self._scheduled or self._writing:
+                self._cond.wait()
+            return self.error
+
+    def close(self):
+        error = self.flush()
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+        return error
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._scheduled and not self._closing:
+                    self._cond.wait()
+                if not self._scheduled:
+                    return
+                while not self._urgent and not self._closing:
+                    remaining = self._last_request + self.delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._scheduled = False
+                self._urgent = False
+                self._dirty = False
+                self._writing = True
+            try:
+                with metrics.phase("storage.background_write"):
+                    self.write()
+                error = None
+            except Exception as e:
+                error = e
+            with self._cond:
+                self.error = error
+                if error is not None:
+                    self._dirty = True
+                self._writing = False
+                self._cond.notify_all()
+
+
+# ================================================================
+# Mutation records
+# ================================================================
+def apply_record(courses, record):
+    """Apply one mutation record to an in-memory courses dict."""
+    op = record["op"]
+    if op == "add_course":
+        courses.setdefault(record["course"], CourseCards())
+        return
+    cards = courses[record["course"]]
+    if op == "add_card":
+        cards.append(Card.from_dict(record["card"]))
+    elif op == "add_cards":
+        for card in record["cards"]:
+            cards.append(Card.from_dict(card))
+    elif op == "update_card":
+        cards.replace(Card.from_dict(record["card"]).with_id(record_card_id(cards, record)))
+    elif op == "update_cards":
+        for card in record["cards"]:
+            cards.replace(Card.from_dict(card))
+    elif op == "delete_card":
+        cards.remove(record_card_id(cards, record))
+    elif op == "set_review":
+        card = cards[record_card_id(cards, record)]
+        cards.replace(card.with_review(dict(record["review"])))
+    else:
+        raise ValueError(f"Unknown journal record: {op!r}")
+
+
+def record_card_id(cards, record):
+    """The card a record refers to; journals written before card ids used positions."""
+    if "id" in record:
+        return record["id"]
+    return cards.id_at(record["index"])
+
+
+class CourseStore:
+    """
+    Base class for storage backends.
+    Every change goes through add_course/add_card/update_card/delete_card,
+    which apply it to self.courses and hand the record to _commit().
+    Cards are addressed by id, so a change never renumbers other cards.
+    """
+
+    def __init__(self, path, save_delay=SAVE_DELAY):
+        self.path = path
+        self.save_delay = save_delay
+        self.courses = {}
+        # Backends that write on a worker thread set a BackgroundSaver here.
+        self._saver = None
+        self._save_error = None
+        # Called with each mutation record once it has been applied.
+        self._listeners = []
+
+    @property
+    def save_pending(self):
+        """True while some change hasn't been written to disk yet."""
+        return self._saver is not None and self._saver.pending
+
+    @property
+    def save_error(self):
+        """The exception from the most recent failed background write, if any."""
+        if self._saver is not None:
+            return self._saver.error
+        return self._save_error
+
+    def add_course(self, name):
+        self._apply({"op": "add_course", "course": name})
+
+    def add_card(self, course, card):
+        """Add a card (a dict or Card) to the end of a course and return its id."""
+        card = Card.from_dict(card)
+        if card.id is None or card.id in self.courses[course]:
+            card = card.with_id(self.courses[course].new_id())
+        record = {"op": "add_card", "course": course, "card": card}
+        self._apply(record)
+        # A backend may have had to give the card another id.
+        return record["card"].id
+
+    def add_cards(self, course, cards):
+        """
+        Add many cards as one change (one journal line, one transaction,
+        one save) and return their ids.
+        """
+        existing = self.courses[course]
+        batch = []
+        taken = set()
+        for card in cards:
+            card = Card.from_dict(card)
+            if card.id is None or card.id in existing or card.id in taken:
+                card = card.with_id(existing.new_id())
+            taken.add(card.id)
+            batch.append(card)
+        record = {"op": "add_cards", "course": course, "cards": batch}
+        self._apply(record)
+        return [card.id for card in record["cards"]]
+
+    def update_card(self, course, card_id, card):
+        card = Card.from_dict(card).with_id(card_id)
+        self._apply({"op": "update_card", "course": course, "id": card_id, "card": card})
+
+    def update_cards(self, course, cards):
+        """Replace a batch of cards (dicts carrying their ids) in one change."""
+        batch = [Card.from_dict(card) for card in cards]
+        self._apply({"op": "update_cards", "course": course, "cards": batch})
+
+    def delete_card(self, course, card_id):
+        self._apply({"op": "delete_card", "course": course, "id": card_id})
+
+    def set_review(self, course, card_id, review):
+        """Record a card's spaced-repetition state without rewriting the card."""
+        self._apply({"op": "set_review", "course": course, "id": card_id, "review": review})
+
+    def add_listener(self, listener):
+        """Call listener(record) after every change, e.g. to keep an index in sync."""
+        self._listeners.append(listener)
+
+    def _apply(self, record):
+        with metrics.phase("storage.commit"):
+            self._commit(record)
+        for listener in self._listeners:
+            listener(record)
+
+    def load(self):
+        raise NotImplementedError
+
+    def release_course(self, name):
+        """Drop a course's cards from memory if the backend can reload them."""
+
+    def save(self):
+        """Write the full library to disk."""
+        raise NotImplementedError
+
+    def flush(self):
+        """Wait until every change so far has been written to disk."""
+        if self._saver is not None:
+            self._saver.flush()
+
+    def close(self):
+        self.save()
+
+    def _commit(self, record):
+        raise NotImplementedError
+
+
+# ================================================================
+# Backend: single JSON file
+# ================================================================
+class JsonStore(CourseStore):
+    """
+    The whole library in one JSON file, rewritten after every burst of
+    changes by a background thread (see BackgroundSaver).
+    """
+
+    def __init__(self, path, save_delay=SAVE_DELAY):
+        super().__init__(path, save_delay)
+        self._lock = threading.Lock()
+        self._saver = BackgroundSaver(self._write_snapshot, save_delay)
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.courses = cards_from_json(json.load(f))
+        return self.courses
+
+    def save(self):
+        self._saver.request()
+        self._saver.flush()
+
+    def close(self):
+        self._saver.close()
+
+    def _commit(self, record):
+        with self._lock:
+            apply_record(self.courses, record)
+        self._saver.request()
+
+    def _write_snapshot(self):
+        with self._lock:
+            snapshot = copy_courses(self.courses)
+        atomic_write_bytes(self.path, serialize_courses(snapshot))
+
+
+# ================================================================
+# Backend: JSON snapshot + append-only journal
+# ================================================================
+class JournalStore(CourseStore):
+    """
+    Keeps the JSON file as a snapshot and appends each change as one line
+    to '<path>.journal'. The journal's first line names the snapshot it
+    applies to (by digest), so a journal that was already folded in is
+    never replayed twice.
+
+    Compaction writes a new snapshot in a background thread. Records that
+    arrive meanwhile go to both the live journal and '<path>.journal.next'
+    (which is based on the new snapshot), so whichever snapshot is on
+    disk after a crash always has a matching journal.
+    """
+
+    def __init__(self, path, save_delay=SAVE_DELAY, compact_threshold=JOURNAL_COMPACT_THRESHOLD):
+        super().__init__(path, save_delay)
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.next_journal_path = self.journal_path + ".next"
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compactor = None
+        self._journal = None
+        self._record_count = 0
+        # Lines committed while a compaction is running (None when idle).
+        self._pending = None
+
+    def load(self):
+        snapshot = b""
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                snapshot = f.read()
+        base = snapshot_digest(snapshot)
+        courses = cards_from_json(json.loads(snapshot.decode("utf-8"))) if snapshot else {}
+
+        records = None
+        clean = True
+        for journal_path in (self.journal_path, self.next_journal_path):
+            journal_base, journal_records, clean = self._read_journal(journal_path)
+            if journal_base == base:
+                records = journal_records
+                break
+        for record in records or []:
+            apply_record(courses, record)
+        self.courses = courses
+
+        # Start appending to a journal that is known to be intact and
+        # based on the snapshot we just read.
+        if records is None or not clean or journal_path != self.journal_path:
+            lines = [json.dumps(r, separators=(",", ":")) + "\n" for r in records or []]
+            self._write_journal(self.journal_path, base, lines)
+        if os.path.exists(self.next_journal_path):
+            os.remove(self.next_journal_path)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._record_count = len(records or [])
+        return self.courses
+
+    def save(self):
+        """Fold the journal into the snapshot right now."""
+        self.compact()
+
+    def close(self):
+        if self._compactor is not None:
+            self._compactor.join()
+        if self._record_count:
+            try:
+                self.compact()
+            except Exception:
+                # Kept in save_error; the journal still holds every change.
+                pass
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def compact_async(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, name="journal-compactor", daemon=True)
+        self._compactor.start()
+
+    def compact(self):
+        with self._compact_lock:
+            with self._lock:
+                snapshot = copy_courses(self.courses)
+                self._pending = []
+                folded = self._record_count
+            try:
+                data = serialize_courses(snapshot)
+                tmp_path = write_temp_file(self.path, data)
+                with self._lock:
+                    pending = self._pending
+                    self._write_journal(self.next_journal_path, snapshot_digest(data), pending)
+                    os.replace(tmp_path, self.path)
+                    fsync_directory(self.path)
+                    self._journal.close()
+                    os.replace(self.next_journal_path, self.journal_path)
+                    fsync_directory(self.journal_path)
+                    self._journal = open(self.journal_path, "a", encoding="utf-8")
+                    self._record_count -= folded
+                self._save_error = None
+            except Exception as e:
+                self._save_error = e
+                raise
+            finally:
+                with self._lock:
+                    self._pending = None
+
+    def _commit(self, record):
+        line = json.dumps(record, separators=(",", ":"), default=json_default) + "\n"
+        with self._lock:
+            apply_record(self.courses, record)
+            self._journal.write(line)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._record_count += 1
+            if self._pending is not None:
+                self._pending.append(line)
+            needs_compaction = self._record_count >= self.compact_threshold
+        if needs_compaction:
+            self.compact_async()
+
+    @staticmethod
+    def _read_journal(path):
+        """Return (base digest, records, clean). A torn last line is dropped."""
+        if not os.path.exists(path):
+            return None, [], True
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            lines = f.read().split("\n")
+        try:
+            base = json.loads(lines[0])["base"]
+        except (ValueError, KeyError, TypeError):
+            return None, [], False
+        records = []
+        clean = lines[-1] == ""
+        for line in lines[1:]:
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # Only the tail can be torn; anything after it is unreliable.
+                clean = False
+                break
+        return base, records, clean
+
+    @staticmethod
+    def _write_journal(path, base, lines):
+        header = json.dumps({"base": base}) + "\n"
+        atomic_write_bytes(path, (header + "".join(lines)).encode("utf-8"))
+
+
+# ================================================================
+# Backend: SQLite database with per-course loading
+# ================================================================
+class LazyCourses(MutableMapping):
+    """
+    Course name -> list of cards, like the plain dict the JSON backends use,
+    but a course's cards are only fetched the first time they're indexed.
+    Membership tests and iteration only touch the course names.
+    """
+
+    def __init__(self, names, loader):
+        self._cards = dict.fromkeys(names)
+        self._loader = loader
+
+    def __getitem__(self, name):
+        cards = self._cards[name]
+        if cards is None:
+            cards = self._cards[name] = self._loader(name)
+        return cards
+
+    def __setitem__(self, name, cards):
+        self._cards[name] = cards
+
+    def __delitem__(self, name):
+        del self._cards[name]
+
+    def __contains__(self, name):
+        return name in self._cards
+
+    def __iter__(self):
+        return iter(self._cards)
+
+    def __len__(self):
+        return len(self._cards)
+
+    def is_loaded(self, name):
+        return self._cards.get(name) is not None
+
+    def unload(self, name):
+        if name in self._cards:
+            self._cards[name] = None
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS cards (
+    id INTEGER PRIMARY KEY,
+    course_id INTEGER NOT NULL REFERENCES courses(id) ON DELETE CASCADE,
+    question TEXT NOT NULL DEFAULT '',
+    answer TEXT NOT NULL DEFAULT '',
+    review TEXT
+);
+CREATE INDEX IF NOT EXISTS cards_by_course ON cards(course_id, id);
+CREATE TABLE IF NOT EXISTS card_images (
+    card_id INTEGER NOT NULL REFERENCES cards(id) ON DELETE CASCADE,
+    side TEXT NOT NULL CHECK (side IN ('question', 'answer')),
+    position INTEGER NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS card_images_by_card ON card_images(card_id, side, position);
+"""
+
+
+class SqliteStore(CourseStore):
+    """
+    Stores the library in '<name>.db' next to the JSON file. Only course
+    names are read at startup; a course's cards (and their image paths)
+    are fetched with one indexed query when the course is first used.
+    A card's id is its row id, which also keeps cards in order.
+
+    If the database doesn't exist yet but the JSON file does, the JSON
+    library is migrated into it on first load.
+
+    The GUI loads the deck on a worker thread and then uses it from the
+    Tk thread, so the connection isn't tied to the thread that opened it;
+    _lock keeps it to one thread at a time instead.
+    """
+
+    def __init__(self, path, save_delay=SAVE_DELAY):
+        super().__init__(path, save_delay)
+        self.db_path = os.path.splitext(path)[0] + ".db"
+        self._conn = None
+        self._lock = threading.RLock()
+        self._course_ids = {}
+
+    def load(self):
+        needs_migration = not os.path.exists(self.db_path) and os.path.exists(self.path)
+        with self._lock:
+            self._connect()
+            if needs_migration:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._import_courses(json.load(f))
+            rows = self._conn.execute("SELECT id, name FROM courses ORDER BY id").fetchall()
+        self._course_ids = {name: course_id for course_id, name in rows}
+        self.courses = LazyCourses(self._course_ids, self._load_course)
+        return self.courses
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        with self._conn:
+            self._conn.executescript(SQLITE_SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(cards)")}
+            if "review" not in columns:
+                # Databases created before spaced repetition existed.
+                self._conn.execute("ALTER TABLE cards ADD COLUMN review TEXT")
+
+    def release_course(self, name):
+        self.courses.unload(name)
+
+    def save(self):
+        """Every change is committed as it happens; nothing to flush."""
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _load_course(self, name):
+        course_id = self._course_ids[name]
+        cards = {}
+        images = {}
+        with self._lock:
+            for card_id, question, answer, review in self._conn.execute(
+                "SELECT id, question, answer, review FROM cards WHERE course_id = ? ORDER BY id",
+                (course_id,),
+            ):
+                cards[card_id] = (question, answer, json.loads(review) if review is not None else None)
+            for card_id, side, path in self._conn.execute(
+                "SELECT i.card_id, i.side, i.path FROM card_images i"
+                " JOIN cards c ON c.id = i.card_id"
+                " WHERE c.course_id = ? ORDER BY i.card_id, i.side, i.position",
+                (course_id,),
+            ):
+                images.setdefault((card_id, side), []).append(path)
+        return CourseCards(
+            Card(
+                question, answer, images.get((card_id, "question")), images.get((card_id, "answer")),
+                review, id=card_id,
+            )
+            for card_id, (question, answer, review) in cards.items()
+        )
+
+    def _commit(self, record):
+        op = record["op"]
+        course = record["course"]
+        if op != "add_course":
+            # Make sure the course is loaded before apply_record() changes it.
+            self.courses[course]
+        with self._lock, self._conn:
+            if op == "add_course":
+                if course not in self._course_ids:
+                    cursor = self._conn.execute("INSERT INTO courses (name) VALUES (?)", (course,))
+                    self._course_ids[course] = cursor.lastrowid
+            elif op == "add_card":
+                card = record["card"]
+                card_id = self._insert_card(self._course_ids[course], card)
+                if card_id != card.id:
+                    record["card"] = card.with_id(card_id)
+            elif op == "add_cards":
+                course_id = self._course_ids[course]
+                inserted = []
+                for card in record["cards"]:
+                    card_id = self._insert_card(course_id, card)
+                    inserted.append(card if card_id == card.id else card.with_id(card_id))
+                record["cards"] = inserted
+            elif op == "update_card":
+                self._update_card(record["id"], record["card"])
+            elif op == "update_cards":
+                for card in record["cards"]:
+                    self._update_card(card.id, card)
+            elif op == "delete_card":
+                self._conn.execute("DELETE FROM cards WHERE id = ?", (record["id"],))
+            elif op == "set_review":
+                self._conn.execute(
+                    "UPDATE cards SET review = ? WHERE id = ?", (json.dumps(record["review"]), record["id"])
+                )
+        apply_record(self.courses, record)
+
+    def _update_card(self, card_id, card):
+        self._conn.execute(
+            "UPDATE cards SET question = ?, answer = ?, review = ? WHERE id = ?",
+            (card.get("question", ""), card.get("answer", ""), self._review_json(card), card_id),
+        )
+        self._conn.execute("DELETE FROM card_images WHERE card_id = ?", (card_id,))
+        self._insert_images(card_id, card)
+
+    def _import_courses(self, courses):
+        with self._conn:
+            for name, cards in courses.items():
+                self._conn.execute("INSERT OR IGNORE INTO courses (name) VALUES (?)", (name,))
+                course_id = self._conn.execute("SELECT id FROM courses WHERE name = ?", (name,)).fetchone()[0]
+                for card in cards:
+                    self._insert_card(course_id, card)
+
+    def _insert_card(self, course_id, card):
+        """
+        Insert a card and return its row id. Cards load in row id order,
+        so the card keeps its own id only if that sorts after every card
+        already stored; a new card's random id, or an id that doesn't
+        follow on, is replaced by the next row id.
+        """
+        card_id = card.get("id")
+        if card_id is not None:
+            last_id = self._conn.execute("SELECT max(id) FROM cards").fetchone()[0] or 0
+            if not last_id < card_id < CARD_ID_MIN:
+                card_id = None
+        cursor = self._conn.execute(
+            "INSERT INTO cards (id, course_id, question, answer, review) VALUES (?, ?, ?, ?, ?)",
+            (card_id, course_id, card.get("question", ""), card.get("answer", ""), self._review_json(card)),
+        )
+        self._insert_images(cursor.lastrowid, card)
+        return cursor.lastrowid
+
+    @staticmethod
+    def _review_json(card):
+        review = card.get("review")
+        return json.dumps(review) if review is not None else None
+
+    def _insert_images(self, card_id, card):
+        rows = []
+        for side in ("question", "answer"):
+            for position, path in enumerate(card.get(side + "_imgs", [])):
+                rows.append((card_id, side, position, path))
+        self._conn.executemany(
+            "INSERT INTO card_images (card_id, side, position, path) VALUES (?, ?, ?, ?)", rows
+        )
+
+
+# ================================================================
+# Backend: manifest + one JSON shard per course
+# ================================================================
+SHARD_MANIFEST = "manifest.json"
+
+
+def shard_file_name(course):
+    """A filesystem-safe, collision-free file name for a course's shard."""
+    slug = re.sub(r"[^\w-]+", "_", course).strip("_")[:40] or "course"
+    return f"{slug}-{hashlib.sha1(course.encode('utf-8')).hexdigest()[:8]}.json"
+
+
+class ShardedStore(CourseStore):
+    """
+    Stores each course in its own file under '<name>.shards/', plus a small
+    manifest of course names, shard files and card counts. Startup reads
+    only the manifest; a shard is parsed the first time its course is
+    used, and a change rewrites only that course's shard.
+
+    If the shard directory doesn't exist yet but the JSON file does, the
+    JSON library is split into shards on first load.
+    """
+
+    def __init__(self, path, save_delay=SAVE_DELAY):
+        super().__init__(path, save_delay)
+        self.shard_dir = os.path.splitext(path)[0] + ".shards"
+        self.manifest_path = os.path.join(self.shard_dir, SHARD_MANIFEST)
+        # Course name -> {"file": ..., "count": ...}, in display order.
+        self._manifest = {}
+        # Courses whose shard (and whether the manifest) still needs writing.
+        self._dirty_courses = set()
+        self._manifest_dirty = False
+        self._lock = threading.Lock()
+        self._saver = BackgroundSaver(self._write_dirty, save_delay)
+
+    def load(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)["courses"]
+            self._manifest = {e["name"]: {"file": e["file"], "count": e["count"]} for e in entries}
+            self.courses = LazyCourses(self._manifest, self._load_shard)
+        else:
+            os.makedirs(self.shard_dir, exist_ok=True)
+            courses = {}
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    courses = cards_from_json(json.load(f))
+            self.courses = LazyCourses(courses, self._load_shard)
+            for name, cards in courses.items():
+                self.courses[name] = cards
+                self._manifest[name] = {"file": shard_file_name(name), "count": len(cards)}
+                self._write_shard(self._manifest[name]["file"], cards)
+            self._write_manifest(self._manifest_entries())
+        return self.courses
+
+    def release_course(self, name):
+        with self._lock:
+            if name not in self._dirty_courses:
+                self.courses.unload(name)
+
+    def save(self):
+        """Rewrite every loaded shard and the manifest."""
+        with self._lock:
+            self._dirty_courses.update(name for name in self.courses if self.courses.is_loaded(name))
+            self._manifest_dirty = True
+        self._saver.request()
+        self._saver.flush()
+
+    def close(self):
+        self._saver.close()
+
+    def _load_shard(self, name):
+        entry = self._manifest[name]
+        shard_path = os.path.join(self.shard_dir, entry["file"])
+        if not os.path.exists(shard_path):
+            if entry["count"]:
+                # Loading it empty would have the next save lose its cards for good.
+                raise ValueError(f"Shard of course {name!r} with {entry['count']} cards is missing: {shard_path}")
+            return CourseCards()
+        with open(shard_path, "r", encoding="utf-8") as f:
+            return CourseCards.from_json(json.load(f))
+
+    def _commit(self, record):
+        course = record["course"]
+        if course in self.courses:
+            # Load the shard outside the lock; the saver never needs to.
+            self.courses[course]
+        with self._lock:
+            apply_record(self.courses, record)
+            entry = self._manifest.setdefault(course, {"file": shard_file_name(course), "count": 0})
+            entry["count"] = len(self.courses[course])
+            self._dirty_courses.add(course)
+            if record["op"] in ("add_course", "add_card", "add_cards", "delete_card"):
+                self._manifest_dirty = True
+        self._saver.request()
+
+    def _write_dirty(self):
+        """BackgroundSaver callback: write the shards that changed since the last save."""
+        with self._lock:
+            names = self._dirty_courses
+            self._dirty_courses = set()
+            shards = [(name, self._manifest[name]["file"], list(self.courses[name]))
+                      for name in names]
+            manifest = self._manifest_entries() if self._manifest_dirty else None
+            self._manifest_dirty = False
+        try:
+            for _, file_name, cards in shards:
+                self._write_shard(file_name, cards)
+            if manifest is not None:
+                self._write_manifest(manifest)
+        except Exception:
+            with self._lock:
+                self._dirty_courses.update(names)
+                self._manifest_dirty = self._manifest_dirty or manifest is not None
+            raise
+
+    def _manifest_entries(self):
+        return [{"name": name, **entry} for name, entry in self._manifest.items()]
+
+    def _write_shard(self, file_name, cards):
+        atomic_write_bytes(os.path.join(self.shard_dir, file_name), serialize_courses(cards))
+
+    def _write_manifest(self, entries):
+        atomic_write_bytes(self.manifest_path, json.dumps({"courses": entries}, indent=4).encode("utf-8"))
+
+
+def migrate_json_to_sqlite(json_path, db_path=None):
+    """Copy every course in a flashcards JSON file into a SQLite database."""
+    store = SqliteStore(json_path)
+    if db_path is not None:
+        store.db_path = db_path
+    with open(json_path, "r", encoding="utf-8") as f:
+        courses = json.load(f)
+    store._connect()
+    store._import_courses(courses)
+    store.close()
+    return store.db_path
+
+
+# ================================================================
+# Backend registry
+# ================================================================
+STORES = {
+    "json": JsonStore,
+    "journal": JournalStore,
+    "sqlite": SqliteStore,
+    "sharded": ShardedStore,
+}
+
+
+def open_store(path, backend="json", save_delay=SAVE_DELAY):
+    try:
+        store_class = STORES[backend]
+    except KeyError:
+        raise ValueError(f"Unknown storage backend: {backend!r}") from None
+    return store_class(path, save_delay)
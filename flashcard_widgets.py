@@ -0,0 +1,307 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+class LabelPool:
+    """
+    A reusable column of Labels in a frame, for content that changes
+    from card to card (study images, attachment previews).
+
+    Instead of destroying and recreating a Label per image on every card,
+    the pool keeps the Labels it has made, reconfigures them in place,
+    and hides (pack_forget) the ones the current card doesn't need. A
+    Label is only reconfigured when what it shows actually changes, and
+    it holds on to its PhotoImage so the image isn't garbage collected.
+
+    show(count) starts a new card and returns a generation number;
+    results that arrive later (e.g. from the image prefetcher) should be
+    dropped if the pool's generation has moved on since.
+    """
+
+    def __init__(self, frame, pack_options=None, **label_options):
+        self.frame = frame
+        self.pack_options = pack_options or {}
+        self.label_options = label_options
+        self.labels = []
+        self.generation = 0
+        self._count = 0
+        # (image, text, key) each Label currently shows.
+        self._shown = []
+
+    def __len__(self):
+        return self._count
+
+    def show(self, count):
+        """Use the first count Labels for a new card, hiding the rest."""
+        self.generation += 1
+        while len(self.labels) < count:
+            self.labels.append(tk.Label(self.frame, **self.label_options))
+            self._shown.append((None, "", None))
+        for label in self.labels[self._count:count]:
+            label.pack(**self.pack_options)
+        for index in range(count, self._count):
+            self.labels[index].pack_forget()
+            # Drop the PhotoImage reference of a hidden label
+            self.set(index)
+        self._count = count
+        return self.generation
+
+    def clear(self):
+        self.show(0)
+
+    def append(self, image=None, text="", key=None):
+        """Show one more Label after the ones in use, without starting a new card."""
+        index = self._count
+        generation = self.generation
+        self.show(index + 1)
+        self.generation = generation
+        self.set(index, image, text, key)
+        return index
+
+    def key(self, index):
+        """The key passed to set() for what the Label at index shows."""
+        return self._shown[index][2]
+
+    def set(self, index, image=None, text="", key=None):
+        """Show an image (a PhotoImage) and/or text in the Label at index."""
+        old_image, old_text, _ = self._shown[index]
+        self._shown[index] = (image, text, key)
+        if image is old_image and text == old_text:
+            return
+        self.labels[index].config(image=image if image is not None else "", text=text)
+
+
+class CardBrowser:
+    """
+    A Treeview listing one course's cards (question and answer snippets,
+    image count, and a thumbnail of the first image), scrolled virtually:
+    the Treeview only ever holds `height` rows, which are refilled from
+    the cards in view as the scrollbar, mouse wheel or arrow keys move.
+    Opening a course of any size costs one list of card ids.
+
+    Sorting and filtering rearrange that list of ids, never the cards.
+    Thumbnails are asked for only as rows come into view, through
+    thumbnail(ref, done), which returns a PhotoImage at once if it has
+    one, or None and calls done(photo) later.
+    """
+
+    COLUMNS = ("question", "answer", "images")
+    HEADINGS = {"question": "Question", "answer": "Answer", "images": "Images"}
+
+    def __init__(self, parent, height=15, row_height=36, snippet_length=60,
+                 thumbnail=None, on_open=None):
+        self.height = height
+        self.snippet_length = snippet_length
+        self.thumbnail = thumbnail
+        self.on_open = on_open
+        self.cards = None
+        # Ids of the cards in view, filtered and sorted; the browser's only per-card state.
+        self.view = []
+        self.top = 0
+        self.selected_id = None
+        self.filter_text = ""
+        self.sort_column = None
+        self.sort_reverse = False
+        # Card id and thumbnail reference each row shows.
+        self._row_ids = [None] * height
+        self._row_refs = [None] * height
+        self._attached = height
+        # Thumbnail reference -> PhotoImage, for the rows in view.
+        self._photos = {}
+
+        self.frame = tk.Frame(parent)
+        style = ttk.Style(parent)
+        style.configure("CardBrowser.Treeview", rowheight=row_height)
+        self.tree = ttk.Treeview(
+            self.frame, columns=self.COLUMNS, height=height,
+            selectmode="browse", style="CardBrowser.Treeview"
+        )
+        self.tree.heading("#0", text="")
+        self.tree.column("#0", width=row_height + 10, stretch=False)
+        for column in self.COLUMNS:
+            self.tree.heading(column, text=self.HEADINGS[column], command=lambda c=column: self.sort_by(c))
+        self.tree.column("question", width=260)
+        self.tree.column("answer", width=260)
+        self.tree.column("images", width=60, anchor="e", stretch=False)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+        for row in range(height):
+            self.tree.insert("", "end", iid=f"row{row}")
+
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<Double-1>", self._on_open)
+        self.tree.bind("<Return>", self._on_open)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1) or "break")
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1) or "break")
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1) or "break")
+        self.tree.bind("<Up>", lambda e: self.move_selection(-1) or "break")
+        self.tree.bind("<Down>", lambda e: self.move_selection(1) or "break")
+        self.tree.bind("<Prior>", lambda e: self.move_selection(-height) or "break")
+        self.tree.bind("<Next>", lambda e: self.move_selection(height) or "break")
+
+    def set_cards(self, cards):
+        """Show a CourseCards (or None), keeping the filter, sort order and selection."""
+        self.cards = cards
+        self.refresh()
+
+    def set_filter(self, text):
+        self.filter_text = text.strip().casefold()
+        self.top = 0
+        self.refresh()
+
+    def sort_by(self, column):
+        """Sort by a column; sorting by the same column again reverses the order."""
+        if self.sort_column == column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = column
+            self.sort_reverse = False
+        self.refresh()
+
+    def refresh(self):
+        """Rebuild the view from the cards, e.g. after they changed."""
+        cards = self.cards
+        if cards is None:
+            self.view = []
+        elif self.filter_text:
+            text = self.filter_text
+            self.view = [card.id for card in cards
+                         if text in card.question.casefold() or text in card.answer.casefold()]
+        else:
+            self.view = cards.ids()
+        if self.sort_column is not None and cards is not None:
+            self.view.sort(key=self._sort_key(self.sort_column), reverse=self.sort_reverse)
+        for column in self.COLUMNS:
+            arrow = ""
+            if column == self.sort_column:
+                arrow = " ▼" if self.sort_reverse else " ▲"
+            self.tree.heading(column, text=self.HEADINGS[column] + arrow)
+        self._render(force=True)
+
+    def scroll(self, rows):
+        self.scroll_to(self.top + rows)
+
+    def scroll_to(self, top):
+        top = max(0, min(top, len(self.view) - self.height))
+        if top != self.top:
+            self.top = top
+            self._render()
+
+    def move_selection(self, rows):
+        """Move the selection by rows, scrolling to keep it in view."""
+        if not self.view:
+            return
+        try:
+            position = self.view.index(self.selected_id) + rows
+        except ValueError:
+            position = self.top
+        position = max(0, min(position, len(self.view) - 1))
+        self.selected_id = self.view[position]
+        if position < self.top:
+            self.scroll_to(position)
+        elif position >= self.top + self.height:
+            self.scroll_to(position - self.height + 1)
+        self._render()
+
+    def _sort_key(self, column):
+        cards = self.cards
+        if column == "images":
+            return lambda card_id: len(cards[card_id].question_imgs) + len(cards[card_id].answer_imgs)
+        return lambda card_id: getattr(cards[card_id], column).casefold()
+
+    def _render(self, force=False):
+        self.top = max(0, min(self.top, len(self.view) - self.height))
+        visible = min(self.height, len(self.view) - self.top)
+        # Rows past the end of a short view are detached rather than blanked.
+        for row in range(visible, self._attached):
+            self.tree.detach(f"row{row}")
+        for row in range(self._attached, visible):
+            self.tree.move(f"row{row}", "", row)
+        self._attached = visible
+
+        selected_row = None
+        refs = set()
+        for row in range(visible):
+            card_id = self.view[self.top + row]
+            if card_id == self.selected_id:
+                selected_row = f"row{row}"
+            card = self.cards.get(card_id)
+            if card is None:
+                # Deleted since the view was built (a refresh follows): blank the
+                # row rather than leave the card that was shown there before.
+                if force or self._row_ids[row] is not None:
+                    self._row_ids[row] = None
+                    self._row_refs[row] = None
+                    self.tree.item(f"row{row}", image="", values=("", "", ""))
+                continue
+            images = card.question_imgs + card.answer_imgs
+            ref = images[0] if images else None
+            if ref is not None:
+                refs.add(ref)
+            if not force and self._row_ids[row] == card_id and self._row_refs[row] == ref:
+                continue
+            self._row_ids[row] = card_id
+            self._row_refs[row] = ref
+            self.tree.item(
+                f"row{row}",
+                image=self._photo(ref, row) or "",
+                values=(self._snippet(card.question), self._snippet(card.answer), len(images) or "")
+            )
+        # Only keep thumbnails of rows in view.
+        for ref in self._photos.keys() - refs:
+            del self._photos[ref]
+
+        if selected_row is None:
+            if self.tree.selection():
+                self.tree.selection_set(())
+        elif self.tree.selection() != (selected_row,):
+            self.tree.selection_set(selected_row)
+
+        if self.view:
+            self.scrollbar.set(self.top / len(self.view), (self.top + visible) / len(self.view))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _photo(self, ref, row):
+        if ref is None or self.thumbnail is None:
+            return None
+        photo = self._photos.get(ref)
+        if photo is None:
+            photo = self.thumbnail(ref, lambda photo: self._thumbnail_ready(ref, photo))
+            if photo is not None:
+                self._photos[ref] = photo
+        return photo
+
+    def _thumbnail_ready(self, ref, photo):
+        if photo is None or ref not in self._row_refs:
+            return
+        self._photos[ref] = photo
+        for row, row_ref in enumerate(self._row_refs):
+            if row_ref == ref and row < self._attached:
+                self.tree.item(f"row{row}", image=photo)
+
+    def _snippet(self, text):
+        text = " ".join(text.split())
+        if len(text) > self.snippet_length:
+            text = text[:self.snippet_length - 3] + "..."
+        return text
+
+    def _on_scrollbar(self, command, value, unit=None):
+        if command == "moveto":
+            self.scroll_to(int(float(value) * len(self.view)))
+        elif unit == "pages":
+            self.scroll(int(value) * self.height)
+        else:
+            self.scroll(int(value))
+
+    def _on_select(self, event=None):
+        selection = self.tree.selection()
+        if selection:
+            row = int(selection[0][3:])
+            if row < self._attached:
+                self.selected_id = self._row_ids[row]
+
+    def _on_open(self, event=None):
+        if self.on_open is not None and self.selected_id is not None:
+            self.on_open(self.selected_id)
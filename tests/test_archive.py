@@ -0,0 +1,107 @@
+import json
+import os
+import zipfile
+
+import pytest
+from PIL import Image
+
+from flashcard_archive import ArchiveExporter, ArchiveImporter, read_manifest
+from flashcard_engine import DeckEngine
+
+
+def make_engine(path, courses):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(courses, f)
+    return DeckEngine(path, "json", save_delay=0)
+
+
+@pytest.fixture
+def source_deck(tmp_path):
+    pictures = tmp_path / "pictures"
+    pictures.mkdir()
+    Image.new("RGB", (8, 8), "red").save(pictures / "red.png")
+    Image.new("RGB", (8, 8), "blue").save(pictures / "blue.bmp")
+    red, blue = str(pictures / "red.png"), str(pictures / "blue.bmp")
+    engine = make_engine(str(tmp_path / "source.json"), {
+        "Colours": [
+            {"question": "red?", "answer": "", "question_imgs": [red], "answer_imgs": []},
+            {"question": "both?", "answer": "", "question_imgs": [red], "answer_imgs": [blue],
+             "review": {"due": 123, "interval": 1, "ease": 2.5, "reps": 1}},
+            {"question": "gone?", "answer": "", "question_imgs": [str(pictures / "missing.png")]},
+        ],
+        "Empty": [],
+    })
+    yield engine
+    engine.close()
+
+
+def test_export_writes_each_image_once(tmp_path, source_deck):
+    path = str(tmp_path / "deck.fcz")
+    exporter = ArchiveExporter(source_deck, ["Colours"], path).run()
+    assert (exporter.cards, exporter.images, exporter.missing_images) == (3, 2, 1)
+    assert exporter.errors[0][0].endswith("missing.png")
+    assert not os.path.exists(path + ".tmp")
+
+    with zipfile.ZipFile(path) as zf:
+        manifest = read_manifest(zf)
+        assert [(c["name"], c["cards"]) for c in manifest["courses"]] == [("Colours", 3)]
+        assert sorted(name for name in zf.namelist() if name.startswith("images/")) == [
+            "images/000000.png", "images/000001.bmp",
+        ]
+        lines = [json.loads(line) for line in zf.read(manifest["courses"][0]["member"]).splitlines()]
+    assert lines[1]["question_imgs"] == ["images/000000.png"]
+    assert lines[1]["answer_imgs"] == ["images/000001.bmp"]
+    assert lines[2]["question_imgs"] == []
+    assert "id" not in lines[0]
+
+
+def test_cancelled_export_leaves_nothing_behind(tmp_path, source_deck):
+    path = str(tmp_path / "deck.fcz")
+    exporter = ArchiveExporter(source_deck, ["Colours", "Empty"], path)
+    steps = exporter.steps()
+    next(steps)
+    exporter.cancel()
+    for _ in steps:
+        pass
+    assert exporter.finished
+    assert exporter.images == 1
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_import_restores_cards_images_and_reviews(tmp_path, source_deck):
+    path = str(tmp_path / "deck.fcz")
+    ArchiveExporter(source_deck, ["Colours", "Empty"], path).run()
+
+    target = make_engine(str(tmp_path / "target.json"), {})
+    importer = ArchiveImporter(target, path).run()
+    assert (importer.imported, importer.courses, importer.images) == (3, 2, 2)
+    assert target.course_names() == ["Colours", "Empty"]
+    cards = list(target.courses["Colours"])
+    assert [card["question"] for card in cards] == ["red?", "both?", "gone?"]
+    assert cards[1]["review"]["due"] == 123
+    red = cards[0]["question_imgs"][0]
+    assert red.startswith("asset:")
+    assert cards[1]["question_imgs"] == (red,)
+    assert cards[2]["question_imgs"] == ()
+    with Image.open(target.assets.path(cards[1]["answer_imgs"][0])) as img:
+        assert img.getpixel((0, 0)) == (0, 0, 255)
+
+    # Importing again adds no duplicate cards or image files.
+    again = ArchiveImporter(target, path).run()
+    assert (again.imported, again.duplicates) == (0, 3)
+    assert len(target.assets) == 2
+    target.close()
+
+
+def test_import_rejects_other_files(tmp_path, source_deck):
+    not_zip = tmp_path / "notes.fcz"
+    not_zip.write_text("hello")
+    with pytest.raises(ValueError):
+        ArchiveImporter(source_deck, str(not_zip)).run()
+
+    other_zip = str(tmp_path / "other.fcz")
+    with zipfile.ZipFile(other_zip, "w") as zf:
+        zf.writestr("manifest.json", json.dumps({"format": "something-else"}))
+    with pytest.raises(ValueError):
+        ArchiveImporter(source_deck, other_zip).run()
@@ -0,0 +1,72 @@
+import json
+import os
+
+from PIL import Image
+
+from flashcard_assets import AssetStore, is_asset_ref
+from flashcard_engine import DeckEngine, main
+from flashcard_images import ImageCache, ThumbnailStore
+
+
+def write_bytes(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_identical_files_are_stored_once(tmp_path):
+    store = AssetStore(str(tmp_path / "assets"))
+    first = store.ingest(write_bytes(tmp_path / "a.PNG", b"same"))
+    second = store.ingest(write_bytes(tmp_path / "b.png", b"same"))
+    other = store.ingest(write_bytes(tmp_path / "c.weird ext", b"other"))
+    assert first == second and is_asset_ref(first) and first.endswith(".png")
+    assert not other.endswith("ext")
+    assert len(store) == 2
+    assert store.ingest(first) == first
+    with open(store.path(first), "rb") as f:
+        assert f.read() == b"same"
+    assert store.digest(first) == os.path.basename(store.path(first))[:32]
+    assert [name for name in os.listdir(store.directory) if name.endswith(".tmp")] == []
+
+    # A new store over the same directory finds what was stored.
+    reopened = AssetStore(store.directory)
+    assert reopened.exists(first)
+    assert not reopened.exists("asset:" + "0" * 32 + ".png")
+    assert reopened.path("plain/file.png") == "plain/file.png"
+    assert reopened.digest("plain/file.png") is None
+
+
+def test_caches_key_assets_by_reference(tmp_path):
+    Image.new("RGB", (800, 400), "green").save(tmp_path / "pic.png")
+    assets = AssetStore(str(tmp_path / "assets"))
+    ref = assets.ingest(str(tmp_path / "pic.png"))
+
+    thumbnails = ThumbnailStore(str(tmp_path / "thumbs"), assets=assets)
+    assert not thumbnails.has(ref, (100, 100))
+    assert thumbnails.get(ref, (100, 100)).size == (100, 50)
+    assert thumbnails.has(ref, (100, 100))
+
+    cache = ImageCache(loader=thumbnails.get, assets=assets)
+    assert cache.get(ref, (100, 100)).size == (100, 50)
+    assert cache.lookup(ref, (100, 100)) is not None
+
+
+def test_ingest_images_moves_cards_onto_assets(tmp_path, capsys):
+    Image.new("RGB", (8, 8)).save(tmp_path / "pic.png")
+    deck = tmp_path / "deck.json"
+    pic = str(tmp_path / "pic.png")
+    deck.write_text(json.dumps({"A": [
+        {"question": "one", "question_imgs": [pic]},
+        {"question": "two", "answer_imgs": [pic, str(tmp_path / "gone.png")]},
+        {"question": "three"},
+    ]}))
+    assert main(["-f", str(deck), "-b", "json", "ingest-images"]) == 2
+    out, err = capsys.readouterr()
+    assert "Updated 2 cards; 1 assets stored, 1 images unreadable" in out
+    assert "gone.png" in err
+
+    engine = DeckEngine(str(deck), "json")
+    one, two, _ = engine.courses["A"]
+    assert one["question_imgs"][0] == two["answer_imgs"][0]
+    assert engine.assets.exists(one["question_imgs"][0])
+    assert two["answer_imgs"][1] == str(tmp_path / "gone.png")
+    engine.close()
@@ -0,0 +1,114 @@
+import json
+import sys
+
+import pytest
+
+from flashcard_cards import COMPACT_MIN_TOMBSTONES, Card, CourseCards, cards_from_json, json_default
+
+CARD = {
+    "question": "q",
+    "answer": "a",
+    "question_imgs": ["images/one.png", "images/two.png"],
+    "answer_imgs": [],
+    "review": {"due": 5, "interval": 1},
+    "source": "import",
+}
+
+
+def test_card_reads_like_its_dict():
+    card = Card.from_dict(CARD)
+    assert card["question"] == "q"
+    assert card["question_imgs"] == ("images/one.png", "images/two.png")
+    assert card["answer_imgs"] == ()
+    assert card.get("review") == {"due": 5, "interval": 1}
+    assert card["source"] == "import"
+    assert card.get("missing", 3) == 3
+    assert len(card) == 6
+    assert set(card) == set(CARD)
+    assert card.to_dict() == CARD
+
+
+def test_card_without_review_hides_it():
+    card = Card("q", "a")
+    assert "review" not in card
+    assert card.get("review") is None
+    reviewed = card.with_review({"due": 1})
+    assert reviewed["review"] == {"due": 1}
+    assert card.review is None
+    assert reviewed.question == "q"
+
+
+def test_cards_share_image_directories():
+    first = Card(question_imgs=["deck/images/a.png"])
+    second = Card(question_imgs=["deck/images/b.png"], answer_imgs=["deck\\images\\c.png"])
+    assert first._question_imgs[0] is second._question_imgs[0]
+    assert second.answer_imgs == ("deck\\images\\c.png",)
+
+
+
+def test_packing_keeps_no_reference_to_dropped_paths():
+    path = "".join(["deck/images/", "dropped.png"])
+    refs = sys.getrefcount(path)
+    card = Card(question_imgs=[path], answer_imgs=[path, "other.png"])
+    assert card.question_imgs == ("deck/images/dropped.png",)
+    del card
+    assert sys.getrefcount(path) == refs
+
+def test_json_round_trip():
+    courses = cards_from_json({"A": [dict(CARD), {"question": "bare"}]})
+    assert all(isinstance(card, Card) for card in courses["A"])
+    assert json.loads(json.dumps(courses, default=json_default)) == {
+        "A": [dict(CARD, id=1), {"id": 2, "question": "bare", "answer": "", "question_imgs": [], "answer_imgs": []}],
+    }
+
+
+def make_cards(count):
+    return CourseCards(Card(f"q{i}", f"a{i}", id=i) for i in range(1, count + 1))
+
+
+def test_delete_leaves_other_cards_in_place():
+    cards = make_cards(5)
+    removed = cards.remove(3)
+    assert removed.question == "q3"
+    assert 3 not in cards
+    assert len(cards) == 4
+    assert cards.ids() == [1, 2, 4, 5]
+    assert [card.question for card in cards] == ["q1", "q2", "q4", "q5"]
+    assert cards[4].question == "q4"
+    assert cards.id_at(2) == 4
+    assert cards.id_at(-1) == 5
+
+
+def test_compaction_keeps_ids_and_order():
+    count = COMPACT_MIN_TOMBSTONES * 3
+    cards = make_cards(count)
+    kept = [card_id for card_id in range(1, count + 1) if card_id % 3 == 0]
+    for card_id in range(1, count + 1):
+        if card_id % 3:
+            cards.remove(card_id)
+    # Tombstones outnumbering live cards triggered a compaction on the way.
+    assert cards._tombstones < COMPACT_MIN_TOMBSTONES * 2
+    cards.compact()
+    assert cards._tombstones == 0
+    assert cards.ids() == kept
+    for card_id in kept:
+        assert cards[card_id].question == f"q{card_id}"
+
+    cards.replace(Card("changed", "", id=kept[0]))
+    cards.append(Card("new", "", id=count + 1))
+    assert cards[kept[0]].question == "changed"
+    assert cards.ids() == kept + [count + 1]
+
+
+def test_append_rejects_duplicate_ids():
+    cards = make_cards(2)
+    with pytest.raises(KeyError):
+        cards.append(Card("again", "", id=2))
+    assert cards.new_id() not in cards
+
+
+def test_ids_from_json_are_stable_across_loads():
+    data = [{"question": "a"}, {"question": "b", "id": 2}, {"question": "c"}]
+    first = CourseCards.from_json(data).ids()
+    assert first == CourseCards.from_json(data).ids()
+    assert len(set(first)) == 3
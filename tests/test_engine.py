@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from flashcard_engine import SHUFFLE_MODE, SPACED_REPETITION_MODE, DeckEngine, main
+
+
+def card(question):
+    return {"question": question, "answer": "", "question_imgs": [], "answer_imgs": []}
+
+
+@pytest.fixture
+def deck_path(tmp_path):
+    path = tmp_path / "deck.json"
+    path.write_text(json.dumps({"A": [card(str(i)) for i in range(5)], "B": []}))
+    return str(path)
+
+
+@pytest.fixture
+def engine(deck_path):
+    engine = DeckEngine(deck_path, "json", save_delay=0)
+    yield engine
+    engine.close()
+
+
+def test_shuffle_pass_shows_every_card_once(engine):
+    engine.set_current_course("A")
+    seen = [engine.next_card(SHUFFLE_MODE)["question"] for _ in range(5)]
+    assert sorted(seen) == ["0", "1", "2", "3", "4"]
+    # The next card starts a new pass.
+    assert engine.next_card(SHUFFLE_MODE) is not None
+
+
+def test_deleting_a_card_mid_pass_skips_it(engine):
+    engine.set_current_course("A")
+    first = engine.next_card(SHUFFLE_MODE)
+    upcoming = engine.upcoming_card_ids(4)
+    engine.delete_card("A", upcoming[0])
+    engine.update_card("A", upcoming[1], card("edited"))
+    rest = [engine.next_card(SHUFFLE_MODE) for _ in range(3)]
+    assert [c.id for c in rest] == upcoming[1:]
+    assert rest[0]["question"] == "edited"
+    assert first.id not in upcoming
+    assert engine.deck_seen == engine.deck_count == 4
+
+
+def test_shuffled_pass_resumes_after_a_restart(deck_path, engine):
+    engine.set_current_course("A")
+    first = engine.next_card(SHUFFLE_MODE)
+    upcoming = engine.upcoming_card_ids(4)
+    engine.close()
+
+    reopened = DeckEngine(deck_path, "json", save_delay=0)
+    reopened.set_current_course("A")
+    assert (reopened.deck_seen, reopened.deck_count) == (1, 5)
+    assert [reopened.next_card(SHUFFLE_MODE).id for _ in range(4)] == upcoming
+    assert first.id not in upcoming
+    reopened.close()
+
+
+def test_spaced_repetition_stops_when_nothing_is_due(engine):
+    engine.set_current_course("A")
+    now = 1_000_000
+    for _ in range(5):
+        assert engine.next_card(SPACED_REPETITION_MODE, now=now) is not None
+        engine.grade_current_card(4, now=now)
+    assert engine.next_card(SPACED_REPETITION_MODE, now=now) is None
+    assert engine.next_due > now
+    assert engine.session_review_count == 5
+
+
+def test_changes_are_saved(deck_path, engine):
+    engine.add_course("C")
+    engine.add_card("C", card("new"))
+    engine.close()
+    reopened = DeckEngine(deck_path, "json")
+    assert [c["question"] for c in reopened.courses["C"]] == ["new"]
+    reopened.close()
+
+
+def test_empty_course_has_no_next_card(engine):
+    engine.set_current_course("B")
+    assert engine.next_card(SHUFFLE_MODE) is None
+
+
+def test_command_line_study(deck_path, capsys):
+    assert main(["-f", deck_path, "-b", "json", "courses"]) == 0
+    assert capsys.readouterr().out.splitlines() == ["A\t5", "B\t0"]
+    assert main(["-f", deck_path, "-b", "json", "study", "A", "-m", "srs"]) == 0
+    assert "Studied 5 cards" in capsys.readouterr().out
+    assert main(["-f", deck_path, "-b", "json", "study", "Missing"]) == 1
@@ -0,0 +1,179 @@
+import json
+import os
+import time
+
+from flashcard_engine import SHUFFLE_MODE, SPACED_REPETITION_MODE, DeckEngine
+from flashcard_history import (
+    CHECKPOINT_FILE, OUTCOME_SEEN, CourseStats, ReviewHistory, ReviewStats, day_number, segment_name,
+)
+
+DAY = 24 * 60 * 60
+# Noon, so adding whole days never crosses into the wrong local date.
+NOON = 1_700_000_000 - 1_700_000_000 % DAY + DAY // 2
+
+
+def open_history(tmp_path, **kwargs):
+    return ReviewHistory(str(tmp_path / "history"), save_delay=0, **kwargs)
+
+
+def totals(history):
+    return ({name: stats.to_json() for name, stats in history.courses.items()},
+            {name: {card_id: stats.to_json() for card_id, stats in cards.items()}
+             for name, cards in history.cards.items()})
+
+
+def test_review_stats_accumulate_one_review_at_a_time():
+    stats = ReviewStats()
+    for outcome, reveal in ((5, 2.0), (4, None), (1, 4.0), (3, None), (OUTCOME_SEEN, None)):
+        stats.add(NOON, 0xFFFFFFFF if reveal is None else int(reveal * 1000), outcome)
+    assert (stats.reviews, stats.correct, stats.lapses, stats.graded) == (5, 3, 1, 4)
+    assert stats.accuracy == 0.75
+    assert stats.mean_reveal_seconds == 3.0
+    assert (stats.streak, stats.best_streak) == (1, 2)
+    assert ReviewStats().accuracy is None
+    assert ReviewStats.from_json(stats.to_json()).to_json() == stats.to_json()
+
+
+def test_course_stats_count_consecutive_study_days():
+    stats = CourseStats()
+    for day in (0, 0, 1, 2, 5, 6):
+        stats.add(NOON + day * DAY, 1000, 4)
+    assert stats.study_days == 5
+    assert (stats.day_streak, stats.best_day_streak) == (2, 3)
+    assert stats.last_day == day_number(NOON + 6 * DAY)
+
+
+def test_totals_survive_reopening(tmp_path):
+    history = open_history(tmp_path)
+    history.record("A", 1, 5, 1.5, when=NOON)
+    history.record("A", 1, 2, None, when=NOON + 60)
+    history.record("Ünïcode", 7, OUTCOME_SEEN, 3.0, when=NOON)
+    assert history.flush() is None
+    before = totals(history)
+    assert history.card_stats("A", 1).lapses == 1
+    assert history.close() is None
+
+    reopened = open_history(tmp_path)
+    # The close wrote a checkpoint, so nothing is replayed.
+    assert reopened.load() == 0
+    assert totals(reopened) == before
+    reopened.close()
+
+
+def test_a_crash_replays_the_log_and_drops_a_torn_record(tmp_path):
+    history = open_history(tmp_path)
+    for card_id in range(10):
+        history.record("A", card_id, 4, when=NOON)
+    history.flush()
+    before = totals(history)
+    # Die without closing, halfway through writing another record.
+    segment = os.path.join(history.directory, segment_name(1))
+    with open(segment, "ab") as f:
+        f.write(b"\x02\x00\x00")
+
+    history = open_history(tmp_path)
+    assert totals(history) == before
+    history.record("A", 0, 1, when=NOON)
+    history.close()
+
+    history = open_history(tmp_path)
+    assert history.card_stats("A", 0).to_json()[:5] == [2, 0, 0, 1, 1]
+    assert history.course_stats("A").reviews == 11
+    history.close()
+
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_the_next_review_after_a_failed_write_requests_another(tmp_path):
+    def fail(events):
+        raise OSError("disk full")
+
+    history = open_history(tmp_path)
+    history._append = fail
+    history.record("A", 1, 4, when=NOON)
+    wait_until(lambda: history.save_error is not None)
+    del history._append
+    history.record("A", 2, 4, when=NOON)
+    wait_until(lambda: history.save_error is None)
+    history.close()
+
+    history = open_history(tmp_path)
+    assert sorted(history.cards["A"]) == [1, 2]
+    history.close()
+
+def test_old_segments_are_deleted_once_checkpointed(tmp_path):
+    history = open_history(tmp_path, segment_bytes=500, keep_segments=2, checkpoint_events=10)
+    for i in range(200):
+        history.record("A", i % 5, i % 6, when=NOON + i)
+        history.flush()
+    before = totals(history)
+    history.close()
+    segments = [name for name in os.listdir(history.directory) if name.endswith(".log")]
+    assert len(segments) <= 2
+
+    history = open_history(tmp_path)
+    assert totals(history) == before
+    assert history.course_stats("A").reviews == 200
+    history.close()
+
+
+def test_totals_are_rebuilt_from_the_log_without_a_checkpoint(tmp_path):
+    history = open_history(tmp_path)
+    history.record("A", 1, 4, when=NOON)
+    history.record("A", 2, 0, when=NOON)
+    history.close()
+    with open(os.path.join(history.directory, CHECKPOINT_FILE), "w") as f:
+        f.write("{damaged")
+
+    history = open_history(tmp_path)
+    assert history.course_stats("A").reviews == 2
+    assert [card_id for card_id, _ in history.hardest_cards("A", 1)] == [2]
+    history.close()
+
+
+def test_forgotten_cards_drop_out_of_checkpoints(tmp_path):
+    history = open_history(tmp_path)
+    history.record("A", 1, 4, when=NOON)
+    history.record("A", 2, 4, when=NOON)
+    history.forget("A", 1)
+    history.flush()
+    history.close()
+    with open(os.path.join(history.directory, CHECKPOINT_FILE)) as f:
+        assert list(json.load(f)["cards"]["A"]) == ["2"]
+
+    history = open_history(tmp_path)
+    assert history.card_stats("A", 1) is None
+    assert history.course_stats("A").reviews == 2
+    history.close()
+
+
+def test_engine_logs_each_card_when_moving_on(tmp_path):
+    path = tmp_path / "deck.json"
+    path.write_text(json.dumps({"A": [{"question": str(i)} for i in range(3)]}))
+    engine = DeckEngine(str(path), "json", save_delay=0)
+    engine.set_current_course("A")
+    first = engine.next_card(SHUFFLE_MODE, now=NOON)
+    engine.reveal_answer(now=NOON + 2)
+    engine.reveal_answer(now=NOON + 9)
+    second = engine.next_card(SHUFFLE_MODE, now=NOON + 10)
+    stats = engine.history.card_stats("A", first.id)
+    assert (stats.reviews, stats.graded, stats.mean_reveal_seconds) == (1, 0, 2.0)
+    assert engine.history.card_stats("A", second.id) is None
+
+    card = engine.next_card(SPACED_REPETITION_MODE, now=NOON + 20)
+    engine.grade_current_card(5, now=NOON + 21)
+    assert engine.history.card_stats("A", card.id).correct == 1
+    engine.delete_card("A", card.id)
+    assert engine.history.card_stats("A", card.id) is None
+    engine.close()
+
+    reopened = DeckEngine(str(path), "json")
+    # The second shuffled card was logged as seen on close.
+    assert reopened.history.course_stats("A").reviews == 3
+    reopened.close()
@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from flashcard_images import (
+    EXIF_ORIENTATION, ImageCache, ImagePrefetcher, ThumbnailStore, fit_size, open_display_image,
+)
+
+
+def make_image(path, size=(200, 100), color=(200, 30, 30)):
+    Image.new("RGB", size, color).save(path)
+    return str(path)
+
+
+def test_cache_returns_resized_images_and_counts_hits(tmp_path):
+    path = make_image(tmp_path / "a.png")
+    cache = ImageCache()
+    img = cache.get(path, (50, 50))
+    assert img.size == (50, 25)
+    assert cache.get(path, (50, 50)) is img
+    # Another size is another entry.
+    assert cache.get(path, (100, 100)).size == (100, 50)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+
+
+def test_cache_evicts_least_recently_used_within_budget(tmp_path):
+    paths = [make_image(tmp_path / f"{i}.png", (10, 10)) for i in range(3)]
+    # Room for two 10x10 RGB images
+    cache = ImageCache(max_bytes=2 * 10 * 10 * 3)
+    first = cache.get(paths[0], (10, 10))
+    cache.get(paths[1], (10, 10))
+    cache.get(paths[0], (10, 10))
+    cache.get(paths[2], (10, 10))
+
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] <= stats["max_bytes"]
+    assert cache.get(paths[0], (10, 10)) is first
+    assert cache.stats()["misses"] == 3
+
+
+def test_edited_file_is_decoded_again(tmp_path):
+    path = make_image(tmp_path / "a.png", color=(255, 0, 0))
+    cache = ImageCache()
+    assert cache.get(path, (10, 10)).getpixel((0, 0)) == (255, 0, 0)
+    make_image(path, color=(0, 0, 255))
+    os.utime(path, ns=(1, 10 ** 18))
+    assert cache.get(path, (10, 10)).getpixel((0, 0)) == (0, 0, 255)
+
+
+def test_missing_file_raises_oserror(tmp_path):
+    cache = ImageCache()
+    with pytest.raises(OSError):
+        cache.get(str(tmp_path / "missing.png"), (10, 10))
+
+
+def test_lookup_only_returns_decoded_images(tmp_path):
+    path = make_image(tmp_path / "a.png")
+    cache = ImageCache()
+    assert cache.lookup(path, (50, 50)) is None
+    img = cache.get(path, (50, 50))
+    assert cache.lookup(path, (50, 50)) is img
+
+
+def deliver(prefetcher, results, count, timeout=10):
+    """Poll run_ready() like the Tk loop until count callbacks have run."""
+    deadline = time.monotonic() + timeout
+    while len(results) < count and time.monotonic() < deadline:
+        prefetcher.run_ready()
+        time.sleep(0.01)
+
+
+def test_prefetcher_decodes_into_the_cache_and_calls_back_on_the_polling_thread(tmp_path):
+    path = make_image(tmp_path / "a.png")
+    missing = str(tmp_path / "missing.png")
+    cache = ImageCache()
+    prefetcher = ImagePrefetcher(cache)
+    results = {}
+    for p in (path, missing):
+        prefetcher.request(p, (50, 50), lambda img, p=p: results.update({p: (img, threading.current_thread())}))
+    deliver(prefetcher, results, 2)
+    prefetcher.shutdown()
+
+    img, thread = results[path]
+    assert img.size == (50, 25)
+    assert thread is threading.current_thread()
+    assert cache.lookup(path, (50, 50)) is img
+    # A file that can't be decoded is reported as None.
+    assert results[missing][0] is None
+
+
+def test_cancelled_requests_never_call_back(tmp_path):
+    path = make_image(tmp_path / "a.png")
+    prefetcher = ImagePrefetcher(ImageCache())
+    results = []
+    prefetcher.request(path, (50, 50), results.append)
+    prefetcher.cancel()
+    time.sleep(0.2)
+    prefetcher.run_ready()
+    prefetcher.shutdown()
+    assert results == []
+
+
+def thumbnail_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".raw"))
+
+
+def test_thumbnail_store_reuses_thumbnails_across_sessions(tmp_path):
+    path = make_image(tmp_path / "a.png", (300, 150))
+    thumbs = str(tmp_path / "thumbs")
+    store = ThumbnailStore(thumbs)
+    first = store.get(path, (60, 60))
+    assert first.size == (60, 30)
+    store.flush()
+
+    store = ThumbnailStore(thumbs)
+    again = store.get(path, (60, 60))
+    assert again.tobytes() == first.tobytes()
+    assert len(thumbnail_files(thumbs)) == 1
+
+
+def test_thumbnail_store_shares_thumbnails_of_identical_files(tmp_path):
+    a = make_image(tmp_path / "a.png")
+    b = tmp_path / "b.png"
+    b.write_bytes((tmp_path / "a.png").read_bytes())
+    thumbs = str(tmp_path / "thumbs")
+    store = ThumbnailStore(thumbs)
+    store.get(a, (50, 50))
+    store.get(str(b), (50, 50))
+    assert len(thumbnail_files(thumbs)) == 1
+
+
+def test_thumbnail_store_rebuilds_a_changed_source_and_a_damaged_thumbnail(tmp_path):
+    path = make_image(tmp_path / "a.png", color=(255, 0, 0))
+    thumbs = str(tmp_path / "thumbs")
+    store = ThumbnailStore(thumbs)
+    store.get(path, (20, 20))
+    make_image(path, size=(200, 100), color=(0, 0, 255))
+    os.utime(path, ns=(1, 10 ** 18))
+    assert store.get(path, (20, 20)).getpixel((0, 0)) == (0, 0, 255)
+
+    for name in thumbnail_files(thumbs):
+        with open(os.path.join(thumbs, name), "wb") as f:
+            f.write(b"damaged")
+    assert store.get(path, (20, 20)).getpixel((0, 0)) == (0, 0, 255)
+
+
+def test_thumbnail_store_evicts_least_recently_used_files(tmp_path):
+    paths = [make_image(tmp_path / f"{i}.png", color=(i, 0, 0)) for i in range(5)]
+    thumbs = str(tmp_path / "thumbs")
+    # A 20x10 RGB thumbnail is 600 bytes of pixels plus a short header.
+    store = ThumbnailStore(thumbs, max_bytes=2000)
+    for path in paths:
+        store.get(path, (20, 20))
+    assert store.current_bytes <= 2000
+    assert len(thumbnail_files(thumbs)) == 3
+    assert store.current_bytes == sum(os.path.getsize(os.path.join(thumbs, name))
+                                      for name in thumbnail_files(thumbs))
+    # Sources are forgotten with their thumbnails, so the index stays as small.
+    store.flush()
+    with open(store.index_path, encoding="utf-8") as f:
+        assert sorted(json.load(f)["sources"]) == sorted(paths[2:])
+
+
+def test_fit_size_keeps_the_aspect_and_never_enlarges():
+    assert fit_size(4000, 3000, (400, 400)) == (400, 300)
+    assert fit_size(100, 50, (400, 400)) == (100, 50)
+    assert fit_size(10000, 1, (400, 400)) == (400, 1)
+
+
+def test_display_images_are_shrunk_to_fit(tmp_path):
+    path = str(tmp_path / "photo.jpg")
+    Image.new("RGB", (4000, 3000), "green").save(path, quality=90)
+    img = open_display_image(path, (400, 400))
+    assert img.size == (400, 300)
+    assert img.mode == "RGB"
+    r, g, b = img.getpixel((200, 150))
+    assert g > 100 and r < 30 and b < 30
+
+    palette = str(tmp_path / "palette.gif")
+    Image.new("P", (50, 80)).save(palette)
+    img = open_display_image(palette, (400, 400))
+    assert (img.size, img.mode) == ((50, 80), "RGBA")
+
+
+def test_display_images_are_turned_upright(tmp_path):
+    # Stored sideways: a 200x100 image with red on the left, tagged
+    # "rotate 90 degrees clockwise to display" (orientation 6).
+    img = Image.new("RGB", (200, 100), "blue")
+    img.paste((255, 0, 0), (0, 0, 100, 100))
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = 6
+    path = str(tmp_path / "sideways.jpg")
+    img.save(path, exif=exif, quality=95)
+
+    upright = open_display_image(path, (50, 100))
+    assert upright.size == (50, 100)
+    top, bottom = upright.getpixel((25, 10)), upright.getpixel((25, 90))
+    assert top[0] > 200 and top[2] < 60
+    assert bottom[2] > 200 and bottom[0] < 60
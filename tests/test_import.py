@@ -0,0 +1,129 @@
+import json
+
+import pytest
+from PIL import Image
+
+import flashcard_import
+from flashcard_engine import DeckEngine, main
+from flashcard_images import STUDY_IMAGE_SIZE, ThumbnailStore
+from flashcard_import import BulkImporter, DelimitedSource, DirectorySource, open_source
+
+
+@pytest.fixture
+def engine(tmp_path):
+    path = tmp_path / "deck.json"
+    path.write_text(json.dumps({"A": [{"question": "old", "answer": "card"}]}))
+    engine = DeckEngine(str(path), "json", save_delay=0)
+    yield engine
+    engine.close()
+
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def questions(engine, course):
+    return [card["question"] for card in engine.courses[course]]
+
+
+def test_csv_rows_with_and_without_a_header(tmp_path):
+    plain = write(tmp_path / "plain.csv", '﻿q1,a1\n"q, 2","a\n2"\n\n')
+    assert [fields for _, fields in DelimitedSource(plain)] == [
+        {"question": "q1", "answer": "a1"},
+        {"question": "q, 2", "answer": "a\n2"},
+    ]
+    headed = write(tmp_path / "headed.tsv", "Answer\tQuestion\na1\tq1\n")
+    source = open_source(headed)
+    assert [fields for _, fields in source] == [{"answer": "a1", "question": "q1"}]
+    assert source.fraction == 1.0
+
+
+def test_import_batches_skips_duplicates_and_reports_invalid_rows(tmp_path, engine):
+    Image.new("RGB", (8, 8)).save(tmp_path / "pic.png")
+    rows = ["old,card", "", "q0,a0,pic.png", ",,;", "q1,a1,missing.png"]
+    rows += [f"q{i},a{i}" for i in range(2, 7)] + ["q2,a2"]
+    source = DelimitedSource(write(tmp_path / "cards.csv", "\n".join(rows) + "\n"))
+    importer = BulkImporter(engine, "A", source, batch_size=2)
+
+    steps = importer.steps()
+    next(steps)
+    assert importer.imported == 2
+    for _ in steps:
+        pass
+    assert importer.finished
+    assert (importer.rows, importer.imported, importer.duplicates, importer.invalid) == (10, 6, 2, 2)
+    assert importer.errors == [("line 4", "no text or images"), ("line 5", "image not found: missing.png")]
+    assert questions(engine, "A") == ["old", "q0", "q2", "q3", "q4", "q5", "q6"]
+    # Images are copied into the deck's asset store.
+    card = engine.courses["A"][engine.courses["A"].ids()[1]]
+    [ref] = card["question_imgs"]
+    assert ref.startswith("asset:") and ref.endswith(".png")
+    with open(engine.assets.path(ref), "rb") as copy, open(tmp_path / "pic.png", "rb") as original:
+        assert copy.read() == original.read()
+
+
+
+def test_import_steps_end_even_when_nothing_is_committed(tmp_path, engine, monkeypatch):
+    monkeypatch.setattr(flashcard_import, "IMPORT_STEP_ROWS", 2)
+    source = DelimitedSource(write(tmp_path / "cards.csv", "old,card\n" * 6 + ",,;\n"))
+    importer = BulkImporter(engine, "A", source)
+    steps = importer.steps()
+    next(steps)
+    assert (importer.rows, importer.imported) == (2, 0)
+    assert len(list(steps)) == 2
+    assert (importer.rows, importer.duplicates, importer.invalid) == (7, 6, 1)
+
+def test_cancelled_import_keeps_committed_batches(tmp_path, engine):
+    source = DelimitedSource(write(tmp_path / "cards.csv", "".join(f"q{i},a\n" for i in range(10))))
+    importer = BulkImporter(engine, "New", source, batch_size=3)
+    steps = importer.steps()
+    next(steps)
+    importer.cancel()
+    for _ in steps:
+        pass
+    assert questions(engine, "New") == ["q0", "q1", "q2"]
+
+
+def test_directory_source_pairs_files_by_card(tmp_path):
+    folder = tmp_path / "cards"
+    folder.mkdir()
+    write(folder / "001.question.txt", "What?")
+    write(folder / "001.answer.md", "That.")
+    Image.new("RGB", (8, 8)).save(folder / "001.a.2.png")
+    Image.new("RGB", (8, 8)).save(folder / "001.a.1.png")
+    write(folder / "002.q.txt", "Only a question")
+    write(folder / "notes.txt", "stray")
+    source = open_source(str(folder))
+    assert isinstance(source, DirectorySource)
+    assert list(source) == [
+        ("001", {"question": "What?", "answer": "That.", "question_imgs": [],
+                 "answer_imgs": ["001.a.1.png", "001.a.2.png"]}),
+        ("notes.txt", "file name is not <card>.question|answer[.<n>].<ext>"),
+        ("002", {"question": "Only a question", "answer": "", "question_imgs": [], "answer_imgs": []}),
+    ]
+    assert source.fraction == 1.0
+
+
+def test_import_renders_thumbnails_in_worker_processes(tmp_path, engine):
+    for name, colour in (("one", "red"), ("two", "blue")):
+        Image.new("RGB", (800, 600), colour).save(tmp_path / f"{name}.png")
+    source = DelimitedSource(write(tmp_path / "cards.csv", "q1,,one.png\nq2,,two.png;one.png\n"))
+    thumbnails = ThumbnailStore(str(tmp_path / "thumbs"), assets=engine.assets)
+    importer = BulkImporter(engine, "A", source, thumbnails, workers=1).run()
+    assert (importer.thumbnails_done, importer.thumbnails_failed) == (2, 0)
+    refs = [card["question_imgs"][0] for card in list(engine.courses["A"])[1:]]
+    assert all(thumbnails.has(ref, STUDY_IMAGE_SIZE) for ref in refs)
+    assert thumbnails.get(refs[1], STUDY_IMAGE_SIZE).size == (400, 300)
+
+
+def test_command_line_import(tmp_path, capsys):
+    deck = str(tmp_path / "deck.json")
+    source = write(tmp_path / "cards.csv", "q1,a1\nq1,a1\n,,;\n")
+    assert main(["-f", deck, "-b", "json", "import", "New", source]) == 2
+    out, err = capsys.readouterr()
+    assert "Imported 1 cards" in out
+    assert "1 duplicates skipped, 1 invalid" in out
+    assert "line 3: no text or images" in err
+    with open(deck, encoding="utf-8") as f:
+        assert [card["question"] for card in json.load(f)["New"]] == ["q1"]
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from flashcard_metrics import BUCKET_GROWTH, LatencyHistogram, Metrics
+
+
+def test_percentiles_are_accurate_to_one_bucket():
+    histogram = LatencyHistogram()
+    for ms in range(1, 101):
+        histogram.record(ms / 1000)
+    summary = histogram.summary()
+    assert summary["count"] == 100
+    assert summary["mean"] == pytest.approx(0.0505)
+    assert summary["max"] == 0.1
+    for p in (50, 95, 99):
+        assert p / 1000 <= histogram.percentile(p) <= p / 1000 * BUCKET_GROWTH
+    assert LatencyHistogram().percentile(50) == 0.0
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics(enabled=False)
+
+    @metrics.timed("call")
+    def call():
+        return 42
+
+    assert call() == 42
+    with metrics.phase("block"):
+        pass
+    metrics.record_loop_gap(10)
+    snapshot = metrics.snapshot()
+    assert snapshot["phases"] == {}
+    assert snapshot["stalls"] == 0
+
+
+def test_enabled_metrics_time_calls_phases_and_stalls(tmp_path):
+    metrics = Metrics(enabled=True, stall_threshold=0.1)
+
+    @metrics.timed("call")
+    def fail():
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        fail()
+    for _ in range(3):
+        with metrics.phase("block"):
+            pass
+    metrics.record_loop_gap(0.05)
+    metrics.record_loop_gap(0.5)
+
+    snapshot = metrics.snapshot()
+    assert snapshot["phases"]["call"]["count"] == 1
+    assert snapshot["phases"]["block"]["count"] == 3
+    assert (snapshot["stalls"], snapshot["longest_stall"]) == (1, 0.5)
+
+    path = str(tmp_path / "metrics.json")
+    metrics.export(path)
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["phases"].keys() == {"call", "block"}
+
+    metrics.reset()
+    assert metrics.snapshot()["phases"] == {}
@@ -0,0 +1,136 @@
+import json
+import os
+
+import pytest
+from PIL import Image
+
+import flashcard_scan
+from flashcard_engine import DeckEngine, main
+from flashcard_scan import (
+    CORRUPT, MISSING, OK, OVERSIZED, AssetScanner, PrefixRelinker, check_image, split_prefix,
+)
+
+
+def make_image(path, colour="red"):
+    Image.new("RGB", (16, 16), colour).save(path)
+    return str(path)
+
+
+@pytest.fixture
+def deck(tmp_path):
+    """A deck whose cards show a good image, a damaged one, a missing one and an asset."""
+    images = tmp_path / "images"
+    images.mkdir()
+    good = make_image(images / "good.png")
+    damaged = images / "damaged.jpg"
+    damaged.write_bytes(b"\xff\xd8 not really a jpeg")
+    missing = str(images / "missing.png")
+    path = str(tmp_path / "deck.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "A": [{"question": "1", "question_imgs": [good, missing]},
+                  {"question": "2", "answer_imgs": [str(damaged), good]}],
+            "B": [{"question": "3", "question_imgs": [missing]}],
+        }, f)
+    engine = DeckEngine(path, "json", save_delay=0)
+    asset = engine.assets.ingest(make_image(tmp_path / "asset.png", "blue"))
+    engine.add_card("B", {"question": "4", "question_imgs": [asset]})
+    return engine, good, str(damaged), missing, asset
+
+
+def test_scan_finds_missing_files_without_decoding(deck):
+    engine, good, damaged, missing, asset = deck
+    scanner = AssetScanner(engine, workers=2).run()
+    assert scanner.finished
+    assert scanner.cards == 4
+    assert {ref: check.status for ref, check in scanner.results.items()} == {
+        good: OK, damaged: OK, missing: MISSING, asset: OK,
+    }
+    a_ids, b_ids = engine.courses["A"].ids(), engine.courses["B"].ids()
+    assert scanner.cards_by_ref[good] == [("A", a_ids[0]), ("A", a_ids[1])]
+    assert scanner.cards_by_ref[missing] == [("A", a_ids[0]), ("B", b_ids[0])]
+    assert scanner.problem_card_count() == 2
+    assert scanner.missing_folders() == [(os.path.dirname(missing), 1)]
+    engine.close()
+
+
+def test_verify_decodes_and_caches_results(deck):
+    engine, good, damaged, missing, asset = deck
+    scanner = AssetScanner(engine, verify=True, workers=2).run()
+    assert scanner.problems[CORRUPT] == [damaged]
+    assert scanner.results[good].verified
+    assert (scanner.results[good].width, scanner.results[good].height) == (16, 16)
+    assert scanner.problem_card_count() == 3
+    assert scanner.unchanged == 0
+    assert os.path.exists(scanner.cache_path)
+
+    again = AssetScanner(engine, verify=True, workers=2).run()
+    assert again.unchanged == 3
+    assert again.results == scanner.results
+
+    # A changed asset no longer matches its name.
+    with open(engine.assets.path(asset), "ab") as f:
+        f.write(b"tampered")
+    changed = AssetScanner(engine, verify=True, workers=2).run()
+    assert changed.results[asset].status == CORRUPT
+    assert "hash" in changed.results[asset].error
+    engine.close()
+
+
+def test_check_image_reports_oversized_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(flashcard_scan, "OVERSIZED_BYTES", 10)
+    check = check_image(make_image(tmp_path / "big.png"))
+    assert (check.status, check.verified) == (OVERSIZED, False)
+    assert check_image(str(tmp_path)).status == CORRUPT
+
+
+def test_split_prefix_matches_whole_folders():
+    assert split_prefix("/old/images/a.png", "/old/images") == "a.png"
+    assert split_prefix("/old/images/a.png", "/old/images/") == "a.png"
+    assert split_prefix("C:\\pics\\sub\\a.png", "C:\\pics") == "sub\\a.png"
+    assert split_prefix("/old/images2/a.png", "/old/images") is None
+    assert split_prefix("/old/images", "/old/images") is None
+
+
+def test_relink_points_cards_at_the_moved_folder(deck, tmp_path):
+    engine, good, damaged, missing, asset = deck
+    moved = tmp_path / "moved"
+    os.rename(tmp_path / "images", moved)
+    make_image(moved / "missing.png")
+    os.remove(moved / "damaged.jpg")
+
+    dry_run = PrefixRelinker(engine, str(tmp_path / "images"), str(moved), dry_run=True, workers=2).run()
+    assert (dry_run.matched, dry_run.relinked, dry_run.not_found, dry_run.cards_updated) == (3, 2, 1, 3)
+    assert engine.courses["A"][engine.courses["A"].ids()[0]]["question_imgs"] == (good, missing)
+
+    records = []
+    engine.store.add_listener(records.append)
+    relinker = PrefixRelinker(engine, str(tmp_path / "images"), str(moved), workers=2).run()
+    assert relinker.finished
+    # One store change per course, not one per card.
+    assert [(record["op"], len(record["cards"])) for record in records] == [("update_cards", 2), ("update_cards", 1)]
+    assert relinker.cards_updated == 3
+    first, second = engine.courses["A"]
+    assert first["question_imgs"] == (str(moved / "good.png"), str(moved / "missing.png"))
+    # Files not found under the new folder are left as they were.
+    assert second["answer_imgs"] == (damaged, str(moved / "good.png"))
+    assert list(engine.courses["B"])[1]["question_imgs"] == (asset,)
+    engine.close()
+
+
+def test_command_line_scan_and_relink(deck, tmp_path, capsys):
+    engine, good, damaged, missing, asset = deck
+    engine.close()
+    report = str(tmp_path / "report.json")
+    deck_path = engine.store.path
+    assert main(["-f", deck_path, "-b", "json", "scan-images", "-o", report]) == 2
+    assert "1 missing, 0 corrupt and 0 oversized images on 2 cards" in capsys.readouterr().out
+    with open(report, encoding="utf-8") as f:
+        assert [entry["ref"] for entry in json.load(f)[MISSING]] == [missing]
+
+    os.makedirs(tmp_path / "new")
+    make_image(tmp_path / "new" / "missing.png")
+    assert main(["-f", deck_path, "-b", "json", "relink-images",
+                 str(tmp_path / "images"), str(tmp_path / "new")]) == 0
+    assert "Relinked 1 of 3 images" in capsys.readouterr().out
+    assert main(["-f", deck_path, "-b", "json", "scan-images"]) == 0
@@ -0,0 +1,124 @@
+import random
+
+from flashcard_cards import Card
+from flashcard_scheduler import (
+    DAY_SECONDS, DEFAULT_EASE, MIN_EASE, RELEARN_DELAY_SECONDS, ReviewQueue, ShuffleBag, card_due,
+    schedule_review,
+)
+
+NOW = 1_000_000
+
+
+def test_first_good_answers_follow_sm2_intervals():
+    review = schedule_review(None, 4, NOW)
+    assert (review["interval"], review["reps"], review["due"]) == (1, 1, NOW + DAY_SECONDS)
+    review = schedule_review(review, 4, NOW)
+    assert (review["interval"], review["reps"]) == (6, 2)
+    # Quality 4 leaves the ease at 2.5, so the next interval is 6 * 2.5 days.
+    review = schedule_review(review, 4, NOW)
+    assert (review["interval"], review["ease"]) == (15, DEFAULT_EASE)
+    assert review["due"] == NOW + 15 * DAY_SECONDS
+
+
+def test_failed_answer_comes_back_soon_and_lowers_ease():
+    review = schedule_review(schedule_review(None, 5, NOW), 1, NOW)
+    assert (review["interval"], review["reps"]) == (0, 0)
+    assert review["due"] == NOW + RELEARN_DELAY_SECONDS
+    assert review["ease"] < DEFAULT_EASE + 0.1
+
+
+def test_ease_never_drops_below_the_minimum():
+    review = None
+    for _ in range(20):
+        review = schedule_review(review, 0, NOW)
+    assert review["ease"] == MIN_EASE
+
+
+def test_unreviewed_cards_are_due_at_once():
+    assert card_due({"question": "q"}) == 0
+    assert card_due({"review": {"due": 5}}) == 5
+
+
+def test_review_queue_orders_cards_by_due_time():
+    cards = [Card(review={"due": 30}, id=7), Card(id=8), Card(review={"due": 10}, id=9)]
+    queue = ReviewQueue(cards)
+    assert len(queue) == 3
+    assert queue.peek() == (8, 0)
+    queue.reschedule(8, 50)
+    assert queue.peek() == (9, 10)
+    queue.remove(9)
+    assert queue.peek() == (7, 30)
+    queue.reschedule(7, 60)
+    queue.reschedule(10, 40)
+    assert queue.peek() == (10, 40)
+    assert len(queue) == 3
+    assert ReviewQueue([]).peek() is None
+
+
+def test_review_queue_survives_many_reschedules():
+    queue = ReviewQueue(Card(id=card_id) for card_id in range(10))
+    for step in range(1000):
+        queue.reschedule(step % 10, 100 + step)
+    # Stale heap entries are dropped; the queue doesn't grow with the reschedules.
+    assert len(queue._heap) <= 2 * len(queue) + 64
+    assert queue.peek() == (0, 1090)
+
+
+def check_bag(bag):
+    remaining = bag._remaining
+    assert len(set(remaining)) == len(remaining)
+    assert bag._position == {card_id: i for i, card_id in enumerate(remaining)}
+
+
+def test_draws_every_card_once():
+    bag = ShuffleBag(range(100))
+    drawn = [bag.draw() for _ in range(100)]
+    assert sorted(drawn) == list(range(100))
+    assert bag.draw() is None
+    assert bag.seen == 100
+
+
+def test_add_and_remove_keep_the_position_map_in_step():
+    rng = random.Random(1)
+    bag = ShuffleBag(range(50))
+    live = set(range(50))
+    drawn = set()
+    next_id = 50
+    for _ in range(2000):
+        action = rng.random()
+        if action < 0.3:
+            bag.add(next_id)
+            live.add(next_id)
+            next_id += 1
+        elif action < 0.6 and live:
+            card_id = rng.choice(sorted(live))
+            seen = bag.seen
+            bag.remove(card_id)
+            live.discard(card_id)
+            if card_id in drawn:
+                assert bag.seen == seen - 1
+                drawn.discard(card_id)
+        else:
+            card_id = bag.draw()
+            if card_id is not None:
+                assert card_id in live and card_id not in drawn
+                drawn.add(card_id)
+        check_bag(bag)
+        assert set(bag._remaining) == live - drawn
+        assert bag.seen == len(drawn)
+        assert bag.total == len(live)
+
+
+def test_peek_matches_draw_order():
+    bag = ShuffleBag(range(10))
+    upcoming = bag.peek(4)
+    assert [bag.draw() for _ in range(4)] == upcoming
+
+
+def test_restored_pass_drops_deleted_cards():
+    bag = ShuffleBag(range(10))
+    bag.draw()
+    restored = ShuffleBag.from_json(bag.to_json(), {1, 2, 3})
+    check_bag(restored)
+    assert set(restored._remaining) == {1, 2, 3} & set(bag._remaining)
+    assert restored.seen == 1
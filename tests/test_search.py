@@ -0,0 +1,89 @@
+from flashcard_cards import Card, CourseCards
+from flashcard_search import SearchIndex
+
+_next_id = iter(range(1, 10 ** 6))
+
+
+def card(question, answer=""):
+    return Card(question, answer, id=next(_next_id))
+
+
+def deck(courses):
+    return {name: CourseCards(cards) for name, cards in courses.items()}
+
+
+def make_index(courses):
+    index = SearchIndex()
+    index.build(deck(courses))
+    return index
+
+
+def found(index, query):
+    return [hit.question for hit in index.search(query)]
+
+
+def test_every_word_must_match_and_the_last_is_a_prefix():
+    index = make_index({
+        "Bio": [card("What is mitosis?", "Cell division"), card("What is meiosis?", "Division into gametes")],
+        "Chem": [card("What is a mole?", "6.02e23 particles")],
+    })
+    assert sorted(found(index, "what is")) == ["What is a mole?", "What is meiosis?", "What is mitosis?"]
+    assert found(index, "division gam") == ["What is meiosis?"]
+    assert sorted(found(index, "mi")) == ["What is mitosis?"]
+    # A single letter isn't expanded, and a finished word doesn't match longer ones.
+    assert found(index, "m") == []
+    assert found(index, "mito ") == []
+    assert found(index, "nothing here") == []
+
+
+def test_question_matches_rank_above_answer_matches():
+    index = make_index({"A": [card("unrelated", "cell"), card("cell", "unrelated")]})
+    hits = index.search("cell")
+    assert [hit.question for hit in hits] == ["cell", "unrelated"]
+    assert hits[0].score > hits[1].score
+    assert hits[0].course == "A"
+
+
+def test_index_follows_the_deck_through_records():
+    alpha, beta = card("alpha"), card("beta")
+    index = make_index({"A": [alpha, beta]})
+    gamma = card("gamma")
+    index.apply_record({"op": "add_card", "course": "A", "card": gamma})
+    index.apply_record({"op": "update_card", "course": "A", "id": alpha.id, "card": card("delta")})
+    index.apply_record({"op": "delete_card", "course": "A", "id": beta.id})
+    index.apply_record({"op": "add_course", "course": "B"})
+    index.apply_record({"op": "add_card", "course": "B", "card": card("alphabet")})
+
+    assert found(index, "alpha") == ["alphabet"]
+    assert found(index, "beta") == []
+    assert found(index, "delta") == ["delta"]
+    hit = index.search("gamma")[0]
+    assert (hit.course, hit.card_id) == ("A", gamma.id)
+    assert len(index) == 3
+
+
+def test_building_in_steps_picks_up_cards_added_meanwhile():
+    courses = deck({"A": [card(f"word{i}") for i in range(10)], "B": [card("other")]})
+    index = SearchIndex()
+    steps = index.build_steps(courses, chunk_size=3)
+    next(steps)
+    assert not index.ready
+    assert index.search("word") == []
+    record = {"op": "add_card", "course": "A", "card": card("late")}
+    courses["A"].append(record["card"])
+    index.apply_record(record)
+    for _ in steps:
+        pass
+    assert index.ready
+    assert len(found(index, "word")) == 10
+    assert found(index, "late") == ["late"]
+    assert found(index, "other") == ["other"]
+
+
+def test_index_follows_batched_updates():
+    alpha, beta = card("alpha"), card("beta")
+    index = make_index({"A": [alpha, beta]})
+    index.apply_record({"op": "update_cards", "course": "A", "cards": [Card("gamma", id=alpha.id)]})
+    assert found(index, "alpha") == []
+    assert (index.search("gamma")[0].card_id, found(index, "beta")) == (alpha.id, ["beta"])
+    assert len(index) == 2
@@ -0,0 +1,273 @@
+import asyncio
+import json
+
+import pytest
+from PIL import Image
+
+import flashcard_server
+from flashcard_engine import DeckEngine
+from flashcard_images import ThumbnailStore
+from flashcard_server import SessionPass, StudyServer
+
+
+@pytest.fixture
+def engine(tmp_path):
+    path = tmp_path / "deck.json"
+    path.write_text(json.dumps({"A": [{"question": "q", "answer": "a", "question_imgs": [], "answer_imgs": []}]}))
+    engine = DeckEngine(str(path), "json")
+    yield engine
+    engine.close()
+
+
+def run_server(engine, client, thumbnail_store=None):
+    """Start a server on a free port, run client(server) against it, and return its result."""
+    async def main():
+        server = StudyServer(engine, thumbnail_store, port=0, save_delay=0.01)
+        await server.start()
+        try:
+            return await client(server)
+        finally:
+            await server.close()
+    return asyncio.run(main())
+
+
+async def send(server, head, body=b""):
+    """Send one raw request on a new connection; returns (status, headers, JSON body or raw bytes)."""
+    reader, writer = await asyncio.open_connection(server.host, server.port)
+    writer.write(head.encode("latin-1") + b"\r\n\r\n" + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    if not response:
+        return None, None, None
+    head, _, data = response.partition(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    headers = dict(line.split(": ", 1) for line in lines[1:])
+    if headers.get("Content-Type") == "application/json":
+        data = json.loads(data)
+    return int(lines[0].split(" ")[1]), headers, data
+
+
+def get(path, *extra):
+    return ("\r\n".join((f"GET {path} HTTP/1.1", "Connection: close") + extra),)
+
+
+def post(path, payload):
+    body = json.dumps(payload).encode("utf-8")
+    return f"POST {path} HTTP/1.1\r\nConnection: close\r\nContent-Length: {len(body)}", body
+
+
+def test_study_a_course_in_a_session(engine):
+    async def client(server):
+        results = [await send(server, *get("/courses"))]
+        _, _, data = await send(server, *post("/sessions", {}))
+        session = f"/sessions/{data['session']}"
+        for request in (post(f"{session}/next", {"course": "A"}), get(f"{session}/answer"),
+                        post(f"{session}/grade", {"quality": 5}), get(session),
+                        (f"DELETE {session} HTTP/1.1\r\nConnection: close",), get(session)):
+            results.append(await send(server, *request))
+        return [(status, data) for status, _, data in results]
+
+    courses, card, answer, grade, progress, deleted, gone = run_server(engine, client)
+    assert courses == (200, {"courses": [{"name": "A", "cards": 1}]})
+    assert card[0] == 200
+    assert (card[1]["card"]["question"], card[1]["seen"], card[1]["total"]) == ("q", 1, 1)
+    assert answer == (200, {"card": {"course": "A", "id": card[1]["card"]["id"], "answer": "a", "answer_images": []}})
+    assert grade[1]["review"]["reps"] == 1
+    assert progress[1]["reviewed"] == 1
+    assert progress[1]["courses"] == {"A": {"seen": 1, "total": 1}}
+    assert deleted[0] == 204
+    assert gone[0] == 404
+
+
+@pytest.mark.parametrize("count", [0, 1, 2, 3, 12, 97])
+def test_session_pass_visits_every_card_of_the_shared_order_once(count):
+    order = list(range(100, 100 + count))
+    session_pass = SessionPass(count)
+    drawn = [session_pass.draw(order) for _ in range(count)]
+    assert sorted(drawn) == order
+    assert session_pass.draw(order) is None
+    assert (session_pass.seen, session_pass.total) == (count, count)
+
+
+def test_spaced_repetition_introduces_new_cards_until_none_are_due(engine):
+    async def client(server):
+        _, _, data = await send(server, *post("/sessions", {}))
+        session = f"/sessions/{data['session']}"
+        _, _, first = await send(server, *post(f"{session}/next", {"course": "A", "mode": "srs"}))
+        await send(server, *post(f"{session}/grade", {"quality": 4}))
+        _, _, second = await send(server, *post(f"{session}/next", {"course": "A", "mode": "srs"}))
+        return first, second
+
+    first, second = run_server(engine, client)
+    assert first["new"] is True
+    assert second["card"] is None
+    assert second["next_due"] > 0
+
+
+def test_reviews_survive_a_restart(engine):
+    async def grade(server):
+        _, _, data = await send(server, *post("/sessions", {}))
+        session = f"/sessions/{data['session']}"
+        await send(server, *post(f"{session}/next", {"course": "A", "mode": "srs"}))
+        _, _, graded = await send(server, *post(f"{session}/grade", {"quality": 4}))
+        return data["session"], graded["review"]
+
+    session_id, review = run_server(engine, grade)
+
+    async def resume(server):
+        status, _, _ = await send(server, *get(f"/sessions/{session_id}"))
+        return status, server.sessions[session_id].reviews
+
+    status, reviews = run_server(engine, resume)
+    assert status == 200
+    assert list(reviews["A"].values()) == [review]
+
+
+def test_idle_session_is_resumed_after_being_swept(engine, monkeypatch):
+    monkeypatch.setattr(flashcard_server, "SESSION_SWEEP_SECONDS", 0.01)
+    monkeypatch.setattr(flashcard_server, "SESSION_IDLE_SECONDS", 0)
+
+    async def client(server):
+        _, _, data = await send(server, *post("/sessions", {}))
+        session_id = data["session"]
+        await send(server, *post(f"/sessions/{session_id}/next", {"course": "A", "mode": "srs"}))
+        _, _, graded = await send(server, *post(f"/sessions/{session_id}/grade", {"quality": 4}))
+        await asyncio.sleep(0.1)
+        assert session_id not in server.sessions
+        monkeypatch.setattr(flashcard_server, "SESSION_IDLE_SECONDS", 3600)
+        status, _, _ = await send(server, *get(f"/sessions/{session_id}"))
+        return status, graded["review"], server.sessions[session_id].reviews
+
+    status, review, reviews = run_server(engine, client)
+    assert status == 200
+    assert list(reviews["A"].values()) == [review]
+
+
+
+async def graded_session(server, grades=1):
+    """Start a session, grade its first card grades times, and return the session id."""
+    _, _, data = await send(server, *post("/sessions", {}))
+    session = f"/sessions/{data['session']}"
+    for _ in range(grades):
+        await send(server, *post(f"{session}/next", {"course": "A"}))
+        await send(server, *post(f"{session}/grade", {"quality": 1}))
+    return data["session"]
+
+
+def resume_status(engine, session_id):
+    async def client(server):
+        status, _, _ = await send(server, *get(f"/sessions/{session_id}"))
+        return status
+    return run_server(engine, client)
+
+
+def test_ended_session_is_not_restored_after_a_restart(engine):
+    async def client(server):
+        session_id = await graded_session(server)
+        await send(server, f"DELETE /sessions/{session_id} HTTP/1.1\r\nConnection: close")
+        return session_id
+
+    assert resume_status(engine, run_server(engine, client)) == 404
+
+
+def test_sessions_unused_too_long_or_beyond_the_limit_are_forgotten(engine, monkeypatch):
+    async def client(server):
+        return [await graded_session(server) for _ in range(3)]
+
+    first, second, third = run_server(engine, client)
+    monkeypatch.setattr(flashcard_server, "MAX_RESTORABLE_SESSIONS", 2)
+    assert [resume_status(engine, session_id) for session_id in (first, third)] == [404, 200]
+    monkeypatch.setattr(flashcard_server, "RESTORABLE_SESSION_SECONDS", -1)
+    assert resume_status(engine, second) == 404
+
+
+def test_review_log_is_compacted(engine, monkeypatch):
+    monkeypatch.setattr(flashcard_server, "SESSION_SWEEP_SECONDS", 0.01)
+    monkeypatch.setattr(flashcard_server, "REVIEW_LOG_COMPACT_MIN_LINES", 1)
+
+    async def client(server):
+        session_id = await graded_session(server, grades=3)
+        assert server.sessions[session_id].reviewed == 3
+        await asyncio.sleep(0.1)
+        return session_id, server.sessions[session_id].reviews, server.review_log_path
+
+    session_id, reviews, log_path = run_server(engine, client)
+    with open(log_path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
+
+    async def resume(server):
+        await send(server, *get(f"/sessions/{session_id}"))
+        return server.sessions[session_id].reviews
+
+    assert run_server(engine, resume) == reviews
+
+def test_images_are_served_from_the_asset_store(tmp_path, engine):
+    Image.new("RGB", (800, 600), "red").save(tmp_path / "pic.png")
+    ref = engine.assets.ingest(str(tmp_path / "pic.png"))
+    engine.add_card("A", {"question": "pictured", "question_imgs": [ref]})
+    engine.add_card("A", {"question": "by path", "question_imgs": [str(tmp_path / "pic.png")]})
+    thumbnails = ThumbnailStore(str(tmp_path / "thumbs"), assets=engine.assets)
+
+    async def client(server):
+        _, _, data = await send(server, *post("/sessions", {}))
+        session = f"/sessions/{data['session']}"
+        urls = []
+        for _ in range(3):
+            _, _, card = await send(server, *post(f"{session}/next", {"course": "A"}))
+            urls.extend(card["card"]["question_images"])
+        image = await send(server, *get(urls[0]))
+        cached = await send(server, *get(urls[0], f"If-None-Match: {image[1]['ETag']}"))
+        missing = await send(server, *get("/images/" + "0" * 32 + ".png"))
+        return urls, image, cached, missing
+
+    urls, image, cached, missing = run_server(engine, client, thumbnails)
+    # Only asset references are served; plain paths stay private.
+    assert urls == [f"/images/{ref[len('asset:'):]}?size=study"]
+    status, headers, data = image
+    assert (status, headers["Content-Type"]) == (200, "image/jpeg")
+    assert "immutable" in headers["Cache-Control"]
+    assert data[:2] == b"\xff\xd8"
+    assert cached[0] == 304
+    assert missing[0] == 404
+
+
+@pytest.mark.parametrize("request_args, status", [
+    (get("/nowhere"), 404),
+    (get("/sessions"), 405),
+    (("POST /sessions/none/next HTTP/1.1\r\nConnection: close",), 404),
+    (("POST /sessions HTTP/1.1\r\nContent-Length: five",), 400),
+    (("POST /sessions HTTP/1.1\r\nContent-Length: -5",), 400),
+    (("POST /sessions HTTP/1.1\r\nContent-Length: 999999",), 413),
+])
+def test_bad_requests(engine, request_args, status):
+    async def client(server):
+        return await send(server, *request_args)
+    assert run_server(engine, client)[0] == status
+
+
+def test_session_requests_are_checked(engine):
+    async def client(server):
+        _, _, data = await send(server, *post("/sessions", {}))
+        session = f"/sessions/{data['session']}"
+        results = [
+            await send(server, *get(f"{session}/answer")),
+            await send(server, f"POST {session}/next HTTP/1.1\r\nConnection: close\r\nContent-Length: 3", b"[1]"),
+            await send(server, *post(f"{session}/next", {"course": "B"})),
+            await send(server, *post(f"{session}/next", {"course": ["A"]})),
+            await send(server, *post(f"{session}/next", {"course": "A", "mode": "cram"})),
+        ]
+        await send(server, *post(f"{session}/next", {"course": "A"}))
+        results.append(await send(server, *post(f"{session}/grade", {"quality": 6})))
+        return [status for status, _, _ in results]
+
+    assert run_server(engine, client) == [409, 400, 404, 400, 400, 400]
+
+
+def test_handler_errors_are_answered_with_500(engine, monkeypatch):
+    async def client(server):
+        async def broken(*args):
+            raise RuntimeError("bug")
+        monkeypatch.setattr(server, "_dispatch", broken)
+        return await send(server, *get("/courses"))
+    assert run_server(engine, client)[0] == 500
@@ -0,0 +1,393 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import flashcard_storage
+from flashcard_cards import CourseCards
+from flashcard_storage import BackgroundSaver, JournalStore, JsonStore, ShardedStore, SqliteStore, migrate_json_to_sqlite
+
+
+def card(question):
+    return {"question": question, "answer": "", "question_imgs": [], "answer_imgs": []}
+
+
+def questions(cards):
+    return [c.question for c in cards]
+
+
+def crash(store):
+    """Stop using a store without closing it, as if the process had died."""
+    store._journal.close()
+
+
+def test_json_store_round_trip(tmp_path):
+    path = str(tmp_path / "deck.json")
+    store = JsonStore(path)
+    store.load()
+    store.add_course("A")
+    store.add_card("A", card("one"))
+    store.close()
+
+    store = JsonStore(path)
+    assert questions(store.load()["A"]) == ["one"]
+    store.close()
+
+
+def test_background_saver_folds_a_burst_of_requests_into_one_write():
+    writes = []
+    saver = BackgroundSaver(lambda: writes.append(time.monotonic()), delay=0.2)
+    for _ in range(20):
+        saver.request()
+    assert saver.pending
+    time.sleep(0.5)
+    assert len(writes) == 1
+    assert not saver.pending
+    saver.close()
+
+
+def test_background_saver_flush_writes_at_once():
+    writes = []
+    saver = BackgroundSaver(lambda: writes.append(1), delay=60)
+    saver.request()
+    start = time.monotonic()
+    assert saver.flush() is None
+    assert writes == [1]
+    assert time.monotonic() - start < 5
+    saver.close()
+
+
+def test_background_saver_keeps_failed_changes_pending():
+    failures = [OSError("disk full")]
+
+    def write():
+        if failures:
+            raise failures.pop()
+
+    saver = BackgroundSaver(write, delay=0)
+    saver.request()
+    assert isinstance(saver.flush(), OSError)
+    assert saver.pending
+    assert saver.flush() is None
+    assert not saver.pending
+    saver.close()
+
+
+def test_json_store_writes_in_the_background(tmp_path):
+    path = str(tmp_path / "deck.json")
+    store = JsonStore(path, save_delay=0.05)
+    store.load()
+    store.add_course("A")
+    store.add_card("A", card("one"))
+    assert store.save_pending
+    deadline = time.monotonic() + 5
+    while store.save_pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not store.save_pending
+    with open(path, "r", encoding="utf-8") as f:
+        assert [c["question"] for c in json.load(f)["A"]] == ["one"]
+    store.close()
+
+
+def test_journal_replays_after_a_crash_and_drops_a_torn_tail(tmp_path):
+    path = str(tmp_path / "deck.json")
+    store = JournalStore(path)
+    store.load()
+    store.add_course("A")
+    ids = [store.add_card("A", card(question)) for question in ("one", "two", "three")]
+    store.delete_card("A", ids[1])
+    crash(store)
+    with open(store.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"op":"add_card","course":"A","ca')
+
+    store = JournalStore(path)
+    courses = store.load()
+    assert isinstance(courses["A"], CourseCards)
+    assert questions(courses["A"]) == ["one", "three"]
+    assert courses["A"].ids() == [ids[0], ids[2]]
+    # The torn line is gone, so changes after it replay too.
+    store.add_card("A", card("four"))
+    crash(store)
+
+    store = JournalStore(path)
+    assert questions(store.load()["A"]) == ["one", "three", "four"]
+    store.close()
+
+
+def test_journal_compaction_folds_the_journal_into_the_snapshot(tmp_path):
+    path = str(tmp_path / "deck.json")
+    store = JournalStore(path, compact_threshold=10 ** 9)
+    store.load()
+    store.add_course("A")
+    ids = [store.add_card("A", card(str(i))) for i in range(10)]
+    store.compact()
+    store.update_card("A", ids[0], card("changed"))
+    crash(store)
+
+    with open(path, "r", encoding="utf-8") as f:
+        assert len(json.load(f)["A"]) == 10
+    with open(store.journal_path, "r", encoding="utf-8") as f:
+        # The header and the one change made after compacting
+        assert len(f.read().splitlines()) == 2
+
+    store = JournalStore(path)
+    courses = store.load()
+    assert courses["A"].ids() == ids
+    assert questions(courses["A"])[:2] == ["changed", "1"]
+    store.close()
+
+
+
+def test_journal_close_keeps_a_failed_compaction_in_save_error(tmp_path, monkeypatch):
+    def fail(*args):
+        raise OSError("disk full")
+
+    path = str(tmp_path / "deck.json")
+    store = JournalStore(path)
+    store.load()
+    store.add_course("A")
+    store.add_card("A", card("one"))
+    monkeypatch.setattr(flashcard_storage, "write_temp_file", fail)
+    store.close()
+    assert str(store.save_error) == "disk full"
+    monkeypatch.undo()
+
+    store = JournalStore(path)
+    assert questions(store.load()["A"]) == ["one"]
+    store.close()
+
+def test_journal_for_an_older_snapshot_is_not_replayed(tmp_path):
+    path = str(tmp_path / "deck.json")
+    store = JournalStore(path)
+    store.load()
+    store.add_course("A")
+    store.add_card("A", card("one"))
+    crash(store)
+    with open(store.journal_path, "r", encoding="utf-8") as f:
+        stale_journal = f.read()
+
+    store = JournalStore(path)
+    store.load()
+    store.close()
+    # A crash between replacing the snapshot and the journal leaves the old journal.
+    with open(store.journal_path, "w", encoding="utf-8") as f:
+        f.write(stale_journal)
+
+    store = JournalStore(path)
+    assert questions(store.load()["A"]) == ["one"]
+    store.close()
+
+
+def test_automatic_compaction_keeps_every_change(tmp_path):
+    path = str(tmp_path / "deck.json")
+    store = JournalStore(path, compact_threshold=5)
+    store.load()
+    store.add_course("A")
+    for i in range(23):
+        store.add_card("A", card(str(i)))
+    store.close()
+
+    store = JournalStore(path)
+    assert questions(store.load()["A"]) == [str(i) for i in range(23)]
+    store.close()
+
+
+def write_json_deck(path, courses):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(courses, f)
+
+
+def test_sqlite_store_migrates_a_json_deck_on_first_load(tmp_path):
+    path = str(tmp_path / "deck.json")
+    image_card = dict(card("pictured"), question_imgs=["a.png", "b.png"], answer_imgs=["c.png"])
+    write_json_deck(path, {"A": [card("one"), image_card], "B": [card("two")]})
+
+    store = SqliteStore(path)
+    courses = store.load()
+    assert list(courses) == ["A", "B"]
+    # Only the course names are read until a course is used.
+    assert not courses.is_loaded("A")
+    assert questions(courses["A"]) == ["one", "pictured"]
+    assert courses.is_loaded("A")
+    # Cards saved without ids are numbered by position.
+    assert courses["A"].ids() == [1, 2]
+    assert list(courses["A"][2]["question_imgs"]) == ["a.png", "b.png"]
+    assert list(courses["A"][2]["answer_imgs"]) == ["c.png"]
+    store.close()
+
+    # The database is used from now on, even if the JSON file changes.
+    write_json_deck(path, {})
+    store = SqliteStore(path)
+    assert questions(store.load()["B"]) == ["two"]
+    store.close()
+
+
+def test_sqlite_store_keeps_changes_and_reloads_released_courses(tmp_path):
+    path = str(tmp_path / "deck.json")
+    store = SqliteStore(path)
+    store.load()
+    store.add_course("A")
+    ids = [store.add_card("A", card(question)) for question in ("one", "two", "three")]
+    store.delete_card("A", ids[0])
+    store.update_card("A", ids[2], card("changed"))
+    store.release_course("A")
+    assert not store.courses.is_loaded("A")
+    assert questions(store.courses["A"]) == ["two", "changed"]
+    assert store.courses["A"].ids() == ids[1:]
+    store.close()
+
+    store = SqliteStore(path)
+    assert questions(store.load()["A"]) == ["two", "changed"]
+    store.close()
+
+
+
+def test_update_cards_is_one_change_every_backend_keeps(tmp_path):
+    for backend in (JournalStore, SqliteStore, ShardedStore, JsonStore):
+        path = str(tmp_path / f"{backend.__name__}.json")
+        store = backend(path)
+        store.load()
+        store.add_course("A")
+        ids = store.add_cards("A", [card(question) for question in ("one", "two", "three")])
+        records = []
+        store.add_listener(records.append)
+        store.update_cards("A", [dict(card("ONE"), id=ids[0]), dict(card("THREE"), id=ids[2], answer_imgs=["x.png"])])
+        assert [record["op"] for record in records] == ["update_cards"]
+        store.close()
+
+        store = backend(path)
+        courses = store.load()
+        assert questions(courses["A"]) == ["ONE", "two", "THREE"], backend
+        assert courses["A"].ids() == ids
+        assert list(courses["A"][ids[2]]["answer_imgs"]) == ["x.png"]
+        store.close()
+
+def test_sqlite_store_keeps_cards_in_the_order_they_were_added(tmp_path):
+    path = str(tmp_path / "deck.json")
+    # Cards made after ids existed carry large random ids.
+    cards = [dict(card(str(i)), id=(10 - i) * 2 ** 40) for i in range(5)]
+    write_json_deck(path, {"A": [card("old")] + cards})
+    store = SqliteStore(path)
+    store.load()
+    for i in range(5, 30):
+        store.add_card("A", card(str(i)))
+    store.close()
+
+    store = SqliteStore(path)
+    courses = store.load()
+    assert questions(courses["A"]) == ["old"] + [str(i) for i in range(30)]
+    assert courses["A"].ids()[0] == 1
+    store.close()
+
+
+def test_sqlite_store_loaded_on_another_thread(tmp_path):
+    path = str(tmp_path / "deck.json")
+    store = SqliteStore(path)
+    loader = threading.Thread(target=store.load)
+    loader.start()
+    loader.join()
+    store.add_course("A")
+    card_id = store.add_card("A", card("q"))
+    store.release_course("A")
+    assert store.courses["A"].ids() == [card_id]
+    store.close()
+
+
+def test_migrate_json_to_sqlite(tmp_path):
+    path = str(tmp_path / "deck.json")
+    write_json_deck(path, {"A": [card("one"), card("two")]})
+    db_path = migrate_json_to_sqlite(path, str(tmp_path / "copy.db"))
+
+    store = SqliteStore(path)
+    store.db_path = db_path
+    assert questions(store.load()["A"]) == ["one", "two"]
+    store.close()
+
+
+def test_sharded_store_splits_a_json_deck_and_loads_courses_lazily(tmp_path):
+    path = str(tmp_path / "deck.json")
+    write_json_deck(path, {"A": [card("one"), card("two")], "B/C": [card("three")]})
+    store = ShardedStore(path)
+    store.load()
+    store.close()
+
+    with open(store.manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)["courses"]
+    assert [(entry["name"], entry["count"]) for entry in manifest] == [("A", 2), ("B/C", 1)]
+    assert all(os.path.dirname(entry["file"]) == "" for entry in manifest)
+
+    store = ShardedStore(path)
+    courses = store.load()
+    assert list(courses) == ["A", "B/C"]
+    assert not courses.is_loaded("A")
+    assert questions(courses["B/C"]) == ["three"]
+    assert not courses.is_loaded("A")
+    store.close()
+
+
+def test_sharded_store_rewrites_only_the_changed_course(tmp_path):
+    path = str(tmp_path / "deck.json")
+    store = ShardedStore(path)
+    store.load()
+    for course in ("A", "B"):
+        store.add_course(course)
+        store.add_card(course, card(course))
+    store.close()
+    shard_b = os.path.join(store.shard_dir, store._manifest["B"]["file"])
+    os.utime(shard_b, ns=(0, 0))
+
+    store = ShardedStore(path)
+    store.load()
+    store.add_card("A", card("A2"))
+    store.close()
+    assert os.stat(shard_b).st_mtime_ns == 0
+
+    store = ShardedStore(path)
+    courses = store.load()
+    assert questions(courses["A"]) == ["A", "A2"]
+    assert questions(courses["B"]) == ["B"]
+    store.close()
+
+
+def test_sharded_store_course_without_a_shard_file_takes_new_cards(tmp_path):
+    path = str(tmp_path / "deck.json")
+    store = ShardedStore(path, save_delay=0)
+    store.load()
+    store.add_course("X")
+    store.close()
+    shard = os.path.join(store.shard_dir, store._manifest["X"]["file"])
+    if os.path.exists(shard):
+        os.remove(shard)
+
+    store = ShardedStore(path, save_delay=0)
+    courses = store.load()
+    assert isinstance(courses["X"], CourseCards)
+    card_id = store.add_card("X", card("new"))
+    store.close()
+
+    store = ShardedStore(path)
+    assert store.load()["X"].ids() == [card_id]
+    store.close()
+
+
+def test_sharded_store_reports_a_missing_shard_of_a_course_with_cards(tmp_path):
+    path = str(tmp_path / "deck.json")
+    write_json_deck(path, {"A": [card("one")], "B": [card("two")]})
+    store = ShardedStore(path)
+    store.load()
+    store.close()
+    os.remove(os.path.join(store.shard_dir, store._manifest["A"]["file"]))
+
+    store = ShardedStore(path, save_delay=0)
+    courses = store.load()
+    with pytest.raises(ValueError, match="missing"):
+        courses["A"]
+    with pytest.raises(ValueError):
+        store.add_card("A", card("new"))
+    store.add_card("B", card("three"))
+    store.close()
+
+    with open(store.manifest_path, "r", encoding="utf-8") as f:
+        assert [entry["count"] for entry in json.load(f)["courses"]] == [1, 2]
@@ -0,0 +1,135 @@
+import tkinter as tk
+
+import pytest
+
+from flashcard_cards import Card, CourseCards
+from flashcard_widgets import CardBrowser, LabelPool
+
+
+@pytest.fixture
+def root():
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("no display")
+    root.withdraw()
+    yield root
+    root.destroy()
+
+
+def packed(pool):
+    return [label.winfo_manager() == "pack" for label in pool.labels]
+
+
+def test_label_pool_reuses_and_hides_labels(root):
+    pool = LabelPool(tk.Frame(root))
+    first = pool.show(3)
+    labels = list(pool.labels)
+    assert len(pool) == 3
+    assert packed(pool) == [True, True, True]
+
+    second = pool.show(1)
+    assert second != first
+    assert pool.labels == labels
+    assert packed(pool) == [True, False, False]
+
+    pool.show(2)
+    assert pool.labels == labels
+    assert packed(pool) == [True, True, False]
+    pool.clear()
+    assert len(pool) == 0
+    assert packed(pool) == [False, False, False]
+
+
+def test_label_pool_only_reconfigures_changed_labels(root):
+    pool = LabelPool(tk.Frame(root))
+    pool.show(1)
+    image = tk.PhotoImage(width=2, height=2)
+    pool.set(0, image, key="a.png")
+    assert pool.key(0) == "a.png"
+    assert pool.labels[0].cget("image") == str(image)
+    pool.labels[0].config(text="changed elsewhere")
+    # Same image and text: the label is left alone.
+    pool.set(0, image, key="a.png")
+    assert pool.labels[0].cget("text") == "changed elsewhere"
+
+    pool.show(0)
+    pool.show(1)
+    # Hiding a label dropped its image.
+    assert pool.labels[0].cget("image") == ""
+    assert pool.key(0) is None
+
+
+def test_label_pool_append_keeps_the_generation(root):
+    pool = LabelPool(tk.Frame(root))
+    generation = pool.show(1)
+    assert pool.append(text="more") == 1
+    assert pool.generation == generation
+    assert len(pool) == 2
+    assert pool.labels[1].cget("text") == "more"
+
+
+def make_cards(count):
+    return CourseCards(Card(f"question {i:03d}", f"answer {count - i}", id=i + 1) for i in range(count))
+
+
+def shown(browser):
+    return [browser.tree.item(row, "values")[0] for row in browser.tree.get_children()]
+
+
+def test_card_browser_only_fills_the_rows_in_view(root):
+    browser = CardBrowser(root, height=5)
+    browser.set_cards(make_cards(1000))
+    assert len(browser.view) == 1000
+    assert shown(browser) == [f"question {i:03d}" for i in range(5)]
+    browser.scroll(10)
+    assert shown(browser) == [f"question {i:03d}" for i in range(10, 15)]
+    browser.scroll_to(10 ** 6)
+    assert browser.top == 995
+    assert shown(browser)[-1] == "question 999"
+
+
+def test_card_browser_filters_and_sorts_ids(root):
+    browser = CardBrowser(root, height=5)
+    browser.set_cards(make_cards(20))
+    browser.set_filter("question 01")
+    assert browser.view == list(range(11, 21))
+    browser.sort_by("answer")
+    assert shown(browser)[0] == "question 019"
+    # Answers sort as text: "answer 9" comes last.
+    browser.sort_by("answer")
+    assert shown(browser)[0] == "question 011"
+    browser.set_filter("nothing matches")
+    assert browser.tree.get_children() == ()
+
+
+
+def test_card_browser_blanks_rows_of_cards_deleted_before_a_refresh(root):
+    cards = make_cards(10)
+    browser = CardBrowser(root, height=5)
+    browser.set_cards(cards)
+    cards.remove(2)
+    browser.scroll(1)
+    browser.scroll(-1)
+    assert shown(browser) == ["question 000", "", "question 002", "question 003", "question 004"]
+
+def test_card_browser_keeps_the_selection_in_view(root):
+    opened = []
+    browser = CardBrowser(root, height=5, on_open=opened.append)
+    browser.set_cards(make_cards(50))
+    browser.move_selection(1)
+    assert browser.selected_id == 1
+    browser.move_selection(7)
+    assert browser.selected_id == 8
+    assert browser.top == 3
+    browser._on_open()
+    assert opened == [8]
+
+
+def test_card_browser_asks_for_thumbnails_of_visible_rows(root):
+    requested = []
+    browser = CardBrowser(root, height=3, thumbnail=lambda ref, done: requested.append(ref))
+    browser.set_cards(CourseCards(
+        Card(f"q{i}", "", question_imgs=[f"img{i}.png"], id=i + 1) for i in range(10)
+    ))
+    assert requested == ["img0.png", "img1.png", "img2.png"]